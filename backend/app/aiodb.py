@@ -0,0 +1,96 @@
+import asyncio, contextvars, functools, os, sqlite3, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Sequence, TypeVar
+from . import db, metrics
+
+# Database access for async code (async routes, collectors, background loops).
+#
+# A blocking sqlite3 call made on the event loop stalls every request the
+# worker is serving. Here all of them run on a small dedicated pool instead of
+# the shared anyio threadpool:
+#
+#   rows = await aiodb.fetchall("SELECT ... WHERE id=?", (x,))
+#   n = await aiodb.run(store_inventory, devices, edges)   # store_inventory(con, ...)
+#
+# Each DB thread keeps one connection open for the life of the process, so
+# there is no connect() per call, and sqlite3's per-connection statement
+# cache (DB_STATEMENT_CACHE entries, keyed by SQL text) means repeated
+# queries are prepared once. Calls keep the caller's context, so per-request
+# SQL accounting (metrics, sql_profile) still sees them.
+#
+# run() commits when the function returns and rolls back when it raises;
+# nothing is left open on a pooled connection between calls.
+
+THREADS = int(os.getenv("DB_THREADS", "4"))
+STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+
+T = TypeVar("T")
+
+_pool = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix="db")
+_local = threading.local()
+
+def _connection() -> sqlite3.Connection:
+    con = getattr(_local, "con", None)
+    if con is None:
+        con = _local.con = db.connect(cached_statements=STATEMENT_CACHE)
+    return con
+
+def _call(fn: Callable[..., T], queued: float, args, kwargs) -> T:
+    metrics.observe("db_executor_wait_seconds", time.perf_counter() - queued, (), metrics.QUERY_BUCKETS)
+    con = _connection()
+    try:
+        out = fn(con, *args, **kwargs)
+        if con.in_transaction:
+            con.commit()
+        return out
+    except BaseException:
+        try:
+            con.rollback()
+        except sqlite3.Error:
+            _local.con = None       # unusable; the next call on this thread reconnects
+            con.close()
+        raise
+    finally:
+        con.row_factory = sqlite3.Row
+
+async def run(fn: Callable[..., T], *args, **kwargs) -> T:
+    """fn(con, *args, **kwargs) on a DB thread with that thread's connection."""
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, _call, fn, time.perf_counter(), args, kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_pool, call)
+
+def _fetchall(con, sql: str, params: Sequence) -> List[sqlite3.Row]:
+    return con.execute(sql, params).fetchall()
+
+def _fetchone(con, sql: str, params: Sequence) -> Optional[sqlite3.Row]:
+    return con.execute(sql, params).fetchone()
+
+def _execute(con, sql: str, params: Sequence) -> int:
+    return con.execute(sql, params).rowcount
+
+def _executemany(con, sql: str, seq: Iterable[Sequence]) -> int:
+    return con.executemany(sql, seq).rowcount
+
+async def fetchall(sql: str, params: Sequence = ()) -> List[sqlite3.Row]:
+    return await run(_fetchall, sql, params)
+
+async def fetchone(sql: str, params: Sequence = ()) -> Optional[sqlite3.Row]:
+    return await run(_fetchone, sql, params)
+
+async def execute(sql: str, params: Sequence = ()) -> int:
+    """One statement, committed; returns the rowcount."""
+    return await run(_execute, sql, params)
+
+async def executemany(sql: str, seq: Iterable[Sequence]) -> int:
+    return await run(_executemany, sql, list(seq))
+
+# ---------- event loop lag ----------
+LAG_INTERVAL_S = 0.5
+
+async def loop_lag_loop():
+    """Sample how late the event loop wakes a sleeping task (time it spent blocked elsewhere)."""
+    loop = asyncio.get_running_loop()
+    while True:
+        t = loop.time()
+        await asyncio.sleep(LAG_INTERVAL_S)
+        metrics.observe("event_loop_lag_seconds", max(0.0, loop.time() - t - LAG_INTERVAL_S), (), metrics.QUERY_BUCKETS)
@@ -5,6 +5,7 @@ from pydantic import BaseModel, EmailStr
 from passlib.context import CryptContext
 from jose import jwt, JWTError
 from .db import connect, has_any_user
+from .metrics import timer
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 pwd = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -29,6 +30,14 @@ class ResetIn(BaseModel):
     new_password: str
     token: str
 
+def hash_password(password: str) -> str:
+    with timer("bcrypt_duration_seconds", (("op", "hash"),)):
+        return pwd.hash(password)
+
+def verify_password(password: str, password_hash: str) -> bool:
+    with timer("bcrypt_duration_seconds", (("op", "verify"),)):
+        return pwd.verify(password, password_hash)
+
 def _issue_jwt(email: str, role: str):
     now = int(time.time())
     return jwt.encode(
@@ -72,7 +81,7 @@ def first_run_create(body: FirstRunCreate, response: Response):
     if len(body.password) < 8:
         raise HTTPException(400, "Password must be at least 8 characters")
     con = connect()
-    ph = pwd.hash(body.password)
+    ph = hash_password(body.password)
     con.execute("INSERT INTO users(email,role,password_hash) VALUES (?,?,?)",
                 (body.email.lower(), "owner", ph))
     con.commit()
@@ -84,7 +93,7 @@ def first_run_create(body: FirstRunCreate, response: Response):
 def login(body: LoginIn, response: Response):
     con = connect()
     u = con.execute("SELECT email,role,password_hash,enabled FROM users WHERE email=?", (body.email.lower(),)).fetchone()
-    if (not u) or (u.get('enabled') is not None and int(u['enabled']) == 0) or (not pwd.verify(body.password, u['password_hash'])):
+    if (not u) or (u['enabled'] is not None and int(u['enabled']) == 0) or (not verify_password(body.password, u['password_hash'])):
         raise HTTPException(401, "Invalid credentials")
     token = _issue_jwt(u["email"], u["role"])
     _set_cookie(response, token)
@@ -107,7 +116,7 @@ def reset_password(body: ResetIn):
     if len(body.new_password) < 8:
         raise HTTPException(400, "Password must be at least 8 characters")
     con = connect()
-    ph = pwd.hash(body.new_password)
+    ph = hash_password(body.new_password)
     # update if exists; otherwise create as owner (so you can recover access)
     u = con.execute("SELECT id FROM users WHERE email=?", (body.email.lower(),)).fetchone()
     if u:
@@ -0,0 +1,235 @@
+"""
+Auvik API client for the "auvik" collector (app/collectors.py).
+
+Auvik's API is JSON:API with cursor pagination ("links.next"), so a single
+listing can only be walked page by page. Throughput comes from:
+
+- one pooled aiohttp session per run (keep-alive, AUVIK_CONCURRENCY
+  connections shared by every request);
+- running the listings (devices, interfaces) for every tenant concurrently;
+- prefetching: a listing requests its next page before the caller processes
+  the current one.
+
+Decoding pages and folding them into the Inventory is CPU work and runs in
+the default executor, so a large sync does not stall the event loop.
+
+Rate limiting: 429/503 answers are retried after Retry-After (or with
+exponential backoff), and X-RateLimit-Remaining: 0 pauses every request of
+the client until X-RateLimit-Reset.
+
+    python -m app.auvik https://auvikapi.us1.my.auvik.com user@example.com APIKEY [--tenants id,id]
+"""
+import asyncio, json, os, time
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from urllib.parse import urljoin
+from .db import normalize_mac
+from .fastjson import orjson
+from . import metrics
+
+PAGE_SIZE = int(os.getenv("AUVIK_PAGE_SIZE", "1000"))
+CONCURRENCY = int(os.getenv("AUVIK_CONCURRENCY", "8"))
+REQUEST_TIMEOUT_S = int(os.getenv("AUVIK_REQUEST_TIMEOUT_S", "60"))
+MAX_RETRIES = 6
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+class AuvikError(Exception):
+    def __init__(self, status: int, detail: str):
+        super().__init__(f"Auvik API {status}: {detail}")
+        self.status = status
+
+class AuvikClient:
+    def __init__(self, base_url: str, username: str, api_key: str,
+                 page_size: int = PAGE_SIZE, concurrency: int = CONCURRENCY):
+        base = base_url.rstrip("/")
+        self.base = base if base.endswith("/v1") else base + "/v1"
+        self.username = username
+        self.api_key = api_key
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.session = None     # aiohttp.ClientSession, created on enter
+        self.resume_at = 0.0    # loop time before which no request is sent (rate limit)
+        self.requests = 0
+
+    async def __aenter__(self):
+        import aiohttp
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency, ttl_dns_cache=300),
+            auth=aiohttp.BasicAuth(self.username, self.api_key),
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_S),
+            headers={"Accept": "application/vnd.api+json"},
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _rate_limit(self, headers) -> Optional[float]:
+        """Seconds to wait before the next request, from the response headers."""
+        loop = asyncio.get_running_loop()
+        wait = None
+        ra = headers.get("Retry-After")
+        if ra:
+            try:
+                wait = float(ra)
+            except ValueError:
+                try:
+                    wait = parsedate_to_datetime(ra).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    wait = None
+        if wait is None and headers.get("X-RateLimit-Remaining") == "0":
+            try:
+                reset = float(headers.get("X-RateLimit-Reset", ""))
+                wait = reset - time.time() if reset > 1e9 else reset      # epoch seconds or delta
+            except ValueError:
+                wait = 1.0
+        if wait is not None:
+            wait = min(max(wait, 0.0), 300.0)
+            self.resume_at = max(self.resume_at, loop.time() + wait)
+        return wait
+
+    async def get(self, url: str, params: Optional[Dict] = None, op: str = "get") -> bytes:
+        import aiohttp
+        loop = asyncio.get_running_loop()
+        for attempt in range(MAX_RETRIES):
+            delay = self.resume_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                with metrics.timer("auvik_request_duration_seconds", (("op", op),)):
+                    async with self.session.get(url, params=params) as resp:
+                        self.requests += 1
+                        wait = self._rate_limit(resp.headers)
+                        if resp.status == 200:
+                            return await resp.read()
+                        if resp.status in (429, 502, 503, 504):
+                            metrics.inc("auvik_retries_total", (("status", str(resp.status)),))
+                            if wait is None:
+                                self.resume_at = max(self.resume_at, loop.time() + min(2 ** attempt, 60))
+                            continue
+                        raise AuvikError(resp.status, (await resp.text())[:200] or resp.reason or "")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == MAX_RETRIES - 1:
+                    raise
+                metrics.inc("auvik_retries_total", (("status", "connection"),))
+                await asyncio.sleep(min(2 ** attempt, 60))
+        raise AuvikError(429, f"still rate limited after {MAX_RETRIES} attempts")
+
+    async def pages(self, path: str, params: Optional[Dict] = None, op: str = "get") -> AsyncIterator[List[Dict]]:
+        """The `data` array of every page of a listing. The next page is fetched while the caller works."""
+        q = {**(params or {}), "page[first]": str(self.page_size)}
+        loop = asyncio.get_running_loop()
+        nxt = asyncio.ensure_future(self.get(self.base + path, q, op))
+        try:
+            while nxt is not None:
+                doc = await loop.run_in_executor(None, _loads, await nxt)
+                data = doc.get("data") or []
+                link = (doc.get("links") or {}).get("next")
+                nxt = asyncio.ensure_future(self.get(urljoin(self.base + "/", link), None, op)) if link and data else None
+                yield data
+        finally:
+            if nxt is not None:
+                nxt.cancel()
+
+    async def tenants(self) -> List[str]:
+        doc = _loads(await self.get(self.base + "/tenants", None, "tenants"))
+        return [t["id"] for t in doc.get("data") or [] if t.get("id")]
+
+# ---------- inventory ----------
+# (name, mac, first ip, vendor)
+AuvikDevice = Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]
+
+class Inventory:
+    """What a sync keeps from the listings: just enough for devices and links."""
+    def __init__(self):
+        self.devices: Dict[str, AuvikDevice] = {}              # auvik device id -> fields
+        self.iface_parent: Dict[str, str] = {}                 # interface id -> device id
+        self.iface_macs: Dict[str, str] = {}                   # device id -> lowest interface MAC
+        self.connections: List[Tuple[str, str]] = []           # (device id, connected interface/device id)
+
+    def add_devices(self, rows: List[Dict]):
+        for r in rows:
+            a = r.get("attributes") or {}
+            ips = a.get("ipAddresses") or []
+            self.devices[r["id"]] = (a.get("deviceName"), normalize_mac(a.get("macAddress") or ""),
+                                     ips[0] if ips else None, a.get("vendorName"))
+
+    def add_interfaces(self, rows: List[Dict]):
+        for r in rows:
+            a = r.get("attributes") or {}
+            parent = ((((r.get("relationships") or {}).get("parentDevice") or {}).get("data")) or {}).get("id")
+            if not parent:
+                continue
+            self.iface_parent[r["id"]] = parent
+            mac = normalize_mac(a.get("macAddress") or "")
+            if mac and (parent not in self.iface_macs or mac < self.iface_macs[parent]):
+                self.iface_macs[parent] = mac
+            for other in a.get("connectedTo") or ():
+                self.connections.append((parent, other))
+
+    def mac(self, device_id: str) -> Optional[str]:
+        d = self.devices.get(device_id)
+        if d is None:
+            return None
+        return d[1] or self.iface_macs.get(device_id)
+
+    def device_rows(self, now: int) -> List[Tuple]:
+        """DeviceTuple rows for devices_api.upsert_devices; devices without any MAC are skipped."""
+        out = []
+        for did, (name, _, ip, vendor) in self.devices.items():
+            mac = self.mac(did)
+            if mac:
+                out.append((name, mac, ip, vendor, None, now))
+        return out
+
+    def edges(self) -> Set[Tuple[str, str]]:
+        out = set()
+        for parent, other in self.connections:
+            target = self.iface_parent.get(other, other)      # connectedTo holds interface or device ids
+            a, b = self.mac(parent), self.mac(target)
+            if a and b and a != b:
+                out.add((a, b) if a < b else (b, a))
+        return out
+
+async def fetch_inventory(client: AuvikClient, tenants: Optional[List[str]] = None) -> Inventory:
+    """Devices and interfaces of every tenant (all the user can see when none are given), concurrently."""
+    inv = Inventory()
+    if not tenants:
+        tenants = await client.tenants()
+
+    async def listing(path: str, op: str, tenant: str, add):
+        loop = asyncio.get_running_loop()
+        async for rows in client.pages(path, {"tenants": tenant}, op):
+            await loop.run_in_executor(None, add, rows)
+
+    jobs = []
+    for t in tenants:
+        jobs.append(listing("/inventory/device/info", "devices", t, inv.add_devices))
+        jobs.append(listing("/inventory/interface/info", "interfaces", t, inv.add_interfaces))
+    await asyncio.gather(*jobs)
+    return inv
+
+def _main(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(prog="python -m app.auvik", description="fetch an Auvik inventory and print counts")
+    ap.add_argument("url")
+    ap.add_argument("username")
+    ap.add_argument("api_key")
+    ap.add_argument("--tenants", default="")
+    args = ap.parse_args(argv)
+
+    async def run():
+        t = time.perf_counter()
+        async with AuvikClient(args.url, args.username, args.api_key) as c:
+            inv = await fetch_inventory(c, [x for x in args.tenants.split(",") if x])
+        print(f"[auvik] {len(inv.devices)} devices ({len(inv.device_rows(0))} with a MAC), "
+              f"{len(inv.iface_parent)} interfaces, {len(inv.edges())} links; "
+              f"{c.requests} requests in {time.perf_counter() - t:.1f}s")
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    _main()
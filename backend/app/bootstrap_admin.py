@@ -1,11 +1,12 @@
-import sqlite3, time
+import os, sqlite3, time
 from passlib.context import CryptContext
+from .metrics import timer
 
 # Hardcoded fallback credentials (recovery)
 DEFAULT_EMAIL = "admin@example.com"
 DEFAULT_PASS  = "ChangeMeNow1!"
 DEFAULT_ROLE  = "owner"
-DB_PATH = "/data/netfusion.db"   # SQLite path inside the backend container
+DB_PATH = os.path.join(os.getenv("EXPORT_DIR", "/data"), "netfusion.db")   # same file as db.DB_PATH
 
 pwd = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -37,7 +38,8 @@ def ensure_admin():
 
     now = int(time.time())
     if row is None:
-        ph = pwd.hash(DEFAULT_PASS)
+        with timer("bcrypt_duration_seconds", (("op", "hash"),)):
+            ph = pwd.hash(DEFAULT_PASS)
         # include created_ts explicitly (covers both old/new schemas)
         con.execute(
             "INSERT INTO users(email, role, password_hash, created_ts) VALUES (?, ?, ?, ?)",
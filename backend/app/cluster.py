@@ -0,0 +1,187 @@
+import asyncio, fcntl, json, os, socket, time, traceback
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from .db import EXPORT_DIR
+
+# Multi-worker support (uvicorn --workers N, or WEB_CONCURRENCY=N which
+# uvicorn reads as its default).
+#
+# - file_lock(): blocking flock under RUN_DIR, used to serialise startup
+#   migrations and the default-admin bootstrap across workers.
+# - lead(): every worker competes for a non-blocking flock; the holder runs the
+#   periodic jobs (collectors, monitor, link aging). The kernel drops the lock
+#   when a process dies, and a waiting worker takes over within LEADER_RETRY_S.
+# - bus: fire-and-forget datagrams between the workers on this host (one unix
+#   socket per worker in RUN_DIR/bus), so in-process state such as SSE
+#   subscriptions and the leader's scheduler can be reached from any worker.
+#   It always runs: a single worker simply finds no peers, and nothing here
+#   needs to know how many workers uvicorn was started with.
+
+RUN_DIR = os.path.join(EXPORT_DIR, "run")
+LEADER_RETRY_S = 5
+JOB_RESTART_S = (1, 300)   # backoff bounds for a leader job that crashed
+PEERS_TTL_S = 2.0
+
+def _lock_path(name: str) -> str:
+    os.makedirs(RUN_DIR, exist_ok=True)
+    return os.path.join(RUN_DIR, f"{name}.lock")
+
+@contextmanager
+def file_lock(name: str):
+    fd = os.open(_lock_path(name), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)        # closing releases the lock
+
+def try_lock(path: str) -> Optional[int]:
+    """Non-blocking exclusive lock on path; returns the fd to pass to release(), or None if held elsewhere."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return fd
+    except BlockingIOError:
+        os.close(fd)
+        return None
+
+def release(fd: int):
+    os.close(fd)
+
+# ---------- leader ----------
+class _Leader:
+    def __init__(self):
+        self.fd: Optional[int] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.fd is not None
+
+    def try_acquire(self) -> bool:
+        if self.fd is None:
+            self.fd = try_lock(_lock_path("leader"))
+        return self.fd is not None
+
+    def release(self):
+        if self.fd is not None:
+            release(self.fd)
+            self.fd = None
+
+leader = _Leader()
+
+async def _supervise(job: Callable):
+    """Run job(), restarting it with exponential backoff if it raises."""
+    delay = JOB_RESTART_S[0]
+    while True:
+        started = time.monotonic()
+        try:
+            await job()
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            print(f"[cluster] job {job.__name__} crashed:")
+            traceback.print_exc()
+        if time.monotonic() - started > JOB_RESTART_S[1]:
+            delay = JOB_RESTART_S[0]        # it ran fine for a while; start the backoff over
+        print(f"[cluster] restarting {job.__name__} in {delay}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, JOB_RESTART_S[1])
+
+async def lead(jobs: List[Callable]):
+    """Wait for the leader lock, then run the given job coroutines (supervised) until cancelled."""
+    while not leader.try_acquire():
+        await asyncio.sleep(LEADER_RETRY_S)
+    print(f"[cluster] worker {os.getpid()} is the leader")
+    tasks = [asyncio.create_task(_supervise(job)) for job in jobs]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+        leader.release()
+
+# ---------- cross-worker bus ----------
+class Bus:
+    def __init__(self):
+        self.sock: Optional[socket.socket] = None
+        self.path: Optional[str] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.handlers: Dict[str, Callable[[Dict], None]] = {}
+        self._peers: List[str] = []
+        self._peers_ts = 0.0
+
+    def on(self, kind: str, fn: Callable[[Dict], None]):
+        self.handlers[kind] = fn
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        d = os.path.join(RUN_DIR, "bus")
+        os.makedirs(d, exist_ok=True)
+        self.path = os.path.join(d, f"{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        s.bind(self.path)
+        s.setblocking(False)
+        self.sock, self.loop = s, loop
+        loop.add_reader(s.fileno(), self._recv)
+
+    def stop(self):
+        if self.sock is None:
+            return
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+        self.sock = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _peer_paths(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_ts > PEERS_TTL_S:
+            d = os.path.dirname(self.path)
+            self._peers = [os.path.join(d, f) for f in os.listdir(d)
+                           if f.endswith(".sock") and os.path.join(d, f) != self.path]
+            self._peers_ts = now
+        return self._peers
+
+    def send(self, kind: str, **payload) -> int:
+        """Deliver to every other worker (best effort, any thread); returns how many peers it went to."""
+        s = self.sock
+        if s is None:
+            return 0
+        peers = self._peer_paths()
+        if not peers:
+            return 0
+        data = json.dumps({"k": kind, **payload}, separators=(",", ":")).encode()
+        sent = 0
+        for p in peers:
+            try:
+                s.sendto(data, p)
+                sent += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                try:
+                    os.unlink(p)        # worker gone without cleaning up
+                except FileNotFoundError:
+                    pass
+                self._peers_ts = 0.0
+            except (BlockingIOError, OSError):
+                pass                    # peer's buffer is full: drop, these are hints
+        return sent
+
+    def _recv(self):
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except (BlockingIOError, OSError):
+                return
+            try:
+                msg = json.loads(data)
+                fn = self.handlers.get(msg.get("k"))
+                if fn:
+                    fn(msg)
+            except Exception as e:
+                print("[cluster] bad bus message:", e)
+
+bus = Bus()
@@ -0,0 +1,334 @@
+import asyncio, json, os, random, time
+from typing import Awaitable, Callable, Dict, Optional, Set
+from fastapi.concurrency import run_in_threadpool
+from .db import normalize_mac
+from . import aiodb, cluster, metrics
+from .events import publish, site_topics
+
+# Collector scheduler: runs every enabled row of `endpoints` whose kind has a
+# collector on its own interval (poll_interval_s, default COLLECT_INTERVAL_S)
+# with +/- jitter.
+# Failures back off exponentially up to COLLECT_MAX_BACKOFF_S, and at most
+# COLLECT_CONCURRENCY collectors run at once across all endpoints. First runs
+# after startup are spread over one interval so a restart does not fire
+# every endpoint together. Outcomes are written back to the endpoint row.
+#
+# A collector is `async def fn(endpoint_row) -> {"devices": n, ...}`,
+# registered per endpoint kind in COLLECTORS; kinds that need longer than
+# COLLECT_TIMEOUT_S register their own limit in TIMEOUTS. Database work goes
+# through app/aiodb.py so it never runs on the event loop.
+
+INTERVAL_S = int(os.getenv("COLLECT_INTERVAL_S", "300"))
+MIN_INTERVAL_S = 30
+MAX_BACKOFF_S = int(os.getenv("COLLECT_MAX_BACKOFF_S", "3600"))
+CONCURRENCY = int(os.getenv("COLLECT_CONCURRENCY", "2"))
+TIMEOUT_S = int(os.getenv("COLLECT_TIMEOUT_S", "120"))
+JITTER = 0.1
+RELOAD_S = 15            # pick up endpoint edits this often
+
+Collector = Callable[[Dict], Awaitable[Dict[str, int]]]
+COLLECTORS: Dict[str, Collector] = {}
+TIMEOUTS: Dict[str, int] = {}
+
+def collector(kind: str, timeout_s: Optional[int] = None):
+    def deco(fn: Collector) -> Collector:
+        COLLECTORS[kind] = fn
+        if timeout_s:
+            TIMEOUTS[kind] = timeout_s
+        return fn
+    return deco
+
+def _jitter(seconds: float) -> float:
+    return seconds * random.uniform(1 - JITTER, 1 + JITTER)
+
+def _interval(ep: Dict) -> int:
+    return max(MIN_INTERVAL_S, int(ep.get("poll_interval_s") or INTERVAL_S))
+
+# ---------- shared write path for collectors ----------
+def store_inventory(con, devices, edges) -> Dict[str, int]:
+    """
+    devices: DeviceTuple rows for devices_api.upsert_devices (normalized MACs).
+    edges: (mac, mac) pairs; both ends must be known devices to be stored.
+    One transaction; publishes a bulk change for the touched sites.
+    """
+    from .devices_api import upsert_devices
+    from .links_api import resolve_macs, upsert_links
+    n_dev = upsert_devices(con, devices)
+    ids = resolve_macs(con, {m for e in edges for m in e})
+    n_links = upsert_links(con, [(ids[a], ids[b]) for a, b in edges if a in ids and b in ids])
+    con.commit()
+    if n_dev:
+        publish(site_topics(*{d[4] for d in devices}), {"type": "devices.bulk"}, key="devices.bulk")
+    if n_links:
+        publish(["links"], {"type": "links.updated"}, key="links.updated")
+    return {"devices": n_dev, "links": n_links}
+
+# ---------- collectors ----------
+@collector("unifi")
+async def collect_unifi(ep: Dict) -> Dict[str, int]:
+    from .unifi_api import UniFiClient
+    client = UniFiClient(ep["address"], ep["username"] or "", ep["password"] or "", ep["site"] or "default")
+    try:
+        await client.login()
+        data = await client.get_devices()
+        clients = await client.get_clients()
+    finally:
+        await client.logout()
+    now = int(time.time())
+    devices, edges = [], []
+    for d in data.get("data", []):
+        mac = normalize_mac(d.get("mac") or "")
+        if mac is None:
+            continue
+        devices.append((d.get("name") or d.get("model"), mac, d.get("ip"), "Ubiquiti", None,
+                        int(d.get("last_seen") or now)))
+        up = normalize_mac((d.get("uplink") or {}).get("uplink_mac") or "")
+        if up:
+            edges.append((mac, up))
+    res = await aiodb.run(store_inventory, devices, edges)
+    # wired clients and the switch port they are on
+    ports: Dict[str, list] = {}
+    for c in clients.get("data", []):
+        mac = normalize_mac(c.get("mac") or "")
+        sw = normalize_mac(c.get("sw_mac") or "")
+        if mac and sw and c.get("is_wired", True) and c.get("sw_port"):
+            port = int(c["sw_port"])
+            ports.setdefault(sw, []).append((mac, port, f"Port {port}", int(c.get("vlan") or 0)))
+    if ports:
+        res.update(await aiodb.run(_store_unifi_ports, ports))
+    return res
+
+def _store_unifi_ports(con, ports: Dict[str, list]) -> Dict[str, int]:
+    from .links_api import resolve_macs
+    from .locator import store_locations
+    ids = resolve_macs(con, set(ports))
+    return store_locations(con, {ids[sw]: rows for sw, rows in ports.items() if sw in ids}, "unifi")
+
+# ---------- Auvik ----------
+AUVIK_TIMEOUT_S = int(os.getenv("AUVIK_TIMEOUT_S", "1800"))
+
+@collector("auvik", timeout_s=AUVIK_TIMEOUT_S)
+async def collect_auvik(ep: Dict) -> Dict[str, int]:
+    from .auvik import AuvikClient, fetch_inventory
+    tenants = [t.strip() for t in (ep.get("tenants") or "").split(",") if t.strip()]
+    async with AuvikClient(ep["address"], ep["username"] or "", ep["api_key"] or ep["password"] or "") as client:
+        inv = await fetch_inventory(client, tenants)
+    return await aiodb.run(_store_auvik, inv)
+
+def _store_auvik(con, inv) -> Dict[str, int]:
+    devices = inv.device_rows(int(time.time()))
+    res = store_inventory(con, devices, inv.edges())
+    res["skipped_no_mac"] = len(inv.devices) - len(devices)
+    return res
+
+# ---------- SNMP bridge forwarding tables ----------
+SYS_NAME = "1.3.6.1.2.1.1.5.0"
+BRIDGE_ADDRESS = "1.3.6.1.2.1.17.1.1.0"           # dot1dBaseBridgeAddress
+BASE_PORT_IFINDEX = "1.3.6.1.2.1.17.1.4.1.2"      # dot1dBasePortIfIndex: bridge port -> ifIndex
+IF_NAME = "1.3.6.1.2.1.31.1.1.1.1"                # ifName
+QBRIDGE_FDB_PORT = "1.3.6.1.2.1.17.7.1.2.2.1.2"   # dot1qTpFdbPort.<fdb id>.<mac>
+QBRIDGE_FDB_STATUS = "1.3.6.1.2.1.17.7.1.2.2.1.3"
+BRIDGE_FDB_PORT = "1.3.6.1.2.1.17.4.3.1.2"        # dot1dTpFdbPort.<mac>
+BRIDGE_FDB_STATUS = "1.3.6.1.2.1.17.4.3.1.3"
+FDB_LEARNED = 3
+
+def _snmp_credentials(ep: Dict):
+    from .snmp import Credentials
+    return Credentials(ep.get("snmp_version") or "2c", ep.get("snmp_community"), ep.get("snmp_user"),
+                       ep.get("snmp_auth_proto"), ep.get("snmp_auth_key"),
+                       ep.get("snmp_priv_proto"), ep.get("snmp_priv_key"))
+
+def _fdb(s, port_oid: str, status_oid: str, with_fdb_id: bool):
+    """(mac, bridge port, fdb id) for learned entries; the index is [fdb id.]mac."""
+    from .snmp import as_int
+    learned = {idx for idx, _, raw in s.walk(status_oid) if as_int(raw) == FDB_LEARNED}
+    out = []
+    for idx, _, raw in s.walk(port_oid):
+        if len(idx) != (7 if with_fdb_id else 6) or (learned and idx not in learned):
+            continue
+        mac = ":".join(f"{b:02x}" for b in idx[-6:])
+        out.append((mac, as_int(raw), idx[0] if with_fdb_id else 0))
+    return out
+
+def read_bridge(address: str, creds) -> Dict:
+    """Blocking SNMP walk of one switch: identity, port map and learned MACs."""
+    from .snmp import GET, Session, SnmpError, as_int
+    with Session(address, creds, timeout_s=2.0) as s:
+        ident = s.request(GET, [SYS_NAME, BRIDGE_ADDRESS])
+        name = bridge_mac = None
+        for oid, tag, raw in ident.varbinds:
+            if oid == SYS_NAME and tag == 0x04:
+                name = raw.decode("utf-8", "replace") or None
+            elif oid == BRIDGE_ADDRESS and tag == 0x04 and len(raw) == 6 and any(raw):
+                bridge_mac = ":".join(f"{b:02x}" for b in raw)
+        port_if = {idx[0]: as_int(raw) for idx, _, raw in s.walk(BASE_PORT_IFINDEX) if len(idx) == 1}
+        try:
+            names = {idx[0]: raw.decode("utf-8", "replace") for idx, tag, raw in s.walk(IF_NAME) if tag == 0x04}
+        except SnmpError:
+            names = {}
+        entries = _fdb(s, QBRIDGE_FDB_PORT, QBRIDGE_FDB_STATUS, True) or _fdb(s, BRIDGE_FDB_PORT, BRIDGE_FDB_STATUS, False)
+    sightings = []
+    for mac, port, vlan in entries:
+        ifx = port_if.get(port, port)        # bridge port numbers equal ifIndex on many small switches
+        if port:                             # port 0: the switch itself / unknown
+            sightings.append((mac, ifx, names.get(ifx), vlan))
+    return {"name": name, "mac": bridge_mac, "sightings": sightings}
+
+def _store_bridge(con, address: str, data: Dict) -> Dict[str, int]:
+    from .devices_api import upsert_devices
+    from .locator import store_locations
+    if data["mac"]:
+        upsert_devices(con, [(data["name"], data["mac"], address, None, None, int(time.time()))])
+        con.commit()
+        row = con.execute("SELECT id FROM devices WHERE mac=?", (data["mac"],)).fetchone()
+    else:
+        row = con.execute("SELECT id FROM devices WHERE mgmt_ip=? ORDER BY id LIMIT 1", (address,)).fetchone()
+    if row is None:
+        raise RuntimeError(f"{address} reports no bridge address and matches no device by mgmt_ip")
+    res = store_locations(con, {row[0]: data["sightings"]}, "snmp")
+    return {"devices": 1, **res}
+
+@collector("snmp")
+async def collect_snmp(ep: Dict) -> Dict[str, int]:
+    creds = _snmp_credentials(ep)
+    data = await run_in_threadpool(read_bridge, ep["address"], creds)
+    return await aiodb.run(_store_bridge, ep["address"], data)
+
+# ---------- scheduler ----------
+class Scheduler:
+    def __init__(self):
+        self.endpoints: Dict[str, Dict] = {}
+        self.due: Dict[str, float] = {}
+        self.running: Set[str] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.sem: Optional[asyncio.Semaphore] = None
+        self.wake: Optional[asyncio.Event] = None
+        self.reload_now = False
+
+    async def reload(self):
+        rows = [dict(r) for r in await aiodb.fetchall("SELECT * FROM endpoints WHERE enabled=1")]
+        now = time.time()
+        self.endpoints = {r["id"]: r for r in rows if r["kind"] in COLLECTORS}
+        for eid, ep in self.endpoints.items():
+            if eid not in self.due:
+                # resume a persisted schedule, otherwise start somewhere inside the first interval
+                nxt = ep.get("next_run_ts")
+                self.due[eid] = float(nxt) if nxt else now + random.uniform(0, _interval(ep))
+        for eid in list(self.due):
+            if eid not in self.endpoints:
+                del self.due[eid]
+
+    def trigger(self, endpoint_id: str):
+        """Run an endpoint as soon as a slot is free (callable from any thread)."""
+        if self.loop is None:
+            return False
+        self.loop.call_soon_threadsafe(self._trigger, endpoint_id)
+        return True
+
+    def _trigger(self, endpoint_id: str):
+        self.due[endpoint_id] = 0.0
+        self.reload_now = True          # the endpoint may be new or just edited
+        self.wake.set()
+
+    async def _record(self, eid: str, started: float, ms: int, items: Optional[Dict], error: Optional[str], nxt: float):
+        if error is None:
+            await aiodb.execute("""UPDATE endpoints SET last_run_ts=?, last_ok_ts=?, last_duration_ms=?, last_items=?,
+                                   last_error=NULL, failures=0, next_run_ts=? WHERE id=?""",
+                                (int(started), int(started), ms, json.dumps(items), int(nxt), eid))
+        else:
+            await aiodb.execute("""UPDATE endpoints SET last_run_ts=?, last_duration_ms=?, last_error=?,
+                                   failures=failures+1, next_run_ts=? WHERE id=?""",
+                                (int(started), ms, error[:500], int(nxt), eid))
+
+    async def _run(self, eid: str):
+        try:
+            async with self.sem:
+                ep = self.endpoints.get(eid)
+                if ep is None:
+                    return
+                started, t = time.time(), time.perf_counter()
+                items, error = None, None
+                limit = TIMEOUTS.get(ep["kind"], TIMEOUT_S)
+                try:
+                    items = await asyncio.wait_for(COLLECTORS[ep["kind"]](ep), limit)
+                except asyncio.CancelledError:
+                    raise
+                except asyncio.TimeoutError:
+                    error = f"timed out after {limit}s"
+                except Exception as e:
+                    error = str(getattr(e, "detail", None) or e) or type(e).__name__
+                elapsed = time.perf_counter() - t
+                metrics.observe("collector_run_seconds", elapsed, (("kind", ep["kind"]),))
+                metrics.inc("collector_runs_total", (("kind", ep["kind"]), ("result", "error" if error else "ok")))
+                if error is None:
+                    failures = 0
+                    nxt = time.time() + _jitter(_interval(ep))
+                else:
+                    failures = int(ep.get("failures") or 0) + 1
+                    nxt = time.time() + _jitter(min(MAX_BACKOFF_S, _interval(ep) * 2 ** (failures - 1)))
+                    print(f"[collectors] {ep['name']} ({ep['kind']}) failed: {error}")
+                ep["failures"] = failures
+                if self.due.get(eid) != 0.0:        # keep a "run now" that arrived mid-run
+                    self.due[eid] = nxt
+                await self._record(eid, started, int(elapsed * 1000), items, error, nxt)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("[collectors] bookkeeping failed:", e)
+        finally:
+            self.running.discard(eid)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.sem = asyncio.Semaphore(CONCURRENCY)
+        self.wake = asyncio.Event()
+        tasks: Set[asyncio.Task] = set()
+        next_reload = 0.0
+        try:
+            while True:
+                now = time.time()
+                if now >= next_reload or self.reload_now:
+                    self.reload_now = False
+                    try:
+                        await self.reload()
+                    except Exception as e:
+                        print("[collectors] reload failed:", e)
+                    next_reload = now + RELOAD_S
+                for eid, when in sorted(self.due.items(), key=lambda kv: kv[1]):
+                    if when > now:
+                        break
+                    ep = self.endpoints.get(eid)
+                    if ep is None or eid in self.running:
+                        continue
+                    # push the slot forward now; _run sets the real next time when it finishes
+                    self.due[eid] = now + _interval(ep)
+                    self.running.add(eid)
+                    task = asyncio.create_task(self._run(eid))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                self.wake.clear()
+                try:
+                    await asyncio.wait_for(self.wake.wait(), 1.0)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for t in tasks:
+                t.cancel()
+
+scheduler = Scheduler()
+
+def request_run(endpoint_id: str) -> bool:
+    """Queue an immediate run on whichever worker owns the scheduler."""
+    if scheduler.trigger(endpoint_id):
+        return True
+    return cluster.bus.send("collect.run", id=endpoint_id) > 0
+
+cluster.bus.on("collect.run", lambda msg: scheduler.trigger(msg["id"]))
+
+async def collector_loop():
+    try:
+        await scheduler.run()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print("[collectors] scheduler stopped:", e)
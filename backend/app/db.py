@@ -1,16 +1,19 @@
-import os, sqlite3, time, pathlib
+import hashlib, os, re, sqlite3, time, pathlib
 # --- add/ensure at top of db.py ---
 import sqlite3, time, os
+from .metrics import record_query
+from . import sql_profile
 DB_PATH = os.getenv("DB_PATH", "/data/netfusion.db")
-def site_ids_for_user(email: str, role: str):
+def site_ids_for_user(email: str, role: str, con=None):
     """
     Returns a tuple (is_admin, site_ids)
     - is_admin: True if role is owner/admin (no restriction)
     - site_ids: list of ints the user can access (only meaningful if is_admin is False)
+    - con: connection to use (e.g. an app/aiodb.py one); a new one by default
     """
     if role in ("owner", "admin"):
         return True, []
-    con = connect()
+    con = con or connect()
     rows = con.execute("""
         SELECT s.id
         FROM sites s
@@ -80,6 +83,66 @@ def migrate_core():
       UNIQUE(a_id, b_id)
     )
     """)
+    # links are stored canonically as a_id < b_id; fold any (b,a) rows from
+    # older writers into their (a,b) twin before swapping the rest in place
+    con.execute("""
+    UPDATE device_links SET last_seen_ts = max(last_seen_ts, (
+      SELECT r.last_seen_ts FROM device_links r
+      WHERE r.a_id = device_links.b_id AND r.b_id = device_links.a_id))
+    WHERE a_id < b_id AND EXISTS (
+      SELECT 1 FROM device_links r
+      WHERE r.a_id = device_links.b_id AND r.b_id = device_links.a_id)
+    """)
+    con.execute("""
+    DELETE FROM device_links WHERE a_id > b_id AND EXISTS (
+      SELECT 1 FROM device_links r
+      WHERE r.a_id = device_links.b_id AND r.b_id = device_links.a_id)
+    """)
+    con.execute("UPDATE device_links SET a_id = b_id, b_id = a_id WHERE a_id > b_id")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_device_links_seen ON device_links(last_seen_ts)")
+
+    # where devices sit on a map (image pixel coordinates), with an R*Tree
+    # over the points so viewport queries don't scan every placement
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS map_placements(
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      map_id TEXT NOT NULL,
+      device_id INTEGER NOT NULL,
+      x REAL NOT NULL,
+      y REAL NOT NULL,
+      floor INTEGER,
+      updated_ts INTEGER NOT NULL DEFAULT (strftime('%s','now')),
+      UNIQUE(map_id, device_id)
+    )
+    """)
+    # the map is the first dimension (maps.seq as a zero-width min_m..max_m
+    # range), so a viewport query only walks that map's part of the tree.
+    # R*Tree coordinates are float32; seq counts maps, far below 2^24.
+    if not _has_col(con, "map_placements_rtree", "min_m"):
+        con.execute("DROP TABLE IF EXISTS map_placements_rtree")
+        con.execute("CREATE VIRTUAL TABLE map_placements_rtree USING rtree(id, min_m, max_m, min_x, max_x, min_y, max_y)")
+    # rebuilt whenever the schema changes (cheap), so it always matches maps.seq
+    con.executescript("""
+    DROP TRIGGER IF EXISTS map_placements_ai;
+    DROP TRIGGER IF EXISTS map_placements_au;
+    DELETE FROM map_placements_rtree;
+    INSERT INTO map_placements_rtree
+    SELECT p.id, m.seq, m.seq, p.x, p.x, p.y, p.y FROM map_placements p JOIN maps m ON m.id = p.map_id;
+    """)
+    con.executescript("""
+    CREATE TRIGGER IF NOT EXISTS map_placements_ai AFTER INSERT ON map_placements BEGIN
+      INSERT INTO map_placements_rtree
+      SELECT new.id, m.seq, m.seq, new.x, new.x, new.y, new.y FROM maps m WHERE m.id = new.map_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS map_placements_au AFTER UPDATE OF map_id, x, y ON map_placements BEGIN
+      UPDATE map_placements_rtree SET min_x=new.x, max_x=new.x, min_y=new.y, max_y=new.y,
+        min_m=(SELECT seq FROM maps WHERE id=new.map_id), max_m=(SELECT seq FROM maps WHERE id=new.map_id)
+      WHERE id=new.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS map_placements_ad AFTER DELETE ON map_placements BEGIN
+      DELETE FROM map_placements_rtree WHERE id=old.id;
+    END;
+    """)
 
     # who can view which site
     con.execute("""
@@ -92,9 +155,189 @@ def migrate_core():
     )
     """)
 
+    # reachability (app/monitor.py): current state, plus one history row per transition
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS device_status(
+      device_id INTEGER PRIMARY KEY,
+      status TEXT NOT NULL,
+      since_ts INTEGER NOT NULL
+    )
+    """)
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS device_status_history(
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      device_id INTEGER NOT NULL,
+      ts INTEGER NOT NULL,
+      status TEXT NOT NULL,
+      prev_status TEXT
+    )
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_device_status_history_dev ON device_status_history(device_id, ts)")
+
+    # MAC -> switch edge port sightings (app/locator.py); mac as a 48-bit integer
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS mac_locations(
+      mac INTEGER NOT NULL,
+      device_id INTEGER NOT NULL,
+      if_index INTEGER NOT NULL,
+      vlan INTEGER NOT NULL DEFAULT 0,
+      port_name TEXT,
+      source TEXT NOT NULL,
+      last_seen_ts INTEGER NOT NULL,
+      PRIMARY KEY(mac, device_id, vlan)
+    ) WITHOUT ROWID
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_mac_locations_dev ON mac_locations(device_id, last_seen_ts)")
+
+    # topology history (app/snapshots_api.py): full checkpoints + zlib deltas
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS topology_snapshots(
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      ts INTEGER NOT NULL,
+      kind TEXT NOT NULL,
+      base_id INTEGER,
+      devices INTEGER NOT NULL,
+      links INTEGER NOT NULL,
+      changes INTEGER NOT NULL,
+      bytes INTEGER NOT NULL,
+      data BLOB NOT NULL
+    )
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_topology_snapshots_base ON topology_snapshots(base_id, id)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_topology_snapshots_ts ON topology_snapshots(ts)")
+
+    # push ingestion (app/ingest_api.py): applied batch ids per agent, and the metric samples agents send
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS ingest_batches(
+      endpoint_id TEXT NOT NULL,
+      batch_id TEXT NOT NULL,
+      received_ts INTEGER NOT NULL,
+      records INTEGER NOT NULL,
+      PRIMARY KEY(endpoint_id, batch_id)
+    ) WITHOUT ROWID
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_ingest_batches_ts ON ingest_batches(received_ts)")
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS device_metrics(
+      device_id INTEGER NOT NULL,
+      name TEXT NOT NULL,
+      ts INTEGER NOT NULL,
+      value REAL NOT NULL,
+      PRIMARY KEY(device_id, name, ts)
+    ) WITHOUT ROWID
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS idx_device_metrics_ts ON device_metrics(ts)")
+
+    # per-site counts for the overview (GET /api/sites/summary), kept current by
+    # triggers on devices and device_links. site_id 0 holds unassigned devices.
+    # A link counts once for each distinct site among its two ends.
+    con.execute("""
+    CREATE TABLE IF NOT EXISTS site_summary(
+      site_id INTEGER PRIMARY KEY,
+      devices INTEGER NOT NULL DEFAULT 0,
+      links INTEGER NOT NULL DEFAULT 0,
+      min_seen_ts INTEGER,
+      max_seen_ts INTEGER
+    )
+    """)
+    # min/max last_seen_ts per site are index seeks; b_id lookups for a device's links
+    con.execute("CREATE INDEX IF NOT EXISTS idx_devices_site_seen ON devices(site_id, last_seen_ts)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_device_links_b ON device_links(b_id)")
+    con.executescript(SITE_SUMMARY_TRIGGERS)
+    rebuild_site_summary(con)
+
     con.commit()
     con.close()
 
+# links of device d whose other end is not in site s (a missing other end counts as "elsewhere")
+_LINKS_LEAVING = """(SELECT count(*) FROM device_links l LEFT JOIN devices o ON o.id = l.a_id + l.b_id - {d}
+      WHERE (l.a_id = {d} OR l.b_id = {d})
+        AND CASE WHEN o.id IS NULL THEN -1 ELSE coalesce(o.site_id, 0) END != coalesce({s}, 0))"""
+
+def _seen_range(site: str) -> str:
+    return f"""UPDATE site_summary SET
+      min_seen_ts = (SELECT min(last_seen_ts) FROM devices WHERE site_id IS {site}),
+      max_seen_ts = (SELECT max(last_seen_ts) FROM devices WHERE site_id IS {site})
+    WHERE site_id = coalesce({site}, 0);"""
+
+# Rows are created with INSERT ... WHERE NOT EXISTS: inside a trigger, INSERT OR IGNORE
+# would take on the conflict handling of the outer statement (the devices upsert).
+SITE_SUMMARY_TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS site_summary_devices_ai AFTER INSERT ON devices BEGIN
+  INSERT INTO site_summary(site_id) SELECT coalesce(new.site_id, 0)
+  WHERE NOT EXISTS (SELECT 1 FROM site_summary WHERE site_id = coalesce(new.site_id, 0));
+  UPDATE site_summary SET devices = devices + 1,
+    min_seen_ts = CASE WHEN new.last_seen_ts < coalesce(min_seen_ts, new.last_seen_ts + 1) THEN new.last_seen_ts ELSE min_seen_ts END,
+    max_seen_ts = CASE WHEN new.last_seen_ts > coalesce(max_seen_ts, new.last_seen_ts - 1) THEN new.last_seen_ts ELSE max_seen_ts END
+  WHERE site_id = coalesce(new.site_id, 0);
+END;
+
+CREATE TRIGGER IF NOT EXISTS site_summary_devices_ad AFTER DELETE ON devices BEGIN
+  UPDATE site_summary SET devices = devices - 1, links = links - {_LINKS_LEAVING.format(d="old.id", s="old.site_id")}
+  WHERE site_id = coalesce(old.site_id, 0);
+  {_seen_range("old.site_id")}
+END;
+
+CREATE TRIGGER IF NOT EXISTS site_summary_devices_move AFTER UPDATE OF site_id ON devices
+WHEN old.site_id IS NOT new.site_id BEGIN
+  INSERT INTO site_summary(site_id) SELECT coalesce(new.site_id, 0)
+  WHERE NOT EXISTS (SELECT 1 FROM site_summary WHERE site_id = coalesce(new.site_id, 0));
+  UPDATE site_summary SET devices = devices - 1, links = links - {_LINKS_LEAVING.format(d="new.id", s="old.site_id")}
+  WHERE site_id = coalesce(old.site_id, 0);
+  {_seen_range("old.site_id")}
+  UPDATE site_summary SET devices = devices + 1, links = links + {_LINKS_LEAVING.format(d="new.id", s="new.site_id")},
+    min_seen_ts = CASE WHEN new.last_seen_ts < coalesce(min_seen_ts, new.last_seen_ts + 1) THEN new.last_seen_ts ELSE min_seen_ts END,
+    max_seen_ts = CASE WHEN new.last_seen_ts > coalesce(max_seen_ts, new.last_seen_ts - 1) THEN new.last_seen_ts ELSE max_seen_ts END
+  WHERE site_id = coalesce(new.site_id, 0);
+END;
+
+-- the collector hot path: last_seen_ts moves within a site. Only rescan when the device held the min or max.
+CREATE TRIGGER IF NOT EXISTS site_summary_devices_seen AFTER UPDATE OF last_seen_ts ON devices
+WHEN old.site_id IS new.site_id AND old.last_seen_ts IS NOT new.last_seen_ts BEGIN
+  UPDATE site_summary SET
+    min_seen_ts = CASE WHEN new.last_seen_ts <= coalesce(min_seen_ts, new.last_seen_ts) THEN new.last_seen_ts
+                       WHEN old.last_seen_ts IS min_seen_ts THEN (SELECT min(last_seen_ts) FROM devices WHERE site_id IS new.site_id)
+                       ELSE min_seen_ts END,
+    max_seen_ts = CASE WHEN new.last_seen_ts >= coalesce(max_seen_ts, new.last_seen_ts) THEN new.last_seen_ts
+                       WHEN old.last_seen_ts IS max_seen_ts THEN (SELECT max(last_seen_ts) FROM devices WHERE site_id IS new.site_id)
+                       ELSE max_seen_ts END
+  WHERE site_id = coalesce(new.site_id, 0);
+END;
+
+CREATE TRIGGER IF NOT EXISTS site_summary_links_ai AFTER INSERT ON device_links BEGIN
+  UPDATE site_summary SET links = links + 1
+  WHERE site_id IN (SELECT coalesce(site_id, 0) FROM devices WHERE id IN (new.a_id, new.b_id));
+END;
+
+CREATE TRIGGER IF NOT EXISTS site_summary_links_ad AFTER DELETE ON device_links BEGIN
+  UPDATE site_summary SET links = links - 1
+  WHERE site_id IN (SELECT coalesce(site_id, 0) FROM devices WHERE id IN (old.a_id, old.b_id));
+END;
+
+CREATE TRIGGER IF NOT EXISTS site_summary_links_au AFTER UPDATE OF a_id, b_id ON device_links BEGIN
+  UPDATE site_summary SET links = links - 1
+  WHERE site_id IN (SELECT coalesce(site_id, 0) FROM devices WHERE id IN (old.a_id, old.b_id));
+  UPDATE site_summary SET links = links + 1
+  WHERE site_id IN (SELECT coalesce(site_id, 0) FROM devices WHERE id IN (new.a_id, new.b_id));
+END;
+"""
+
+def rebuild_site_summary(con):
+    """Recompute site_summary from scratch (migrations, or POST /api/sites/summary/rebuild). Caller commits."""
+    con.execute("DELETE FROM site_summary")
+    con.execute("""
+    INSERT INTO site_summary(site_id, devices, min_seen_ts, max_seen_ts)
+    SELECT coalesce(site_id, 0), count(*), min(last_seen_ts), max(last_seen_ts) FROM devices GROUP BY 1
+    """)
+    links = con.execute("""
+    SELECT site, count(*) FROM (
+      SELECT l.id, coalesce(d.site_id, 0) AS site FROM device_links l JOIN devices d ON d.id = l.a_id
+      UNION
+      SELECT l.id, coalesce(d.site_id, 0) FROM device_links l JOIN devices d ON d.id = l.b_id
+    ) GROUP BY site
+    """).fetchall()
+    con.executemany("UPDATE site_summary SET links=? WHERE site_id=?", [(n, site) for site, n in links])
+
 EXPORT_DIR = os.getenv("EXPORT_DIR", "/data")
 DB_PATH = os.path.join(EXPORT_DIR, "netfusion.db")
 MAP_DIR = os.path.join(EXPORT_DIR, "maps")
@@ -139,17 +382,59 @@ CREATE TABLE IF NOT EXISTS endpoints (
 );
 """
 
-def connect():
+class TimedConnection(sqlite3.Connection):
+  """sqlite3.Connection that reports each execute* call to the metrics module."""
+  def execute(self, sql, params=()):
+    t = time.perf_counter()
+    try:
+      return super().execute(sql, params)
+    finally:
+      record_query(time.perf_counter() - t)
+
+  def executemany(self, sql, seq):
+    t = time.perf_counter()
+    try:
+      return super().executemany(sql, seq)
+    finally:
+      record_query(time.perf_counter() - t)
+
+  def executescript(self, script):
+    t = time.perf_counter()
+    try:
+      return super().executescript(script)
+    finally:
+      record_query(time.perf_counter() - t)
+
+def connect(cached_statements: int = 128):
   os.makedirs(EXPORT_DIR, exist_ok=True)
   os.makedirs(MAP_DIR, exist_ok=True)
-  conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+  factory = sql_profile.ProfilingConnection if sql_profile.ENABLED else TimedConnection
+  conn = sqlite3.connect(DB_PATH, check_same_thread=False, factory=factory, cached_statements=cached_statements)
+  sql_profile.note_connect()
   conn.row_factory = sqlite3.Row
-  for ddl in (DDL_USERS, DDL_MAPS, DDL_SETTINGS, DDL_ENDPOINTS):
-    conn.executescript(ddl)
-  conn.commit()
-  _migrate(conn)
   return conn
 
+# Bump whenever the DDL / _migrate / migrate_core below change; init_db() skips
+# all schema work while the database's user_version matches.
+SCHEMA_VERSION = 10
+
+def init_db():
+  """Create / migrate the schema. Runs once at startup (main.py, under a cross-worker lock)."""
+  conn = connect()
+  try:
+    if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+      return
+    for ddl in (DDL_USERS, DDL_MAPS, DDL_SETTINGS, DDL_ENDPOINTS):
+      conn.executescript(ddl)
+    conn.commit()
+    _migrate(conn)
+    migrate_core()
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+    print(f"[db] schema at version {SCHEMA_VERSION}")
+  finally:
+    conn.close()
+
 def _has_col(conn, table, col):
   rows = conn.execute(f"PRAGMA table_info({table})").fetchall()
   return any(r["name"] == col for r in rows)
@@ -163,6 +448,47 @@ def _migrate(conn):
     conn.execute("ALTER TABLE endpoints ADD COLUMN snmp_version TEXT")
   if not _has_col(conn, "endpoints", "snmp_community"):
     conn.execute("ALTER TABLE endpoints ADD COLUMN snmp_community TEXT")
+  if not _has_col(conn, "endpoints", "snmp_user"):     # SNMPv3 (USM)
+    conn.execute("ALTER TABLE endpoints ADD COLUMN snmp_user TEXT")
+    conn.execute("ALTER TABLE endpoints ADD COLUMN snmp_auth_proto TEXT")
+    conn.execute("ALTER TABLE endpoints ADD COLUMN snmp_auth_key TEXT")
+    conn.execute("ALTER TABLE endpoints ADD COLUMN snmp_priv_proto TEXT")
+    conn.execute("ALTER TABLE endpoints ADD COLUMN snmp_priv_key TEXT")
+  # collector scheduler bookkeeping (app/collectors.py)
+  if not _has_col(conn, "endpoints", "poll_interval_s"):
+    conn.execute("ALTER TABLE endpoints ADD COLUMN poll_interval_s INTEGER")
+    conn.execute("ALTER TABLE endpoints ADD COLUMN last_run_ts INTEGER")
+    conn.execute("ALTER TABLE endpoints ADD COLUMN last_ok_ts INTEGER")
+    conn.execute("ALTER TABLE endpoints ADD COLUMN last_duration_ms INTEGER")
+    conn.execute("ALTER TABLE endpoints ADD COLUMN last_items TEXT")       # JSON counts, e.g. {"devices": 40}
+    conn.execute("ALTER TABLE endpoints ADD COLUMN last_error TEXT")
+    conn.execute("ALTER TABLE endpoints ADD COLUMN failures INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE endpoints ADD COLUMN next_run_ts INTEGER")
+  if not _has_col(conn, "endpoints", "tenants"):       # Auvik tenant ids, comma-separated (empty: all)
+    conn.execute("ALTER TABLE endpoints ADD COLUMN tenants TEXT")
+  # users.enabled + users.created_ts
+  if not _has_col(conn, "users", "created_ts"):
+    conn.execute("ALTER TABLE users ADD COLUMN created_ts INTEGER NOT NULL DEFAULT (strftime('%s','now'))")
+  if not _has_col(conn, "users", "enabled"):
+    conn.execute("ALTER TABLE users ADD COLUMN enabled INTEGER NOT NULL DEFAULT 1")
+  # map image processing state (queued | processing | ready | failed)
+  if not _has_col(conn, "maps", "image_status"):
+    conn.execute("ALTER TABLE maps ADD COLUMN image_status TEXT")
+    conn.execute("ALTER TABLE maps ADD COLUMN image_w INTEGER")
+    conn.execute("ALTER TABLE maps ADD COLUMN image_h INTEGER")
+    conn.execute("ALTER TABLE maps ADD COLUMN image_error TEXT")
+  # stable integer per map (the R*Tree's map dimension); the implicit rowid may change on VACUUM
+  if not _has_col(conn, "maps", "seq"):
+    conn.execute("ALTER TABLE maps ADD COLUMN seq INTEGER")
+    conn.execute("UPDATE maps SET seq = rowid")
+  conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_maps_seq ON maps(seq)")
+  conn.execute("""CREATE TRIGGER IF NOT EXISTS maps_seq AFTER INSERT ON maps WHEN new.seq IS NULL BEGIN
+                    UPDATE maps SET seq = (SELECT coalesce(max(seq), 0) + 1 FROM maps) WHERE id = new.id;
+                  END""")
+  # agent tokens are kept as sha256 hex (ingest_api.token_hash); hash any still stored in clear
+  for r in conn.execute("SELECT id, api_key FROM endpoints WHERE kind='agent' AND api_key != ''").fetchall():
+    if not re.fullmatch(r"[0-9a-f]{64}", r["api_key"]):
+      conn.execute("UPDATE endpoints SET api_key=? WHERE id=?", (hashlib.sha256(r["api_key"].encode()).hexdigest(), r["id"]))
   conn.commit()
 
 def has_any_user() -> bool:
@@ -178,6 +504,15 @@ def map_image_path(map_id: str, ext: str|None=None) -> str:
     if os.path.exists(p): return p
   return ""
 
+_MAC_HEX = re.compile(r"[0-9a-f]{12}")
+
+def normalize_mac(mac: str) -> str|None:
+  """'AA-BB-CC-DD-EE-FF' / 'aabb.ccdd.eeff' / ... -> 'aa:bb:cc:dd:ee:ff' (None if not a MAC)."""
+  h = re.sub(r"[:\-.\s]", "", str(mac)).lower()
+  if not _MAC_HEX.fullmatch(h):
+    return None
+  return ":".join(h[i:i+2] for i in range(0, 12, 2))
+
 def get_setting(conn, key: str) -> str|None:
   r = conn.execute("SELECT v FROM settings WHERE k=?", (key,)).fetchone()
   return r["v"] if r else None
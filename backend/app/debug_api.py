@@ -0,0 +1,10 @@
+from fastapi import APIRouter, Depends
+from .auth import require_min_role
+from . import sql_profile
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+@router.get("/profile")
+def recent_profiles(limit: int = 50, only_flagged: bool = False, admin = Depends(require_min_role("admin"))):
+    return {"enabled": sql_profile.ENABLED, "repeat_threshold": sql_profile.REPEAT_THRESHOLD,
+            "profiles": sql_profile.recent(limit, only_flagged)}
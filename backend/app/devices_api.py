@@ -1,11 +1,22 @@
-from typing import Optional, List, Dict
-from fastapi import APIRouter, Depends, HTTPException, Query
+import csv, io, ipaddress, json
+from typing import Optional, List, Dict, Iterable, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from .auth import get_current_user, require_min_role
-from .db import connect, site_ids_for_user
+from .db import connect, site_ids_for_user, normalize_mac
+from .events import publish, site_topics
+from .fastjson import rows_response
+from . import oui
+from .oui import vendor_for
 
 router = APIRouter(prefix="/api/devices", tags=["devices"])
 
+COLUMNS = ("id", "name", "mac", "mgmt_ip", "vendor", "site_id", "last_seen_ts")
+IMPORT_BATCH = 1000      # rows per transaction
+EXPORT_BATCH = 1000      # rows per cursor fetch / response chunk
+MAX_ERRORS = 1000        # cap on the per-row error report
+
 class DeviceRow(BaseModel):
     id: int
     name: Optional[str] = None
@@ -15,21 +26,71 @@ class DeviceRow(BaseModel):
     site_id: Optional[int] = None
     last_seen_ts: Optional[int] = None
 
-def _row(r) -> Dict:
-    return {
-        "id": r["id"], "name": r["name"], "mac": r["mac"],
-        "mgmt_ip": r["mgmt_ip"], "vendor": r["vendor"],
-        "site_id": r["site_id"], "last_seen_ts": r["last_seen_ts"]
-    }
+def _acl_where(user, where: List[str], params: List) -> bool:
+    """Append the site restriction for non-admins; False if the user can see nothing."""
+    is_admin, allowed = site_ids_for_user(user["email"], user["role"])
+    if is_admin:
+        return True
+    if not allowed:
+        return False
+    where.append(f"site_id IN ({','.join(['?']*len(allowed))})")
+    params += allowed
+    return True
+
+# (name, mac, mgmt_ip, vendor, site_id, last_seen_ts); mac must already be normalized
+DeviceTuple = Tuple[Optional[str], str, Optional[str], Optional[str], Optional[int], Optional[int]]
+
+def upsert_devices(con, rows: Iterable[DeviceTuple]) -> int:
+    """
+    Batched upsert keyed by MAC. NULL fields never overwrite known values and
+    last_seen_ts only moves forward. A missing vendor is filled from the OUI
+    registry (app/oui.py), but only where none is stored yet. Caller commits.
+    """
+    rows = [r + (vendor_for(r[1]) if r[3] is None else None,) for r in rows]
+    con.executemany("""
+      INSERT INTO devices(name, mac, mgmt_ip, vendor, site_id, last_seen_ts) VALUES (?1,?2,?3,coalesce(?4,?7),?5,?6)
+      ON CONFLICT(mac) DO UPDATE SET
+        name=coalesce(excluded.name, name),
+        mgmt_ip=coalesce(excluded.mgmt_ip, mgmt_ip),
+        vendor=coalesce(?4, vendor, ?7),
+        site_id=coalesce(excluded.site_id, site_id),
+        last_seen_ts=coalesce(max(last_seen_ts, excluded.last_seen_ts), last_seen_ts, excluded.last_seen_ts)
+    """, rows)
+    return len(rows)
+
+def backfill_vendors(con, batch: int = 5000) -> Tuple[int, int, set]:
+    """
+    Fill vendor from the OUI registry for devices that have none, paging by id.
+    Returns (checked, filled, site ids touched). Caller commits.
+    """
+    checked = filled = 0
+    sites = set()
+    last_id = 0
+    while True:
+        page = con.execute("SELECT id, mac, site_id FROM devices WHERE vendor IS NULL AND id > ? ORDER BY id LIMIT ?",
+                           (last_id, batch)).fetchall()
+        if not page:
+            break
+        last_id = page[-1][0]
+        checked += len(page)
+        found = []
+        for dev_id, mac, site_id in page:
+            v = vendor_for(mac)
+            if v:
+                found.append((v, dev_id))
+                sites.add(site_id)
+        con.executemany("UPDATE devices SET vendor=? WHERE id=? AND vendor IS NULL", found)
+        filled += len(found)
+    return checked, filled, sites
 
 @router.get("")
 def list_devices(
     q: Optional[str] = Query(default=None, description="Optional substring filter on name/mac/ip"),
+    shape: str = Query(default="objects", pattern="^(objects|columns)$",
+                       description="'columns' returns {columns, devices: [[...], ...]} (smaller, faster)"),
     user = Depends(get_current_user)
 ):
     con = connect()
-    is_admin, allowed = site_ids_for_user(user["email"], user["role"])
-
     where = []
     params: List = []
     if q:
@@ -37,19 +98,18 @@ def list_devices(
         like = f"%{q}%"
         params += [like, like, like]
 
-    if not is_admin:
-        if not allowed:
-            return {"devices": []}
-        where.append(f"site_id IN ({','.join(['?']*len(allowed))})")
-        params += allowed
+    if not _acl_where(user, where, params):
+        return {"devices": []}
 
-    sql = "SELECT id,name,mac,mgmt_ip,vendor,site_id,last_seen_ts FROM devices"
+    # reachability comes from the monitor's device_status table (app/monitor.py)
+    sql = """SELECT id,name,mac,mgmt_ip,vendor,site_id,last_seen_ts,
+                    coalesce(st.status, 'unknown') AS status, st.since_ts AS status_since
+             FROM devices LEFT JOIN device_status st ON st.device_id = devices.id"""
     if where:
         sql += " WHERE " + " AND ".join(where)
     sql += " ORDER BY name NULLS LAST, id"
 
-    rows = con.execute(sql, params).fetchall()
-    return {"devices": [_row(r) for r in rows]}
+    return rows_response(con.execute(sql, params), "devices", shape)
 
 class DeviceUpdate(BaseModel):
     name: Optional[str] = None
@@ -89,4 +149,199 @@ def update_device(device_id: int, body: DeviceUpdate, user = Depends(get_current
     vals.append(device_id)
     con.execute(f"UPDATE devices SET {', '.join(sets)} WHERE id=?", vals)
     con.commit()
+    publish(site_topics(r["site_id"], body.site_id if body.site_id is not None else r["site_id"]),
+            {"type": "device.updated", "id": device_id}, key=("device", device_id))
     return {"ok": True, "updated": 1}
+
+@router.get("/{device_id}/status-history")
+def device_status_history(device_id: int, limit: int = Query(default=100, ge=1, le=1000),
+                          user = Depends(get_current_user)):
+    con = connect()
+    where, params = ["id=?"], [device_id]
+    if not _acl_where(user, where, params) or \
+       not con.execute(f"SELECT 1 FROM devices WHERE {' AND '.join(where)}", params).fetchone():
+        raise HTTPException(404, "Device not found")
+    rows = con.execute("""
+      SELECT ts, status, prev_status FROM device_status_history
+      WHERE device_id=? ORDER BY ts DESC, id DESC LIMIT ?
+    """, (device_id, limit)).fetchall()
+    return {"device_id": device_id, "transitions": [dict(r) for r in rows]}
+
+@router.get("/{device_id}/metrics")
+def device_metrics(device_id: int, name: Optional[str] = None,
+                   since: Optional[int] = None, until: Optional[int] = None,
+                   limit: int = Query(default=1000, ge=1, le=100000),
+                   user = Depends(get_current_user)):
+    """Samples pushed by remote agents (app/ingest_api.py), newest first."""
+    con = connect()
+    where, params = ["id=?"], [device_id]
+    if not _acl_where(user, where, params) or \
+       not con.execute(f"SELECT 1 FROM devices WHERE {' AND '.join(where)}", params).fetchone():
+        raise HTTPException(404, "Device not found")
+    cur = con.execute("""
+      SELECT name, ts, value FROM device_metrics
+      WHERE device_id=?1 AND (?2 IS NULL OR name=?2) AND ts >= coalesce(?3, 0) AND ts <= coalesce(?4, 9223372036854775807)
+      ORDER BY ts DESC LIMIT ?5
+    """, (device_id, name, since, until, limit))
+    return rows_response(cur, "samples", extra={"device_id": device_id})
+
+# ---------- bulk import / export ----------
+def _fmt(fmt: Optional[str], filename: Optional[str]) -> str:
+    fmt = (fmt or "").lower()
+    if not fmt and filename:
+        fmt = "ndjson" if filename.lower().endswith((".ndjson", ".jsonl")) else "csv"
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(400, "format must be csv or ndjson")
+    return fmt
+
+def _iter_records(fmt: str, text: io.TextIOBase):
+    """Yield (line_no, dict|None, error|None) without loading the whole file."""
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for rec in reader:
+            yield reader.line_num, rec, None
+        return
+    for n, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            rec = json.loads(line)
+        except ValueError:
+            yield n, None, "invalid JSON"
+            continue
+        if not isinstance(rec, dict):
+            yield n, None, "expected a JSON object"
+            continue
+        yield n, rec, None
+
+def _blank(v):
+    return v is None or (isinstance(v, str) and not v.strip())
+
+def _validate(rec: Dict, site_ids: set) -> DeviceTuple:
+    mac = normalize_mac(rec.get("mac") or "")
+    if not mac:
+        raise ValueError("missing or invalid mac")
+    ip = rec.get("mgmt_ip")
+    if _blank(ip):
+        ip = None
+    else:
+        ip = str(ipaddress.ip_address(str(ip).strip()))
+    site_id = rec.get("site_id")
+    if _blank(site_id):
+        site_id = None
+    else:
+        site_id = int(site_id)
+        if site_id not in site_ids:
+            raise ValueError(f"unknown site_id {site_id}")
+    ts = rec.get("last_seen_ts")
+    ts = None if _blank(ts) else int(ts)
+    name = None if _blank(rec.get("name")) else str(rec["name"]).strip()
+    vendor = None if _blank(rec.get("vendor")) else str(rec["vendor"]).strip()
+    return (name, mac, ip, vendor, site_id, ts)
+
+def _publish_bulk(batch: List[DeviceTuple]):
+    # one coalescable event per touched site; rows without a site may be new unassigned devices
+    publish(site_topics(*{row[4] for row in batch}), {"type": "devices.bulk"}, key="devices.bulk")
+
+@router.post("/import")
+def import_devices(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(default=None, description="csv | ndjson (default: from file name)"),
+    admin = Depends(require_min_role("admin"))
+):
+    fmt = _fmt(format, file.filename)
+    con = connect()
+    site_ids = {int(r[0]) for r in con.execute("SELECT id FROM sites")}
+    text = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+
+    batch: List[DeviceTuple] = []
+    errors: List[Dict] = []
+    ok = failed = 0
+    try:
+        for line_no, rec, err in _iter_records(fmt, text):
+            if err is None:
+                try:
+                    batch.append(_validate(rec, site_ids))
+                except (ValueError, TypeError) as e:
+                    err = str(e)
+            if err is not None:
+                failed += 1
+                if len(errors) < MAX_ERRORS:
+                    errors.append({"line": line_no, "error": err})
+                continue
+            if len(batch) >= IMPORT_BATCH:
+                ok += upsert_devices(con, batch)
+                con.commit()
+                _publish_bulk(batch)
+                batch.clear()
+        if batch:
+            ok += upsert_devices(con, batch)
+            con.commit()
+            _publish_bulk(batch)
+    except (UnicodeDecodeError, csv.Error) as e:
+        con.commit()
+        raise HTTPException(400, f"Unreadable upload after {ok} rows: {e}")
+    finally:
+        text.detach()
+    return {"ok": True, "upserted": ok, "failed": failed,
+            "errors": errors, "errors_truncated": failed > len(errors)}
+
+@router.post("/vendors/backfill")
+def backfill_device_vendors(admin = Depends(require_min_role("admin"))):
+    """Re-read the OUI index (picks up a freshly built EXPORT_DIR/oui.bin) and fill missing vendors."""
+    if oui.reload() is None:
+        raise HTTPException(503, "No OUI index available; run: python -m app.oui build --fetch")
+    con = connect()
+    try:
+        checked, filled, sites = backfill_vendors(con)
+        con.commit()
+    finally:
+        con.close()
+    if sites:
+        publish(site_topics(*sites), {"type": "devices.bulk"}, key="devices.bulk")
+    return {"ok": True, "checked": checked, "filled": filled}
+
+@router.get("/export")
+def export_devices(
+    format: str = Query(default="csv", description="csv | ndjson"),
+    user = Depends(get_current_user)
+):
+    fmt = _fmt(format, None)
+    where: List[str] = []
+    params: List = []
+    visible = _acl_where(user, where, params)
+    sql = f"SELECT {','.join(COLUMNS)} FROM devices"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id"
+
+    def stream():
+        if fmt == "csv":
+            yield ",".join(COLUMNS) + "\r\n"
+        if not visible:
+            return
+        con = connect()
+        try:
+            cur = con.execute(sql, params)
+            buf = io.StringIO()
+            w = csv.writer(buf)
+            while True:
+                rows = cur.fetchmany(EXPORT_BATCH)
+                if not rows:
+                    break
+                if fmt == "csv":
+                    w.writerows(tuple(r) for r in rows)
+                else:
+                    for r in rows:
+                        buf.write(json.dumps(dict(zip(COLUMNS, r)), separators=(",", ":")))
+                        buf.write("\n")
+                yield buf.getvalue()
+                buf.seek(0); buf.truncate()
+        finally:
+            con.close()
+
+    media = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(stream(), media_type=media, headers={
+        "Content-Disposition": f'attachment; filename="devices.{fmt}"'
+    })
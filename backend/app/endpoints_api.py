@@ -1,27 +1,37 @@
-import time, uuid
+import json, secrets, time, uuid
 from typing import Optional
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from .db import connect
 from .auth import require_min_role
+from .collectors import request_run, COLLECTORS
+from .ingest_api import token_hash
+from . import snmp
 
 router = APIRouter(prefix="/api/endpoints", tags=["endpoints"])
-KINDS = {"unifi","auvik","generic"}
+KINDS = {"unifi","auvik","snmp","agent","generic"}
 AUTHS = {"userpass","apikey","token"}
 
 class EndpointIn(BaseModel):
   name: str
   kind: str
-  address: str
+  address: Optional[str] = None        # not used by push agents
   auth_type: str
   username: Optional[str] = None
   password: Optional[str] = None
   api_key: Optional[str] = None
   site: Optional[str] = None
+  tenants: Optional[str] = None        # auvik: comma-separated tenant ids, all when empty
   notes: Optional[str] = None
   enabled: Optional[bool] = True
-  snmp_version: Optional[str] = None   # e.g., "2c"
+  snmp_version: Optional[str] = None   # e.g., "2c" or "3"
   snmp_community: Optional[str] = None # v2c community
+  snmp_user: Optional[str] = None      # v3 (USM) user and keys, see app/snmp.py
+  snmp_auth_proto: Optional[str] = None
+  snmp_auth_key: Optional[str] = None
+  snmp_priv_proto: Optional[str] = None
+  snmp_priv_key: Optional[str] = None
+  poll_interval_s: Optional[int] = None  # collector interval, default COLLECT_INTERVAL_S
 
 class EndpointUpdate(BaseModel):
   name: Optional[str] = None
@@ -32,17 +42,40 @@ class EndpointUpdate(BaseModel):
   password: Optional[str] = None
   api_key: Optional[str] = None
   site: Optional[str] = None
+  tenants: Optional[str] = None
   notes: Optional[str] = None
   enabled: Optional[bool] = None
   snmp_version: Optional[str] = None
   snmp_community: Optional[str] = None
+  snmp_user: Optional[str] = None
+  snmp_auth_proto: Optional[str] = None
+  snmp_auth_key: Optional[str] = None
+  snmp_priv_proto: Optional[str] = None
+  snmp_priv_key: Optional[str] = None
+  poll_interval_s: Optional[int] = None
+
+SNMP_FIELDS = ("snmp_version", "snmp_community", "snmp_user", "snmp_auth_proto", "snmp_auth_key",
+               "snmp_priv_proto", "snmp_priv_key")
+
+def _check_snmp(d):
+  if not d.get("snmp_version"):
+    return
+  try:
+    snmp.Credentials(*(d.get(k) for k in SNMP_FIELDS))
+  except ValueError as e:
+    raise HTTPException(400, str(e))
 
 def _row(r):
   return {
     "id": r["id"], "name": r["name"], "kind": r["kind"], "address": r["address"],
-    "auth_type": r["auth_type"], "username": r["username"], "site": r["site"],
+    "auth_type": r["auth_type"], "username": r["username"], "site": r["site"], "tenants": r["tenants"],
     "notes": r["notes"], "created_ts": r["created_ts"], "enabled": bool(r["enabled"]),
     "snmp_version": r["snmp_version"], "snmp_community": r["snmp_community"],
+    "snmp_user": r["snmp_user"], "snmp_auth_proto": r["snmp_auth_proto"], "snmp_priv_proto": r["snmp_priv_proto"],
+    "poll_interval_s": r["poll_interval_s"], "collector": r["kind"] in COLLECTORS,
+    "last_run_ts": r["last_run_ts"], "last_ok_ts": r["last_ok_ts"], "last_duration_ms": r["last_duration_ms"],
+    "last_items": json.loads(r["last_items"]) if r["last_items"] else None,
+    "last_error": r["last_error"], "failures": r["failures"], "next_run_ts": r["next_run_ts"],
   }
 
 @router.get("")
@@ -56,26 +89,38 @@ def create_endpoint(body: EndpointIn, user = Depends(require_min_role("admin")))
   if body.kind not in KINDS: raise HTTPException(400, "Invalid kind")
   if body.auth_type not in AUTHS: raise HTTPException(400, "Invalid auth_type")
   if not body.name or not body.name.strip(): raise HTTPException(400, "Name required")
-  if not body.address or not body.address.strip(): raise HTTPException(400, "Address required")
+  if body.kind != "agent" and (not body.address or not body.address.strip()): raise HTTPException(400, "Address required")
+  _check_snmp(body.model_dump())
   eid = uuid.uuid4().hex
+  # push agents authenticate with a bearer token (app/ingest_api.py). Only its hash is
+  # stored, so a generated token is shown once
+  token = secrets.token_urlsafe(32) if body.kind == "agent" and not body.api_key else None
+  api_key = token_hash(token or body.api_key) if body.kind == "agent" else body.api_key
   con = connect()
   con.execute("""INSERT INTO endpoints
-    (id,name,kind,address,auth_type,username,password,api_key,site,notes,created_ts,enabled,snmp_version,snmp_community)
-    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)""",
-    (eid, body.name.strip(), body.kind, body.address.strip(), body.auth_type,
-     body.username, body.password, body.api_key, body.site, body.notes,
-     int(time.time()), int(bool(body.enabled)), body.snmp_version, body.snmp_community))
+    (id,name,kind,address,auth_type,username,password,api_key,site,tenants,notes,created_ts,enabled,snmp_version,
+     snmp_community,snmp_user,snmp_auth_proto,snmp_auth_key,snmp_priv_proto,snmp_priv_key,poll_interval_s)
+    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""",
+    (eid, body.name.strip(), body.kind, (body.address or "").strip(), body.auth_type,
+     body.username, body.password, api_key, body.site, body.tenants, body.notes,
+     int(time.time()), int(bool(body.enabled)), body.snmp_version, body.snmp_community,
+     body.snmp_user, body.snmp_auth_proto, body.snmp_auth_key, body.snmp_priv_proto, body.snmp_priv_key,
+     body.poll_interval_s))
   con.commit()
-  return {"ok": True, "id": eid}
+  return {"ok": True, "id": eid, **({"token": token} if token else {})}
 
 @router.patch("/{endpoint_id}")
 def update_endpoint(endpoint_id: str, body: EndpointUpdate, user = Depends(require_min_role("admin"))):
   con = connect()
   r = con.execute("SELECT * FROM endpoints WHERE id=?", (endpoint_id,)).fetchone()
   if not r: raise HTTPException(404, "Not found")
+  changes = body.model_dump(exclude_unset=True)
+  if (changes.get("kind") or r["kind"]) == "agent" and changes.get("api_key"):
+    changes["api_key"] = token_hash(changes["api_key"])
+  _check_snmp({**{k: r[k] for k in SNMP_FIELDS}, **changes})
   fields = []
   vals = []
-  for k, v in body.model_dump(exclude_unset=True).items():
+  for k, v in changes.items():
     if k == "kind" and v and v not in KINDS: raise HTTPException(400, "Invalid kind")
     if k == "auth_type" and v and v not in AUTHS: raise HTTPException(400, "Invalid auth_type")
     fields.append(f"{k}=?")
@@ -97,6 +142,27 @@ def toggle_endpoint(endpoint_id: str, body: dict, user = Depends(require_min_rol
   con.commit()
   return {"ok": True}
 
+@router.post("/{endpoint_id}/run", status_code=202)
+def run_endpoint(endpoint_id: str, user = Depends(require_min_role("admin"))):
+  con = connect()
+  r = con.execute("SELECT kind, enabled FROM endpoints WHERE id=?", (endpoint_id,)).fetchone()
+  if not r: raise HTTPException(404, "Not found")
+  if not r["enabled"]: raise HTTPException(400, "Endpoint is disabled")
+  if r["kind"] not in COLLECTORS: raise HTTPException(400, f"No collector for kind '{r['kind']}'")
+  if not request_run(endpoint_id): raise HTTPException(503, "Collector scheduler is not running")
+  return {"ok": True, "queued": True}
+
+@router.post("/{endpoint_id}/token")
+def rotate_agent_token(endpoint_id: str, user = Depends(require_min_role("admin"))):
+  con = connect()
+  r = con.execute("SELECT kind FROM endpoints WHERE id=?", (endpoint_id,)).fetchone()
+  if not r: raise HTTPException(404, "Not found")
+  if r["kind"] != "agent": raise HTTPException(400, "Only agent endpoints have tokens")
+  token = secrets.token_urlsafe(32)
+  con.execute("UPDATE endpoints SET api_key=? WHERE id=?", (token_hash(token), endpoint_id))
+  con.commit()
+  return {"ok": True, "token": token}
+
 @router.delete("/{endpoint_id}")
 def delete_endpoint(endpoint_id: str, user = Depends(require_min_role("admin"))):
   con = connect()
@@ -0,0 +1,174 @@
+import asyncio, json, os
+from typing import Dict, Hashable, Iterable, List, Optional, Set
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from .auth import get_current_user
+from .db import site_ids_for_user
+from . import aiodb, cluster
+
+# In-process pub/sub for change notifications, served to browsers over SSE.
+#
+# Write paths call publish() from any thread. Events are funnelled onto the
+# event loop, coalesced per topic for COALESCE_MS (later events with the same
+# key replace earlier ones) and fanned out as one batch per topic. Topics
+# nobody subscribes to are dropped at the door, so idle dashboards cost one
+# parked coroutine each plus a heartbeat. With several workers every publish
+# is also forwarded over cluster.bus, since subscribers may sit on any worker.
+#
+# Topics:
+#   sites, maps, links            list-level changes (any user)
+#   site:{id}                     devices on a site (site ACL applies)
+#   site:none                     unassigned devices (admins)
+#   map:{id}                      map image / placements (any user)
+#   scan:{job_id}                 SNMP scan progress (admins)
+
+COALESCE_MS = int(os.getenv("EVENTS_COALESCE_MS", "250"))
+HEARTBEAT_S = int(os.getenv("EVENTS_HEARTBEAT_S", "25"))
+QUEUE_MAX = 64          # pending batches per subscriber before it is told to resync
+
+class _Subscriber:
+    __slots__ = ("topics", "queue", "overflow")
+
+    def __init__(self, topics: Set[str]):
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAX)
+        self.overflow = False
+
+class Broker:
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.subs: Dict[str, Set[_Subscriber]] = {}
+        self.pending: Dict[str, Dict[Hashable, Dict]] = {}
+        self.flush_handle = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    # ---- publishing (any thread) ----
+    def publish(self, topics: Iterable[str], event: Dict, key: Optional[Hashable] = None):
+        topics = list(topics)
+        if topics:
+            cluster.bus.send("event", topics=topics, event=event, key=key)
+        self.publish_local(topics, event, key)
+
+    def publish_local(self, topics: Iterable[str], event: Dict, key: Optional[Hashable] = None):
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        topics = [t for t in topics if t in self.subs]    # racy read is fine: worst case one dropped event
+        if not topics:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._enqueue(topics, event, key)
+        else:
+            loop.call_soon_threadsafe(self._enqueue, topics, event, key)
+
+    def _enqueue(self, topics: List[str], event: Dict, key: Optional[Hashable]):
+        k = key if key is not None else object()
+        for t in topics:
+            self.pending.setdefault(t, {})[k] = event
+        if self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(COALESCE_MS / 1000, self._flush)
+
+    def _flush(self):
+        self.flush_handle = None
+        pending, self.pending = self.pending, {}
+        for topic, events in pending.items():
+            batch = {"topic": topic, "events": list(events.values())}
+            for sub in self.subs.get(topic, ()):
+                if sub.overflow:
+                    continue
+                try:
+                    sub.queue.put_nowait(batch)
+                except asyncio.QueueFull:
+                    sub.overflow = True
+
+    # ---- subscribing (event loop) ----
+    def subscribe(self, topics: Set[str]) -> _Subscriber:
+        sub = _Subscriber(topics)
+        for t in topics:
+            self.subs.setdefault(t, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: _Subscriber):
+        for t in sub.topics:
+            s = self.subs.get(t)
+            if s is not None:
+                s.discard(sub)
+                if not s:
+                    del self.subs[t]
+
+broker = Broker()
+
+def _from_peer(msg: Dict):
+    key = msg.get("key")
+    broker.publish_local(msg["topics"], msg["event"], tuple(key) if isinstance(key, list) else key)
+
+cluster.bus.on("event", _from_peer)
+
+def publish(topics: Iterable[str], event: Dict, key: Optional[Hashable] = None):
+    broker.publish(topics, event, key)
+
+def site_topics(*site_ids) -> List[str]:
+    """Topics for devices on these sites (None -> site:none)."""
+    return sorted({"site:none" if s is None else f"site:{int(s)}" for s in site_ids})
+
+# ---------- SSE endpoint ----------
+router = APIRouter(prefix="/api/events", tags=["events"])
+
+def _allowed_topics(con, user, requested: Set[str]) -> Set[str]:
+    is_admin, allowed = site_ids_for_user(user["email"], user["role"], con)
+    ok = set()
+    for t in requested:
+        kind, _, arg = t.partition(":")
+        if kind in ("sites", "maps", "links") and not arg:
+            ok.add(t)
+        elif kind == "map" and arg:
+            ok.add(t)
+        elif kind == "site" and arg:
+            if is_admin or (arg.isdigit() and int(arg) in allowed):
+                ok.add(t)
+        elif kind in ("scan",) and arg and is_admin:
+            ok.add(t)
+    return ok
+
+def _sse(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+@router.get("")
+async def stream_events(request: Request,
+                        topics: str = Query(..., description="comma separated, e.g. site:3,map:abc,maps"),
+                        user = Depends(get_current_user)):
+    requested = {t.strip() for t in topics.split(",") if t.strip()}
+    granted = await aiodb.run(_allowed_topics, user, requested)
+    if not granted:
+        raise HTTPException(403, "No permitted topics")
+
+    async def gen():
+        sub = broker.subscribe(granted)
+        try:
+            yield _sse("ready", {"topics": sorted(granted), "denied": sorted(requested - granted)})
+            while True:
+                if sub.overflow:
+                    # the client fell behind; tell it to refetch instead of replaying
+                    while not sub.queue.empty():
+                        sub.queue.get_nowait()
+                    sub.overflow = False
+                    yield _sse("resync", {})
+                    continue
+                try:
+                    batch = await asyncio.wait_for(sub.queue.get(), HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                yield _sse("changes", batch)
+        finally:
+            broker.unsubscribe(sub)
+
+    return StreamingResponse(gen(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+    })
@@ -0,0 +1,156 @@
+import gzip, json, os, zlib
+from typing import Dict, List, Optional, Sequence
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from . import metrics
+
+# High-throughput response path for large lists.
+#
+# - dumps(): orjson when installed (3-5x faster than the stdlib encoder on
+#   row-shaped data), json otherwise.
+# - rows_response(): serialises sqlite3 result tuples directly. The default
+#   "objects" shape zips each tuple with the column names; shape="columns"
+#   returns {"columns": [...], key: [[...], ...]}, skipping per-row dicts
+#   and halving the payload.
+# - CompressionMiddleware: br (if the brotli module is installed) or gzip for
+#   compressible bodies of at least COMPRESS_MIN_BYTES, streaming responses
+#   included; server-sent events and media are passed through untouched.
+
+try:
+    import orjson
+except ImportError:   # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import brotli
+except ImportError:   # pragma: no cover - optional
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "4"))
+BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+OFFLOAD_BYTES = 256 * 1024      # compress bigger bodies in the threadpool, not on the event loop
+
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/csv", "text/plain", "text/html",
+                "application/javascript", "text/css", "image/svg+xml")
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+def rows_response(cur, key: str, shape: str = "objects", extra: Optional[Dict] = None) -> FastJSONResponse:
+    """
+    Respond with every row of an executed cursor as `key`. Rows are fetched as
+    plain tuples (the cursor's row factory is switched off before fetching).
+    """
+    cols: List[str] = [d[0] for d in cur.description]
+    cur.row_factory = None
+    rows: Sequence = cur.fetchall()
+    if shape == "columns":
+        body = {"columns": cols, key: rows}
+    else:
+        body = {key: [dict(zip(cols, r)) for r in rows]}
+    if extra:
+        body.update(extra)
+    return FastJSONResponse(body)
+
+# ---------- compression ----------
+def _pick_encoding(accept: str) -> Optional[str]:
+    offered = {}
+    for part in accept.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+def _compressor(enc: str):
+    if enc == "br":
+        return brotli.Compressor(quality=BROTLI_QUALITY)
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)     # gzip container
+
+def _compress(enc: str, data: bytes) -> bytes:
+    if enc == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, GZIP_LEVEL)
+
+def _chunk(c, enc: str, data: bytes, last: bool) -> bytes:
+    if enc == "br":
+        out = c.process(data)
+        return out + (c.finish() if last else c.flush())
+    return c.compress(data) + c.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept = ""
+        for k, v in scope["headers"]:
+            if k == b"accept-encoding":
+                accept = v.decode("latin-1")
+                break
+        enc = _pick_encoding(accept) if accept else None
+        if enc is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        mode = None          # None (undecided) | "plain" | "whole" | "stream"
+        comp = None
+
+        async def _send(msg):
+            nonlocal start, mode, comp
+            if msg["type"] == "http.response.start":
+                start = msg
+                return
+            if msg["type"] != "http.response.body" or mode == "plain":
+                return await send(msg)
+            body = msg.get("body", b"")
+            more = msg.get("more_body", False)
+            if mode is None:
+                headers = {k.lower(): v for k, v in start.get("headers", [])}
+                ctype = headers.get(b"content-type", b"").decode("latin-1").split(";")[0].strip().lower()
+                if (b"content-encoding" in headers or ctype not in COMPRESSIBLE
+                        or (not more and len(body) < self.minimum_size)):
+                    mode = "plain"
+                    await send(start)
+                    return await send(msg)
+                hdrs = [(k, v) for k, v in start.get("headers", []) if k.lower() != b"content-length"]
+                hdrs += [(b"content-encoding", enc.encode()), (b"vary", b"Accept-Encoding")]
+                if not more:
+                    mode = "whole"
+                    out = (await run_in_threadpool(_compress, enc, body) if len(body) >= OFFLOAD_BYTES
+                           else _compress(enc, body))
+                    hdrs.append((b"content-length", str(len(out)).encode()))
+                    metrics.inc("http_response_bytes_total", (("encoding", enc),), len(out))
+                    metrics.inc("http_response_uncompressed_bytes_total", (("encoding", enc),), len(body))
+                    await send({**start, "headers": hdrs})
+                    return await send({"type": "http.response.body", "body": out})
+                mode = "stream"
+                comp = _compressor(enc)
+                await send({**start, "headers": hdrs})
+            out = _chunk(comp, enc, body, not more)
+            metrics.inc("http_response_bytes_total", (("encoding", enc),), len(out))
+            metrics.inc("http_response_uncompressed_bytes_total", (("encoding", enc),), len(body))
+            await send({"type": "http.response.body", "body": out, "more_body": more})
+
+        await self.app(scope, receive, _send)
@@ -0,0 +1,41 @@
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+# versioned URLs (?v=<mtime>) never change content, so they can be cached for good;
+# anything else must be revalidated, which costs a 304 instead of the whole file
+IMMUTABLE = "private, max-age=31536000, immutable"
+REVALIDATE = "private, no-cache"
+
+def file_etag(st: os.stat_result) -> str:
+    # strong validator: changes whenever the file is replaced or rewritten
+    return f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+def _not_modified(request: Request, etag: str, st: os.stat_result) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        tags = [t.strip() for t in inm.split(",")]
+        return "*" in tags or etag in tags
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            return int(st.st_mtime) <= int(parsedate_to_datetime(ims).timestamp())
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def cached_file(request: Request, path: str, immutable: bool = False,
+                media_type: Optional[str] = None) -> Response:
+    """FileResponse with ETag/Last-Modified validators and 304 handling."""
+    st = os.stat(path)
+    etag = file_etag(st)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": IMMUTABLE if immutable else REVALIDATE,
+    }
+    if _not_modified(request, etag, st):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=st)
@@ -0,0 +1,371 @@
+import asyncio, concurrent.futures, hashlib, json, math, os, queue, threading, time, zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import APIRouter, HTTPException, Request
+from .db import connect, normalize_mac
+from .events import publish, site_topics
+from .fastjson import orjson
+from . import aiodb, metrics
+
+# Push ingestion for remote collector agents (endpoints of kind "agent").
+#
+#   POST /api/ingest
+#   Authorization: Bearer <the endpoint's token>
+#   X-Batch-Id: <unique per batch; a retry reuses it>
+#   Content-Type: application/x-ndjson
+#   Content-Encoding: gzip | deflate | identity
+#
+#   {"type": "device", "mac": "...", "name": "...", "mgmt_ip": "...", "vendor": "...", "last_seen_ts": 0}
+#   {"type": "link", "a": "<mac>", "b": "<mac>", "ts": 0}
+#   {"type": "metric", "mac": "...", "name": "cpu_pct", "value": 12.5, "ts": 0}
+#
+# Requests only parse and validate, on INGEST_PARSE_THREADS threads: parsing
+# is pure Python, and every extra thread competing for the GIL delays the
+# event loop. Batches then go through a bounded queue to
+# one writer thread per worker. The writer applies everything queued in a
+# single transaction with one savepoint per batch, so one commit covers many
+# agents. A full queue answers 503 with Retry-After.
+#
+# The response is sent after the batch is committed. ingest_batches records
+# (endpoint, batch id) in that same transaction, so a batch that is retried
+# after a lost response is acknowledged as a duplicate and not applied again.
+# Devices are placed in the site named by the endpoint's `site` (id, slug or name).
+# An agent only writes devices that are new, unassigned or already in its own
+# site; device records for another site's MACs count as invalid, and links or
+# metrics that touch them as unresolved.
+#
+# endpoints.api_key holds token_hash(token) for agents, never the token itself.
+
+MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(8 * 1024 * 1024)))              # request body
+MAX_DECODED_BYTES = int(os.getenv("INGEST_MAX_DECODED_BYTES", str(64 * 1024 * 1024)))
+MAX_RECORDS = int(os.getenv("INGEST_MAX_RECORDS", "200000"))
+QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", "256"))                              # batches
+PARSE_THREADS = int(os.getenv("INGEST_PARSE_THREADS", "2"))
+GROUP_MAX_RECORDS = int(os.getenv("INGEST_GROUP_MAX_RECORDS", "100000"))
+ACK_TIMEOUT_S = int(os.getenv("INGEST_ACK_TIMEOUT_S", "30"))
+BATCH_TTL_S = int(os.getenv("INGEST_BATCH_TTL_S", str(7 * 86400)))                 # how long batch ids are remembered
+METRIC_RETENTION_DAYS = int(os.getenv("METRIC_RETENTION_DAYS", "30"))
+TOKEN_RELOAD_S = 30
+MAX_BATCH_ID = 128
+
+router = APIRouter(prefix="/api/ingest", tags=["ingest"])
+
+# ---------- agent tokens ----------
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class _Agents:
+    """sha256(token) -> {"id", "name", "site_id"} for enabled agent endpoints, reloaded periodically."""
+    def __init__(self):
+        self.by_hash: Dict[str, Dict] = {}
+        self.loaded = 0.0
+        self.lock = threading.Lock()
+
+    def _load(self, con):
+        rows = con.execute("""
+          SELECT e.id, e.name, e.api_key AS token_hash, s.id AS site_id FROM endpoints e
+          LEFT JOIN sites s ON e.site IS NOT NULL AND e.site != ''
+            AND (CAST(s.id AS TEXT) = e.site OR s.slug = e.site OR s.name = e.site)
+          WHERE e.kind = 'agent' AND e.enabled = 1 AND e.api_key IS NOT NULL AND e.api_key != ''
+        """).fetchall()
+        self.by_hash = {r["token_hash"]: {"id": r["id"], "name": r["name"], "site_id": r["site_id"]}
+                        for r in rows}
+        self.loaded = time.monotonic()
+
+    def _stale(self, agent: Optional[Dict]) -> bool:
+        # reload when stale, or on an unknown token (new endpoint) at most every couple of seconds
+        age = time.monotonic() - self.loaded
+        return age > TOKEN_RELOAD_S or (agent is None and age > 2)
+
+    def _reload(self, con, h: str) -> Optional[Dict]:
+        with self.lock:
+            if time.monotonic() - self.loaded > 2:
+                self._load(con)
+        return self.by_hash.get(h)
+
+    async def get(self, token: str) -> Optional[Dict]:
+        """Answered from memory; only a reload goes to the database."""
+        h = token_hash(token)
+        agent = self.by_hash.get(h)
+        if self._stale(agent):
+            agent = await aiodb.run(self._reload, h)
+        return agent
+
+agents = _Agents()
+
+# ---------- parsing ----------
+_loads = orjson.loads if orjson is not None else json.loads
+
+class Batch:
+    __slots__ = ("agent", "batch_id", "devices", "links", "metrics", "invalid", "future")
+
+    def __init__(self, agent: Dict, batch_id: Optional[str]):
+        self.agent, self.batch_id = agent, batch_id
+        self.devices: List[Tuple] = []                       # DeviceTuple
+        self.links: List[Tuple[str, str, int]] = []          # (mac, mac, ts)
+        self.metrics: List[Tuple[str, str, int, float]] = [] # (mac, name, ts, value)
+        self.invalid = 0
+        self.future: Optional[concurrent.futures.Future] = None
+
+    def __len__(self):
+        return len(self.devices) + len(self.links) + len(self.metrics)
+
+def _decode(body: bytes, encoding: str) -> bytes:
+    if encoding in ("", "identity"):
+        return body
+    if encoding not in ("gzip", "x-gzip", "deflate"):
+        raise HTTPException(415, f"Unsupported Content-Encoding {encoding}")
+    d = zlib.decompressobj(32 + zlib.MAX_WBITS if encoding != "deflate" else zlib.MAX_WBITS)
+    try:
+        out = d.decompress(body, MAX_DECODED_BYTES)
+    except zlib.error:
+        raise HTTPException(400, "Corrupt compressed body")
+    if d.unconsumed_tail:
+        raise HTTPException(413, f"Decompressed body exceeds {MAX_DECODED_BYTES} bytes")
+    return out
+
+def _records(text: bytes) -> List:
+    lines = [l for l in text.split(b"\n") if l.strip()]
+    if len(lines) > MAX_RECORDS:
+        raise HTTPException(413, f"At most {MAX_RECORDS} records per batch")
+    try:
+        return _loads(b"[" + b",".join(lines) + b"]")        # one parse for the whole batch
+    except ValueError:
+        out = []
+        for l in lines:
+            try:
+                out.append(_loads(l))
+            except ValueError:
+                out.append(None)
+        return out
+
+def _str(v, limit: int = 255) -> Optional[str]:
+    if v is None or isinstance(v, (dict, list)):
+        return None
+    v = str(v).strip()
+    return v[:limit] or None
+
+def _ts(v, now: int) -> int:
+    try:
+        ts = int(v)
+    except (TypeError, ValueError):
+        return now
+    return ts if 0 < ts <= now + 300 else now
+
+def parse(body: bytes, encoding: str, agent: Dict, batch_id: Optional[str]) -> Batch:
+    now = int(time.time())
+    b = Batch(agent, batch_id)
+    site_id = agent["site_id"]
+    for rec in _records(_decode(body, encoding)):
+        t = rec.get("type") if isinstance(rec, dict) else None
+        if t == "device":
+            mac = normalize_mac(str(rec.get("mac") or ""))
+            if mac:
+                b.devices.append((_str(rec.get("name")), mac, _str(rec.get("mgmt_ip"), 64), _str(rec.get("vendor")),
+                                  site_id, _ts(rec.get("last_seen_ts"), now)))
+                continue
+        elif t == "link":
+            a, c = normalize_mac(str(rec.get("a") or "")), normalize_mac(str(rec.get("b") or ""))
+            if a and c and a != c:
+                b.links.append((a, c, _ts(rec.get("ts"), now)))
+                continue
+        elif t == "metric":
+            mac = normalize_mac(str(rec.get("mac") or ""))
+            name, value = rec.get("name"), rec.get("value")
+            if (mac and isinstance(name, str) and 0 < len(name) <= 64
+                    and isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)):
+                b.metrics.append((mac, name, _ts(rec.get("ts"), now), float(value)))
+                continue
+        b.invalid += 1
+    return b
+
+def foreign_macs(con, macs, site_id: Optional[int]) -> Set[str]:
+    """Of macs, those whose device belongs to a site other than site_id (any site, if site_id is None)."""
+    from .links_api import _chunks
+    macs, out = list(macs), set()
+    for part in _chunks(macs):
+        q = ",".join(["?"] * len(part))
+        out.update(r[0] for r in con.execute(
+            f"SELECT mac FROM devices WHERE mac IN ({q}) AND site_id IS NOT NULL AND site_id IS NOT ?", (*part, site_id)))
+    return out
+
+# ---------- group-commit writer ----------
+class Writer:
+    def __init__(self):
+        self.q: "queue.Queue[Batch]" = queue.Queue(QUEUE_MAX)
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.recent: "OrderedDict[Tuple[str, str], None]" = OrderedDict()      # committed batch ids, newest last
+
+    def submit(self, batch: Batch) -> concurrent.futures.Future:
+        """Queue a batch; raises queue.Full when the writer is behind."""
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+                    self.thread.start()
+        batch.future = concurrent.futures.Future()
+        self.q.put_nowait(batch)
+        metrics.gauge_add("ingest_queue_batches", (), 1)
+        return batch.future
+
+    def seen(self, endpoint_id: str, batch_id: str) -> bool:
+        return (endpoint_id, batch_id) in self.recent
+
+    def _remember(self, key: Tuple[str, str]):
+        self.recent[key] = None
+        while len(self.recent) > 100000:
+            self.recent.popitem(last=False)
+
+    def _run(self):
+        con = connect()
+        while True:
+            group = [self.q.get()]
+            n = len(group[0])
+            # everything that queued up while the previous group was committing goes into this one
+            while n < GROUP_MAX_RECORDS:
+                try:
+                    b = self.q.get_nowait()
+                except queue.Empty:
+                    break
+                group.append(b)
+                n += len(b)
+            metrics.gauge_add("ingest_queue_batches", (), -len(group))
+            try:
+                self._commit(con, group)
+            except Exception as e:
+                print("[ingest] group commit failed:", e)
+                for b in group:
+                    if not b.future.done():
+                        b.future.set_exception(e)
+                con.close()                 # start the next group on a fresh connection
+                con = connect()
+
+    def _commit(self, con, group: List[Batch]):
+        from .devices_api import upsert_devices
+        from .links_api import resolve_macs, upsert_links
+        t = time.perf_counter()
+        now = int(time.time())
+        results: List[Tuple[Batch, Dict]] = []
+        sites, links, per_endpoint = set(), 0, {}
+        con.execute("BEGIN IMMEDIATE")      # take the write lock up front; savepoints nest inside
+        try:
+            for b in group:
+                eid = b.agent["id"]
+                if b.batch_id and con.execute("SELECT 1 FROM ingest_batches WHERE endpoint_id=? AND batch_id=?",
+                                              (eid, b.batch_id)).fetchone():
+                    results.append((b, {"duplicate": True}))
+                    continue
+                con.execute("SAVEPOINT batch")
+                try:
+                    refs = {m for l in b.links for m in l[:2]} | {m[0] for m in b.metrics}
+                    other = foreign_macs(con, {d[1] for d in b.devices} | refs, b.agent["site_id"])
+                    devices = [d for d in b.devices if d[1] not in other]
+                    upsert_devices(con, devices)
+                    ids = resolve_macs(con, refs - other)
+                    edges = [(ids[a], ids[c]) for a, c, _ in b.links if a in ids and c in ids]
+                    if edges:
+                        upsert_links(con, edges, max(l[2] for l in b.links))
+                    rows = [(ids[m], name, ts, v) for m, name, ts, v in b.metrics if m in ids]
+                    con.executemany("INSERT OR REPLACE INTO device_metrics(device_id, name, ts, value) VALUES (?,?,?,?)", rows)
+                    if b.batch_id:
+                        con.execute("INSERT INTO ingest_batches(endpoint_id, batch_id, received_ts, records) VALUES (?,?,?,?)",
+                                    (eid, b.batch_id, now, len(b)))
+                    con.execute("RELEASE batch")
+                except Exception as e:
+                    con.execute("ROLLBACK TO batch")
+                    con.execute("RELEASE batch")
+                    results.append((b, {"error": str(e)}))
+                    continue
+                res = {"devices": len(devices), "links": len(edges), "metrics": len(rows),
+                       "unresolved": len(b.links) - len(edges) + len(b.metrics) - len(rows),
+                       "invalid": b.invalid + len(b.devices) - len(devices)}
+                results.append((b, res))
+                sites.update(d[4] for d in devices)
+                links += len(edges)
+                per_endpoint[eid] = res
+            for eid, res in per_endpoint.items():
+                con.execute("UPDATE endpoints SET last_run_ts=?, last_ok_ts=?, last_items=?, last_error=NULL, failures=0 WHERE id=?",
+                            (now, now, json.dumps(res), eid))
+            con.commit()
+        except Exception:
+            con.rollback()
+            raise
+        metrics.observe("ingest_commit_seconds", time.perf_counter() - t)
+        metrics.observe("ingest_group_batches", len(group), buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+        for b, res in results:
+            kind = "error" if "error" in res else "duplicate" if res.get("duplicate") else "ok"
+            metrics.inc("ingest_batches_total", (("result", kind),))
+            if kind == "ok":
+                if b.batch_id:
+                    self._remember((b.agent["id"], b.batch_id))
+                for name, n in (("device", len(b.devices)), ("link", len(b.links)), ("metric", len(b.metrics))):
+                    if n:
+                        metrics.inc("ingest_records_total", (("type", name),), n)
+            if not b.future.done():         # the request may have given up waiting
+                b.future.set_result(res)
+        if sites:
+            publish(site_topics(*sites), {"type": "devices.bulk"}, key="devices.bulk")
+        if links:
+            publish(["links"], {"type": "links.updated"}, key="links.updated")
+
+writer = Writer()
+
+def prune(con, now: Optional[int] = None) -> Tuple[int, int]:
+    now = int(now or time.time())
+    n_batches = con.execute("DELETE FROM ingest_batches WHERE received_ts < ?", (now - BATCH_TTL_S,)).rowcount
+    n_metrics = con.execute("DELETE FROM device_metrics WHERE ts < ?", (now - METRIC_RETENTION_DAYS * 86400,)).rowcount
+    con.commit()
+    return n_batches, n_metrics
+
+async def ingest_prune_loop():
+    while True:
+        try:
+            b, m = await aiodb.run(prune)
+            if b or m:
+                print(f"[ingest] pruned {b} batch ids, {m} metric samples")
+        except Exception as e:
+            print("[ingest] prune failed:", e)
+        await asyncio.sleep(3600)
+
+# ---------- route ----------
+_parse_pool = concurrent.futures.ThreadPoolExecutor(max_workers=PARSE_THREADS, thread_name_prefix="ingest-parse")
+
+@router.post("")
+async def ingest(request: Request):
+    auth = request.headers.get("authorization", "")
+    token = auth[7:].strip() if auth[:7].lower() == "bearer " else ""
+    agent = await agents.get(token) if token else None
+    if agent is None:
+        raise HTTPException(401, "Invalid agent token")
+    batch_id = request.headers.get("x-batch-id") or request.query_params.get("batch_id")
+    if batch_id is not None and not 0 < len(batch_id) <= MAX_BATCH_ID:
+        raise HTTPException(400, f"Batch id must be 1-{MAX_BATCH_ID} characters")
+    if batch_id and writer.seen(agent["id"], batch_id):
+        metrics.inc("ingest_batches_total", (("result", "duplicate"),))
+        return {"ok": True, "duplicate": True}
+    if int(request.headers.get("content-length") or 0) > MAX_BYTES:
+        raise HTTPException(413, f"Body exceeds {MAX_BYTES} bytes")
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MAX_BYTES:
+            raise HTTPException(413, f"Body exceeds {MAX_BYTES} bytes")
+        chunks.append(chunk)
+    encoding = request.headers.get("content-encoding", "").strip().lower()
+    batch = await asyncio.get_running_loop().run_in_executor(
+        _parse_pool, parse, b"".join(chunks), encoding, agent, batch_id)
+    try:
+        fut = writer.submit(batch)
+    except queue.Full:
+        metrics.inc("ingest_batches_total", (("result", "rejected"),))
+        raise HTTPException(503, "Ingest queue full", headers={"Retry-After": "5"})
+    try:
+        res = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(fut)), ACK_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        raise HTTPException(503, "Batch not committed yet; retry with the same batch id", headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(503, f"Batch not applied: {e}", headers={"Retry-After": "5"})
+    if "error" in res:
+        raise HTTPException(400, f"Batch rejected: {res['error']}")
+    return {"ok": True, **res}
@@ -0,0 +1,130 @@
+import asyncio, os, time
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from .auth import require_min_role
+from .db import connect, normalize_mac
+from .events import publish
+from . import aiodb
+
+router = APIRouter(prefix="/api/links", tags=["links"])
+
+# links not refreshed within this window are swept by the aging job
+LINK_MAX_AGE_S = int(os.getenv("LINK_MAX_AGE_S", str(7 * 24 * 3600)))
+LINK_AGING_INTERVAL_S = int(os.getenv("LINK_AGING_INTERVAL_S", "900"))
+MAX_EDGES = int(os.getenv("LINK_BULK_MAX_EDGES", "50000"))
+
+# keep IN (...) lists well under SQLite's bound-variable limit
+_CHUNK = 500
+
+class LinksBulkIn(BaseModel):
+    # compact edge list: [[a, b], ...] where a/b are device ids or MAC strings
+    edges: List[List[Union[int, str]]]
+    ts: Optional[int] = None
+
+def _chunks(seq: List, n: int = _CHUNK):
+    for i in range(0, len(seq), n):
+        yield seq[i:i+n]
+
+def resolve_macs(con, macs: Iterable[str]) -> Dict[str, int]:
+    """Normalized MAC -> device id, for the MACs that exist."""
+    macs = list(set(macs))
+    out: Dict[str, int] = {}
+    for part in _chunks(macs):
+        q = ",".join(["?"] * len(part))
+        for r in con.execute(f"SELECT id, mac FROM devices WHERE mac IN ({q})", part):
+            out[r["mac"]] = int(r["id"])
+    return out
+
+def existing_device_ids(con, ids: Iterable[int]) -> Set[int]:
+    ids = list(set(ids))
+    out: Set[int] = set()
+    for part in _chunks(ids):
+        q = ",".join(["?"] * len(part))
+        out.update(int(r[0]) for r in con.execute(f"SELECT id FROM devices WHERE id IN ({q})", part))
+    return out
+
+def upsert_links(con, edges: Iterable[Tuple[int, int]], ts: Optional[int] = None) -> int:
+    """
+    Upsert undirected edges between device ids in one executemany batch.
+    Edges are canonicalised to (min, max) and de-duplicated; self-loops are dropped.
+    Caller commits.
+    """
+    ts = int(ts or time.time())
+    canon = {(a, b) if a < b else (b, a) for a, b in edges if a != b}
+    con.executemany("""
+      INSERT INTO device_links(a_id, b_id, last_seen_ts) VALUES (?,?,?)
+      ON CONFLICT(a_id, b_id) DO UPDATE SET last_seen_ts=max(last_seen_ts, excluded.last_seen_ts)
+    """, [(a, b, ts) for a, b in canon])
+    return len(canon)
+
+def sweep_stale_links(con, max_age_s: int = LINK_MAX_AGE_S, now: Optional[int] = None) -> int:
+    """Delete links whose last_seen_ts is older than the aging window."""
+    cutoff = int(now or time.time()) - max_age_s
+    n = con.execute("DELETE FROM device_links WHERE last_seen_ts < ?", (cutoff,)).rowcount
+    con.commit()
+    if n:
+        publish(["links"], {"type": "links.aged", "removed": n}, key="links.aged")
+    return n
+
+async def link_aging_loop():
+    while True:
+        await asyncio.sleep(LINK_AGING_INTERVAL_S)
+        try:
+            n = await aiodb.run(sweep_stale_links)
+            if n:
+                print(f"[links] aged out {n} stale links")
+        except Exception as e:
+            print("[links] aging sweep failed:", e)
+
+# ---------- routes ----------
+@router.post("/bulk")
+def bulk_upsert_links(body: LinksBulkIn, admin = Depends(require_min_role("admin"))):
+    if len(body.edges) > MAX_EDGES:
+        raise HTTPException(413, f"At most {MAX_EDGES} edges per call")
+    pairs: List[Tuple] = []
+    macs: Set[str] = set()
+    invalid = 0
+    for e in body.edges:
+        if len(e) != 2:
+            invalid += 1
+            continue
+        ends = []
+        for v in e:
+            if isinstance(v, int):
+                ends.append(v)
+            else:
+                m = normalize_mac(v)
+                if m is None:
+                    break
+                macs.add(m)
+                ends.append(m)
+        if len(ends) != 2:
+            invalid += 1
+            continue
+        pairs.append(tuple(ends))
+
+    con = connect()
+    by_mac = resolve_macs(con, macs)
+    ids = existing_device_ids(con, [v for p in pairs for v in p if isinstance(v, int)])
+    edges, unresolved = [], 0
+    for a, b in pairs:
+        a = by_mac.get(a) if isinstance(a, str) else (a if a in ids else None)
+        b = by_mac.get(b) if isinstance(b, str) else (b if b in ids else None)
+        if a is None or b is None:
+            unresolved += 1
+            continue
+        edges.append((a, b))
+    n = upsert_links(con, edges, body.ts)
+    con.commit()
+    if n:
+        publish(["links"], {"type": "links.updated"}, key="links.updated")
+    return {"ok": True, "upserted": n, "invalid": invalid, "unresolved": unresolved}
+
+@router.post("/age")
+def age_links(max_age_s: Optional[int] = None, admin = Depends(require_min_role("admin"))):
+    con = connect()
+    try:
+        return {"ok": True, "removed": sweep_stale_links(con, max_age_s or LINK_MAX_AGE_S)}
+    finally:
+        con.close()
@@ -0,0 +1,211 @@
+import array, os, threading, time
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query
+from .auth import get_current_user
+from .db import connect, normalize_mac, site_ids_for_user
+from . import cluster, metrics, oui
+
+# Where is a MAC plugged in?
+#
+# Collectors hand forwarding-table sightings per switch to store_locations()
+# as (mac, ifIndex, port name, VLAN). A port on which a device_links
+# neighbour of that switch is learned is an uplink; those ports are dropped,
+# so mac_locations only keeps edge ports. Sightings older than
+# LOCATE_RETENTION_S are pruned on the next run for the same switch.
+#
+# /api/locate/{mac} answers from an in-memory copy with one location per MAC.
+# Only sightings within LOCATE_FRESH_S of the MAC's newest one are candidates
+# (a device that moved is placed where it is now, not where it sat last week);
+# among those the port with the fewest MACs wins, then the newest. Port sizes
+# count only what each switch reported in that same window. It is stored as
+# sorted arrays (about 22 bytes per MAC, as in app/oui.py) and searched by
+# bisect. Writes mark the copy stale on every worker (over the cluster bus);
+# it is rebuilt in a background thread while lookups keep using the old one.
+
+RETENTION_S = int(os.getenv("LOCATE_RETENTION_S", str(7 * 86400)))
+# two default collector intervals: sightings this close together are the same "now"
+FRESH_S = int(os.getenv("LOCATE_FRESH_S", str(2 * int(os.getenv("COLLECT_INTERVAL_S", "300")))))
+
+# (normalized mac, ifIndex, port name, vlan)
+Sighting = Tuple[str, int, Optional[str], int]
+
+def mac_int(mac: str) -> int:
+    return int(mac.replace(":", ""), 16)
+
+# ---------- writes ----------
+def store_locations(con, by_switch: Dict[int, List[Sighting]], source: str) -> Dict[str, int]:
+    """Record what each switch (device id) sees now. One transaction."""
+    now = int(time.time())
+    stored = uplinks = 0
+    for device_id, sightings in by_switch.items():
+        neighbours = {r[0] for r in con.execute("""
+          SELECT d.mac FROM device_links l
+          JOIN devices d ON d.id = CASE WHEN l.a_id = ?1 THEN l.b_id ELSE l.a_id END
+          WHERE l.a_id = ?1 OR l.b_id = ?1
+        """, (device_id,))}
+        skip = {ifx for mac, ifx, _, _ in sightings if mac in neighbours}
+        rows = [(mac_int(mac), device_id, ifx, vlan or 0, name, source, now)
+                for mac, ifx, name, vlan in sightings if ifx not in skip]
+        con.executemany("""
+          INSERT INTO mac_locations(mac, device_id, if_index, vlan, port_name, source, last_seen_ts)
+          VALUES (?,?,?,?,?,?,?)
+          ON CONFLICT(mac, device_id, vlan) DO UPDATE SET
+            if_index=excluded.if_index, port_name=excluded.port_name,
+            source=excluded.source, last_seen_ts=excluded.last_seen_ts
+        """, rows)
+        if skip:
+            con.execute(f"DELETE FROM mac_locations WHERE device_id=? AND if_index IN ({','.join('?' * len(skip))})",
+                        (device_id, *skip))
+        con.execute("DELETE FROM mac_locations WHERE device_id=? AND last_seen_ts < ?",
+                    (device_id, now - RETENTION_S))
+        stored += len(rows)
+        uplinks += len(skip)
+    con.commit()
+    changed()
+    return {"macs": stored, "uplink_ports": uplinks}
+
+# ---------- in-memory index ----------
+class LocationIndex:
+    __slots__ = ("macs", "dev", "ifx", "vlan", "seen", "ports", "devices")
+
+    def __init__(self):
+        self.macs = array.array("Q")
+        self.dev = array.array("I")
+        self.ifx = array.array("I")
+        self.vlan = array.array("H")
+        self.seen = array.array("I")
+        self.ports: Dict[Tuple[int, int], str] = {}                                 # (device, ifIndex) -> name
+        self.devices: Dict[int, Tuple[Optional[str], Optional[str], Optional[int]]] = {}   # id -> (name, ip, site)
+
+    def __len__(self):
+        return len(self.macs)
+
+    def find(self, mac48: int) -> Optional[int]:
+        i = bisect_left(self.macs, mac48)
+        return i if i < len(self.macs) and self.macs[i] == mac48 else None
+
+    def location(self, i: int) -> Dict:
+        dev, ifx = self.dev[i], self.ifx[i]
+        name, ip, site_id = self.devices.get(dev, (None, None, None))
+        return {"device_id": dev, "device": name, "mgmt_ip": ip, "site_id": site_id, "if_index": ifx,
+                "port": self.ports.get((dev, ifx)), "vlan": self.vlan[i] or None, "last_seen_ts": self.seen[i]}
+
+def _build() -> LocationIndex:
+    idx = LocationIndex()
+    con = connect()
+    con.row_factory = None
+    try:
+        rows = con.execute("SELECT mac, device_id, if_index, vlan, last_seen_ts, port_name FROM mac_locations "
+                           "ORDER BY mac, last_seen_ts DESC").fetchall()
+        idx.devices = {r[0]: (r[1], r[2], r[3]) for r in con.execute(
+            "SELECT id, name, mgmt_ip, site_id FROM devices WHERE id IN (SELECT DISTINCT device_id FROM mac_locations)")}
+    finally:
+        con.close()
+    latest: Dict[int, int] = {}                 # switch -> its last walk
+    for r in rows:
+        if r[4] > latest.get(r[1], 0):
+            latest[r[1]] = r[4]
+    per_port = Counter((r[1], r[2]) for r in rows if r[4] >= latest[r[1]] - FRESH_S)
+    macs, dev, ifx, vlan, seen = idx.macs, idx.dev, idx.ifx, idx.vlan, idx.seen
+    prev = newest = -1
+    for mac, d, i, v, ts, name in rows:
+        if name:
+            idx.ports[(d, i)] = name
+        if mac == prev:
+            # seen on several switches / VLANs: among the recent sightings keep the most
+            # edge-like port, then the newest (rows come newest first per MAC)
+            j = len(macs) - 1
+            if ts < newest - FRESH_S or (per_port[(d, i)], -ts) >= (per_port[(dev[j], ifx[j])], -seen[j]):
+                continue
+            dev[j], ifx[j], vlan[j], seen[j] = d, i, v & 0xFFFF, ts
+            continue
+        prev, newest = mac, ts
+        macs.append(mac)
+        dev.append(d)
+        ifx.append(i)
+        vlan.append(v & 0xFFFF)
+        seen.append(ts)
+    return idx
+
+_index: Optional[LocationIndex] = None
+_dirty = True
+_building = False
+_lock = threading.Lock()
+
+def _rebuild():
+    global _index, _dirty, _building
+    try:
+        while True:
+            _dirty = False
+            t = time.perf_counter()
+            idx = _build()
+            metrics.observe("locate_index_build_seconds", time.perf_counter() - t)
+            metrics.gauge_add("locate_index_entries", (), len(idx) - (len(_index) if _index is not None else 0))
+            _index = idx
+            if not _dirty:
+                break
+    except Exception as e:
+        print("[locator] index rebuild failed:", e)
+    finally:
+        _building = False
+
+def index() -> LocationIndex:
+    global _building
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _building = True
+                _rebuild()
+    elif _dirty and not _building:
+        with _lock:
+            if not _building:
+                _building = True
+                threading.Thread(target=_rebuild, name="locate-index", daemon=True).start()
+    return _index if _index is not None else LocationIndex()
+
+def mark_dirty(_msg=None):
+    global _dirty
+    _dirty = True
+
+def changed():
+    """After writing mac_locations: refresh the index here and on the other workers."""
+    mark_dirty()
+    cluster.bus.send("locate.dirty")
+
+cluster.bus.on("locate.dirty", mark_dirty)
+
+# ---------- API ----------
+router = APIRouter(prefix="/api/locate", tags=["locate"])
+
+@router.get("/{mac}")
+def locate(
+    mac: str,
+    all: bool = Query(default=False, description="Also list every sighting (all switches / VLANs)"),
+    user = Depends(get_current_user)
+):
+    norm = normalize_mac(mac)
+    if norm is None:
+        raise HTTPException(400, "Invalid MAC address")
+    n = mac_int(norm)
+    idx = index()
+    i = idx.find(n)
+    loc = idx.location(i) if i is not None else None
+    is_admin, allowed = site_ids_for_user(user["email"], user["role"])
+    if loc is not None and not is_admin and loc["site_id"] not in allowed:
+        loc = None
+    out = {"mac": norm, "vendor": oui.vendor_for(norm), "location": loc}
+    if all:
+        con = connect()
+        try:
+            rows = con.execute("""
+              SELECT l.device_id, d.name AS device, d.mgmt_ip, d.site_id, l.if_index, l.port_name AS port,
+                     nullif(l.vlan, 0) AS vlan, l.source, l.last_seen_ts
+              FROM mac_locations l LEFT JOIN devices d ON d.id = l.device_id
+              WHERE l.mac = ? ORDER BY l.last_seen_ts DESC
+            """, (n,)).fetchall()
+        finally:
+            con.close()
+        out["sightings"] = [dict(r) for r in rows if is_admin or r["site_id"] in allowed]
+    return out
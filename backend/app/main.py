@@ -1,21 +1,90 @@
-from .bootstrap_admin import ensure_admin
+import asyncio, gc, time
+from contextlib import asynccontextmanager, contextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from .auth import router as auth_router
 from .users import router as users_router
 from .maps_api import router as maps_router
+from .map_media import router as map_media_router
 from .endpoints_api import router as endpoints_router
 from .snmp_scan_api import router as snmp_router
 from .bootstrap_admin import ensure_admin
+from . import metrics
 from .sites_api import router as sites_router
 from .devices_api import router as devices_router
+from .links_api import router as links_router, link_aging_loop
+from .placements_api import router as placements_router
+from .metrics import router as metrics_router, MetricsMiddleware
+from .debug_api import router as debug_router
+from .fastjson import CompressionMiddleware
+from .db import init_db
+from . import aiodb, cluster
+from .events import router as events_router, broker
+from .locator import router as locate_router
+from .snapshots_api import router as snapshots_router, snapshot_loop
+from .ingest_api import router as ingest_router, ingest_prune_loop
+from . import monitor
+from .collectors import collector_loop
+from . import sql_profile
 from . import unifi_api   # <--- add this
 
-app = FastAPI()
+# Importing this module only builds the app; everything with side effects
+# happens in lifespan(), one timed step at a time.
+
+@contextmanager
+def _step(timings: list, name: str):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t
+        timings.append((name, dt))
+        metrics.inc("startup_step_seconds", (("step", name),), dt)
+
+def bootstrap(timings: list = None):
+    """
+    Schema migrations and the default admin. With several workers the first one
+    through the lock does the work; the rest find the schema current.
+    """
+    timings = [] if timings is None else timings
+    t = time.perf_counter()
+    with cluster.file_lock("bootstrap"):
+        timings.append(("lock_wait", time.perf_counter() - t))
+        with _step(timings, "schema"):
+            init_db()
+        with _step(timings, "admin"):
+            ensure_admin()
+    return timings
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    t0 = time.perf_counter()
+    timings = []
+    bootstrap(timings)
+    with _step(timings, "events"):
+        loop = asyncio.get_running_loop()
+        broker.bind(loop)
+        cluster.bus.start(loop)
+    with _step(timings, "jobs"):
+        # periodic background jobs run in one worker only (see cluster.lead)
+        jobs = [link_aging_loop, collector_loop, snapshot_loop, ingest_prune_loop]
+        if monitor.ENABLED:
+            jobs.append(monitor.monitor_loop)
+        tasks = [asyncio.create_task(cluster.lead(jobs)),
+                 asyncio.create_task(aiodb.loop_lag_loop())]     # every worker
+    # everything allocated so far lives for the whole process; keep it out of
+    # full collections, which otherwise pause every thread while they rescan it
+    gc.freeze()
+    total = time.perf_counter() - t0
+    print(f"[startup] ready in {total * 1000:.0f} ms ("
+          + ", ".join(f"{name} {dt * 1000:.1f} ms" for name, dt in timings) + ")")
+    yield
+    for t in tasks:
+        t.cancel()
+    cluster.bus.stop()
 
-# Ensure there is always an admin user on startup
-ensure_admin()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,6 +93,10 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+if sql_profile.ENABLED:
+    app.add_middleware(sql_profile.SqlProfileMiddleware)
 
 @app.get("/")
 def root():
@@ -32,8 +105,17 @@ def root():
 app.include_router(auth_router)
 app.include_router(users_router)
 app.include_router(maps_router)
+app.include_router(map_media_router)
 app.include_router(endpoints_router)
 app.include_router(snmp_router)
 app.include_router(sites_router)
 app.include_router(devices_router)
+app.include_router(links_router)
+app.include_router(placements_router)
+app.include_router(metrics_router)
+app.include_router(debug_router)
+app.include_router(events_router)
+app.include_router(locate_router)
+app.include_router(snapshots_router)
+app.include_router(ingest_router)
 app.include_router(unifi_api.router)   # <--- add this
\ No newline at end of file
@@ -1,7 +1,11 @@
-import os, time
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+import os, tempfile, time
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from .db import EXPORT_DIR
+from .auth import require_min_role
+from .map_tiles import ImageTooLarge, MAX_UPLOAD_BYTES
+from .http_cache import cached_file
 
 router = APIRouter(prefix="/api/map", tags=["map"])
 
@@ -16,7 +20,7 @@ def _map_path():
     return None
 
 @router.get("")
-def map_status():
+def map_status(user = Depends(require_min_role("user"))):
     p = _map_path()
     if not p:
         return {"exists": False}
@@ -24,35 +28,46 @@ def map_status():
     return {"exists": True, "url": f"/api/map/image?v={ts}", "updated": ts}
 
 @router.get("/image")
-def map_image():
+def map_image(request: Request, v: Optional[int] = None, user = Depends(require_min_role("user"))):
     p = _map_path()
     if not p:
         raise HTTPException(404, "No map")
-    return FileResponse(p)
+    return cached_file(request, p, immutable=(v is not None and v == int(os.path.getmtime(p))))
 
-@router.post("")
-async def upload_map(file: UploadFile = File(...)):
-    if file.content_type not in ALLOWED:
-        raise HTTPException(400, "Only PNG or JPG allowed")
+def _replace_map(fileobj, ext: str):
+    # write beside the live file, then swap it in; the old map stays up until then
     os.makedirs(EXPORT_DIR, exist_ok=True)
-    ext = ALLOWED[file.content_type]
-    # remove any prior file
+    fd, tmp = tempfile.mkstemp(dir=EXPORT_DIR, prefix=".map.", suffix=f".{ext}")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            size = 0
+            while chunk := fileobj.read(1024 * 1024):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise ImageTooLarge(f"upload exceeds {MAX_UPLOAD_BYTES} bytes")
+                f.write(chunk)
+        os.replace(tmp, os.path.join(EXPORT_DIR, f"map.{ext}"))
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
     for e in ("png","jpg","jpeg"):
         old = os.path.join(EXPORT_DIR, f"map.{e}")
-        if os.path.exists(old):
+        if e != ext and os.path.exists(old):
             try: os.remove(old)
             except: pass
-    path = os.path.join(EXPORT_DIR, f"map.{ext}")
-    # stream write
-    with open(path, "wb") as f:
-        while True:
-            chunk = await file.read(1024 * 1024)
-            if not chunk: break
-            f.write(chunk)
+
+@router.post("")
+async def upload_map(file: UploadFile = File(...), user = Depends(require_min_role("admin"))):
+    if file.content_type not in ALLOWED:
+        raise HTTPException(400, "Only PNG or JPG allowed")
+    try:
+        await run_in_threadpool(_replace_map, file.file, ALLOWED[file.content_type])
+    except ImageTooLarge as e:
+        raise HTTPException(413, str(e))
     return {"ok": True}
 
 @router.delete("")
-def delete_map():
+def delete_map(user = Depends(require_min_role("admin"))):
     p = _map_path()
     if not p:
         return {"ok": True}
@@ -0,0 +1,274 @@
+import json, math, os, shutil, tempfile, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from .db import MAP_DIR, connect, map_image_path
+from .events import publish
+from . import cluster
+
+# All map image work runs on one background worker: validating uploads,
+# swapping them into place, then building the derived files below.
+#
+# Deep-zoom pyramid: level L is the image scaled by 2^(L - max_level), cut
+# into TILE x TILE tiles named {col}_{row}.{fmt}; level 0 is a single pixel.
+# Each upload gets its own version directory so tile URLs can be cached forever:
+#   MAP_DIR/tiles/{map_id}/{version}/{level}/{col}_{row}.{fmt}
+# Downscaled copies for lists and previews live next to it, keyed the same way:
+#   MAP_DIR/variants/{map_id}/{version}/w{size}.{fmt}
+TILE = 256
+INFO = "info.json"
+VARIANTS = (256, 1024, 2048)   # longest edge in px
+# the whole image is decoded and converted to RGBA (4 bytes/px), so 250 MP is ~1 GB in the worker
+MAX_PIXELS = int(os.getenv("MAP_MAX_PIXELS", str(250_000_000)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAP_MAX_UPLOAD_BYTES", str(256 * 1024 * 1024)))
+
+_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="map-tiles")
+_building: set = set()
+_lock = threading.Lock()
+
+def tiles_root(map_id: str) -> str:
+    return os.path.join(MAP_DIR, "tiles", map_id)
+
+def variants_root(map_id: str) -> str:
+    return os.path.join(MAP_DIR, "variants", map_id)
+
+def image_version(path: str) -> str:
+    return format(os.stat(path).st_mtime_ns, "x")
+
+class ImageTooLarge(ValueError):
+    pass
+
+def open_image(path: str):
+    """Image.open with the floorplan size limit checked before anything is decoded."""
+    from PIL import Image
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS     # Pillow's own bomb check, at the same limit
+    try:
+        img = Image.open(path)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    w, h = img.size
+    if w * h > MAX_PIXELS:
+        img.close()
+        raise ImageTooLarge(f"image is {w}x{h} px, more than MAP_MAX_PIXELS ({MAX_PIXELS})")
+    return img
+
+def _levels(w: int, h: int) -> int:
+    return max(0, math.ceil(math.log2(max(w, h, 1))))
+
+def build_pyramid(src: str, out_dir: str) -> Dict:
+    """Cut src into a tile pyramid under out_dir; info.json is written last and marks completion."""
+    from PIL import Image
+    img = open_image(src)
+    fmt = "jpg" if img.format == "JPEG" else "png"
+    img = img.convert("RGB" if fmt == "jpg" else "RGBA")
+    w, h = img.size
+    max_level = _levels(w, h)
+    tmp = out_dir + ".partial"
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    level = img
+    for lvl in range(max_level, -1, -1):
+        d = os.path.join(tmp, str(lvl))
+        os.makedirs(d, exist_ok=True)
+        lw, lh = level.size
+        for col in range(math.ceil(lw / TILE)):
+            for row in range(math.ceil(lh / TILE)):
+                box = (col * TILE, row * TILE, min(lw, (col + 1) * TILE), min(lh, (row + 1) * TILE))
+                tile = level.crop(box)
+                p = os.path.join(d, f"{col}_{row}.{fmt}")
+                if fmt == "jpg":
+                    tile.save(p, "JPEG", quality=85)
+                else:
+                    tile.save(p, "PNG", optimize=False)
+        if lvl:
+            level = level.resize((max(1, math.ceil(lw / 2)), max(1, math.ceil(lh / 2))), Image.LANCZOS)
+
+    info = {"width": w, "height": h, "tile_size": TILE, "max_level": max_level, "format": fmt}
+    with open(os.path.join(tmp, INFO), "w") as f:
+        json.dump(info, f)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp, out_dir)
+    return info
+
+def build_variants(src: str, out_dir: str):
+    """Write w{size}.{fmt} for each size in VARIANTS smaller than the source."""
+    from PIL import Image
+    img = open_image(src)
+    fmt = "jpg" if img.format == "JPEG" else "png"
+    if fmt == "jpg":
+        img.draft("RGB", (max(VARIANTS), max(VARIANTS)))   # let libjpeg downscale while decoding
+    img = img.convert("RGB" if fmt == "jpg" else "RGBA")
+    os.makedirs(out_dir, exist_ok=True)
+    for size in sorted(VARIANTS, reverse=True):
+        if max(img.size) <= size:
+            continue
+        img.thumbnail((size, size), Image.LANCZOS)
+        p = os.path.join(out_dir, f"w{size}.{fmt}")
+        img.save(p + ".tmp", "JPEG" if fmt == "jpg" else "PNG", **({"quality": 82} if fmt == "jpg" else {}))
+        os.replace(p + ".tmp", p)
+
+def variant_path(map_id: str, width: int) -> str:
+    """Smallest prebuilt variant at least `width` px wide for the current image ("" if none)."""
+    src = map_image_path(map_id)
+    if not src:
+        return ""
+    d = os.path.join(variants_root(map_id), image_version(src))
+    for size in sorted(VARIANTS):
+        if size < width:
+            continue
+        for fmt in ("jpg", "png"):
+            p = os.path.join(d, f"w{size}.{fmt}")
+            if os.path.exists(p):
+                return p
+    return ""
+
+def _drop_other_versions(root: str, version: str):
+    for v in os.listdir(root):
+        if v != version and not v.startswith(version + "."):
+            p = os.path.join(root, v)
+            if os.path.isdir(p):
+                shutil.rmtree(p, ignore_errors=True)
+            else:
+                os.remove(p)
+
+def write_status(con, map_id: str, status: str, w: Optional[int] = None, h: Optional[int] = None,
+                 error: Optional[str] = None):
+    con.execute("""UPDATE maps SET image_status=?, image_w=coalesce(?, image_w),
+                   image_h=coalesce(?, image_h), image_error=? WHERE id=?""",
+                (status, w, h, error, map_id))
+    con.commit()
+    publish(["maps", f"map:{map_id}"], {"type": "map.image", "id": map_id, "status": status},
+            key=("map.image", map_id))
+
+def set_status(map_id: str, status: str, w: Optional[int] = None, h: Optional[int] = None,
+               error: Optional[str] = None):
+    con = connect()
+    try:
+        write_status(con, map_id, status, w, h, error)
+    finally:
+        con.close()
+
+def _build(map_id: str, src: str, version: str):
+    root = tiles_root(map_id)
+    # other workers may have queued the same version; the first to lock it builds
+    fd = cluster.try_lock(os.path.join(root, f"{version}.lock"))
+    if fd is None:
+        with _lock:
+            _building.discard((map_id, version))
+        return
+    try:
+        # small variants first so list thumbnails show up before the pyramid is done
+        build_variants(src, os.path.join(variants_root(map_id), version))
+        _drop_other_versions(variants_root(map_id), version)
+        info = build_pyramid(src, os.path.join(root, version))
+        _drop_other_versions(root, version)
+        set_status(map_id, "ready", info["width"], info["height"])
+        print(f"[map_tiles] built pyramid for {map_id} ({version})")
+    except Exception as e:
+        print(f"[map_tiles] pyramid build failed for {map_id}:", e)
+        with open(os.path.join(root, f"{version}.failed"), "w") as f:
+            f.write(str(e))
+        set_status(map_id, "failed", error=f"derived images: {e}")
+    finally:
+        cluster.release(fd)
+        with _lock:
+            _building.discard((map_id, version))
+
+def schedule_build(map_id: str) -> Optional[str]:
+    """Queue a pyramid build for the map's current image; returns the version queued."""
+    src = map_image_path(map_id)
+    if not src:
+        return None
+    version = image_version(src)
+    with _lock:
+        if (map_id, version) in _building:
+            return version
+        _building.add((map_id, version))
+    os.makedirs(tiles_root(map_id), exist_ok=True)
+    _pool.submit(_build, map_id, src, version)
+    return version
+
+# ---------- uploads ----------
+def stage_upload(map_id: str, fileobj, ext: str) -> str:
+    """
+    Copy an upload to a hidden temp file beside the live image; returns its path.
+    Raises ImageTooLarge past MAX_UPLOAD_BYTES.
+    """
+    os.makedirs(MAP_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=MAP_DIR, prefix=f".{map_id}.", suffix=f".{ext}.upload")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            size = 0
+            while True:
+                chunk = fileobj.read(1024 * 1024)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise ImageTooLarge(f"upload exceeds {MAX_UPLOAD_BYTES} bytes")
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return tmp
+
+def _process_upload(map_id: str, pending: str, ext: str):
+    try:
+        set_status(map_id, "processing")
+        with open_image(pending) as img:
+            if img.format not in ("PNG", "JPEG"):
+                raise ValueError(f"unsupported image format {img.format}")
+            img.verify()
+        with open_image(pending) as img:   # verify() leaves the image unusable
+            w, h = img.size
+            img.load()                     # full decode catches truncated files
+        dest = map_image_path(map_id, ext)
+        os.replace(pending, dest)
+        for e in ("png", "jpg", "jpeg"):
+            old = map_image_path(map_id, e)
+            if e != ext and os.path.exists(old):
+                os.remove(old)
+        set_status(map_id, "processing", w, h)
+    except Exception as e:
+        # the previous image (if any) stays live
+        print(f"[map_tiles] rejected upload for {map_id}:", e)
+        if os.path.exists(pending):
+            os.remove(pending)
+        set_status(map_id, "failed", error=str(e) if isinstance(e, ImageTooLarge)
+                   else f"not a usable PNG/JPEG image ({type(e).__name__})")
+        return
+    version = image_version(dest)
+    with _lock:
+        _building.add((map_id, version))
+    os.makedirs(tiles_root(map_id), exist_ok=True)
+    _build(map_id, dest, version)
+
+def queue_upload(con, map_id: str, pending: str, ext: str):
+    write_status(con, map_id, "queued")
+    _pool.submit(_process_upload, map_id, pending, ext)
+
+def tile_info(map_id: str) -> Dict:
+    """Pyramid status for the current image; queues a build if one is missing."""
+    src = map_image_path(map_id)
+    if not src:
+        return {"status": "none"}
+    version = image_version(src)
+    root = tiles_root(map_id)
+    p = os.path.join(root, version, INFO)
+    if os.path.exists(p):
+        with open(p) as f:
+            info = json.load(f)
+        return {"status": "ready", "version": version, **info,
+                "url": f"/api/maps/{map_id}/tiles/{version}/{{level}}/{{col}}_{{row}}.{info['format']}"}
+    if os.path.exists(os.path.join(root, f"{version}.failed")):
+        return {"status": "failed", "version": version}
+    schedule_build(map_id)
+    return {"status": "pending", "version": version}
+
+def tile_path(map_id: str, version: str, level: int, col: int, row: int, fmt: str) -> str:
+    return os.path.join(tiles_root(map_id), version, str(level), f"{col}_{row}.{fmt}")
+
+def delete_tiles(map_id: str):
+    shutil.rmtree(tiles_root(map_id), ignore_errors=True)
+    shutil.rmtree(variants_root(map_id), ignore_errors=True)
@@ -1,23 +1,35 @@
-import os, time, uuid
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from fastapi.responses import FileResponse
+import os, re, time, uuid
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from .db import connect, map_image_path, MAP_DIR, get_setting, set_setting
 from .auth import require_min_role
+from . import aiodb, map_tiles
+from .http_cache import cached_file
+from .events import publish
 
 router = APIRouter(prefix="/api/maps", tags=["maps"])
 ALLOWED = {"image/png":"png", "image/jpeg":"jpg", "image/jpg":"jpg"}
+TILE_NAME = re.compile(r"^(\d+)_(\d+)\.(png|jpg)$")
 
 class CreateMapIn(BaseModel):
   name: str
 
+def _image_v(map_id: str) -> int:
+  path = map_image_path(map_id)
+  return int(os.path.getmtime(path)) if path and os.path.exists(path) else 0
+
 def _map_row(r):
-  return {"id": r["id"], "name": r["name"], "created_ts": r["created_ts"]}
+  v = _image_v(r["id"])
+  return {"id": r["id"], "name": r["name"], "created_ts": r["created_ts"],
+          "image_status": r["image_status"],
+          "thumb_url": f"/api/maps/{r['id']}/image?v={v}&w={map_tiles.VARIANTS[0]}" if v else None}
 
 @router.get("")
 def list_maps(user = Depends(require_min_role("user"))):
   con = connect()
-  rows = con.execute("SELECT id,name,created_ts FROM maps ORDER BY created_ts DESC").fetchall()
+  rows = con.execute("SELECT id,name,created_ts,image_status FROM maps ORDER BY created_ts DESC").fetchall()
   active = get_setting(con, "active_map_id")
   return {"maps": [_map_row(r) for r in rows], "active_id": active}
 
@@ -33,6 +45,7 @@ def create_map(body: CreateMapIn, user = Depends(require_min_role("admin"))):
   # if no active map yet, set this one active
   if not get_setting(con, "active_map_id"):
     set_setting(con, "active_map_id", mid)
+  publish(["maps"], {"type": "map.created", "id": mid})
   return {"ok": True, "id": mid}
 
 @router.get("/active")
@@ -41,8 +54,7 @@ def get_active(user = Depends(require_min_role("user"))):
   active = get_setting(con, "active_map_id")
   if not active:
     return {"id": None, "url": None}
-  path = map_image_path(active)
-  v = int(os.path.getmtime(path)) if path and os.path.exists(path) else 0
+  v = _image_v(active)
   return {"id": active, "url": f"/api/maps/{active}/image?v={v}" if v else None}
 
 @router.patch("/active")
@@ -55,43 +67,69 @@ def set_active(body: dict, user = Depends(require_min_role("admin"))):
   if not r:
     raise HTTPException(404, "Map not found")
   set_setting(con, "active_map_id", mid)
+  publish(["maps"], {"type": "map.activated", "id": mid}, key="map.activated")
   return {"ok": True}
 
-@router.post("/{map_id}/image")
+@router.post("/{map_id}/image", status_code=202)
 async def upload_map_image(map_id: str, file: UploadFile = File(...), user = Depends(require_min_role("admin"))):
   if file.content_type not in ALLOWED:
     raise HTTPException(400, "Only PNG or JPG allowed")
+  if await aiodb.fetchone("SELECT 1 FROM maps WHERE id=?", (map_id,)) is None:
+    raise HTTPException(404, "Map not found")
+  # the live image is only replaced once the worker has validated the new one
+  ext = ALLOWED[file.content_type]
+  try:
+    pending = await run_in_threadpool(map_tiles.stage_upload, map_id, file.file, ext)
+  except map_tiles.ImageTooLarge as e:
+    raise HTTPException(413, str(e))
+  await aiodb.run(map_tiles.queue_upload, map_id, pending, ext)
+  return {"ok": True, "status": "queued"}
+
+@router.get("/{map_id}/image/status")
+def get_map_image_status(map_id: str, user = Depends(require_min_role("user"))):
   con = connect()
-  r = con.execute("SELECT 1 FROM maps WHERE id=?", (map_id,)).fetchone()
+  r = con.execute("SELECT image_status,image_w,image_h,image_error FROM maps WHERE id=?", (map_id,)).fetchone()
   if not r:
     raise HTTPException(404, "Map not found")
-  # remove any prior image for this map
-  for e in ("png","jpg","jpeg"):
-    p = map_image_path(map_id, e)
-    if os.path.exists(p):
-      try: os.remove(p)
-      except: pass
-  ext = ALLOWED[file.content_type]
-  dest = map_image_path(map_id, ext)
-  os.makedirs(os.path.dirname(dest), exist_ok=True)
-  with open(dest, "wb") as f:
-    while True:
-      chunk = await file.read(1024*1024)
-      if not chunk: break
-      f.write(chunk)
-  return {"ok": True}
+  return {"status": r["image_status"] or ("ready" if map_image_path(map_id) else "none"),
+          "width": r["image_w"], "height": r["image_h"], "error": r["image_error"],
+          "v": _image_v(map_id) or None}
 
 @router.get("/{map_id}/image")
-def get_map_image(map_id: str, user = Depends(require_min_role("user"))):
+def get_map_image(map_id: str, request: Request, v: Optional[int] = None, w: Optional[int] = None,
+                  user = Depends(require_min_role("user"))):
   p = map_image_path(map_id)
   if not p or not os.path.exists(p):
     raise HTTPException(404, "No image for this map")
-  return FileResponse(p)
+  # the URL is only immutable if it names the image that is actually on disk
+  current = v is not None and v == int(os.path.getmtime(p))
+  if w:
+    vp = map_tiles.variant_path(map_id, w)
+    if vp:
+      return cached_file(request, vp, immutable=current)
+    map_tiles.tile_info(map_id)   # queues a build for images that predate variants
+    current = False
+  return cached_file(request, p, immutable=current)
+
+@router.get("/{map_id}/tiles")
+def get_map_tiles(map_id: str, user = Depends(require_min_role("user"))):
+  return map_tiles.tile_info(map_id)
+
+@router.get("/{map_id}/tiles/{version}/{level}/{name}")
+def get_map_tile(map_id: str, version: str, level: int, name: str, request: Request, user = Depends(require_min_role("user"))):
+  m = TILE_NAME.match(name)
+  if not m or not re.fullmatch(r"[0-9a-f]{1,32}", map_id) or not re.fullmatch(r"[0-9a-f]+", version):
+    raise HTTPException(404, "No such tile")
+  p = map_tiles.tile_path(map_id, version, level, int(m.group(1)), int(m.group(2)), m.group(3))
+  if not os.path.exists(p):
+    raise HTTPException(404, "No such tile")
+  return cached_file(request, p, immutable=True)
 
 @router.delete("/{map_id}")
 def delete_map(map_id: str, user = Depends(require_min_role("admin"))):
   con = connect()
   con.execute("DELETE FROM maps WHERE id=?", (map_id,))
+  con.execute("DELETE FROM map_placements WHERE map_id=?", (map_id,))
   con.commit()
   # delete files
   for e in ("png","jpg","jpeg"):
@@ -99,8 +137,10 @@ def delete_map(map_id: str, user = Depends(require_min_role("admin"))):
     if p and os.path.exists(p):
       try: os.remove(p)
       except: pass
+  map_tiles.delete_tiles(map_id)
   # clear active if it was this one
   active = get_setting(con, "active_map_id")
   if active == map_id:
     set_setting(con, "active_map_id", "")
+  publish(["maps", f"map:{map_id}"], {"type": "map.deleted", "id": map_id})
   return {"ok": True}
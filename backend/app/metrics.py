@@ -0,0 +1,212 @@
+import bisect, contextvars, os, threading, time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+# Prometheus-style counters, gauges and histograms with no external deps.
+#
+# Every thread writes only into its own shard (plain dicts, no locks on the
+# hot path); a scrape sums the shards. Counter/gauge values are floats,
+# histograms are [bucket counts..., +Inf count, sum].
+
+Labels = Tuple[Tuple[str, str], ...]
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+_HELP = {
+    "http_requests_total": ("counter", "HTTP requests by route and status"),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency"),
+    "http_requests_in_flight": ("gauge", "HTTP requests currently being served"),
+    "sqlite_queries_total": ("counter", "SQLite statements executed, by route"),
+    "sqlite_query_seconds_total": ("counter", "Time spent in SQLite execute calls, by route"),
+    "sqlite_query_duration_seconds": ("histogram", "SQLite execute latency"),
+    "snmp_probes_total": ("counter", "SNMP GET probes by result"),
+    "snmp_probe_rtt_seconds": ("histogram", "SNMP GET round-trip time for answered probes"),
+    "snmp_key_derivations_total": ("counter", "SNMPv3 password-to-key derivations (cache misses)"),
+    "snmp_v3_reports_total": ("counter", "SNMPv3 reports received, by report type"),
+    "unifi_request_duration_seconds": ("histogram", "UniFi controller call latency"),
+    "auvik_request_duration_seconds": ("histogram", "Auvik API call latency, by listing"),
+    "auvik_retries_total": ("counter", "Auvik API calls retried, by HTTP status (or connection error)"),
+    "bcrypt_duration_seconds": ("histogram", "bcrypt hash/verify time"),
+    "monitor_probes_total": ("counter", "Reachability probes by result"),
+    "monitor_probe_rtt_seconds": ("histogram", "Reachability probe round-trip time"),
+    "monitor_transitions_total": ("counter", "Reachability state transitions by new state"),
+    "monitor_targets": ("gauge", "Devices currently monitored"),
+    "locate_index_build_seconds": ("histogram", "Time to rebuild the in-memory MAC location index"),
+    "locate_index_entries": ("gauge", "MACs in the in-memory location index"),
+    "topology_snapshots_total": ("counter", "Topology snapshots written, by kind (full/delta)"),
+    "topology_snapshot_bytes_total": ("counter", "Compressed bytes of topology snapshots written, by kind"),
+    "topology_snapshot_seconds": ("histogram", "Time to compute and store a topology snapshot"),
+    "ingest_batches_total": ("counter", "Pushed agent batches, by result (ok/duplicate/rejected/error)"),
+    "ingest_records_total": ("counter", "Records applied from agent batches, by type"),
+    "ingest_queue_batches": ("gauge", "Agent batches waiting for the ingest writer"),
+    "ingest_commit_seconds": ("histogram", "Ingest group commit duration"),
+    "ingest_group_batches": ("histogram", "Agent batches applied per group commit"),
+    "collector_runs_total": ("counter", "Collector runs by endpoint kind and result"),
+    "collector_run_seconds": ("histogram", "Collector run duration by endpoint kind"),
+    "db_executor_wait_seconds": ("histogram", "Time async DB calls waited for a free DB thread"),
+    "event_loop_lag_seconds": ("histogram", "How late the event loop woke a sleeping task"),
+    "startup_step_seconds": ("counter", "Time spent in each startup step"),
+    "http_response_bytes_total": ("counter", "Compressed response bytes sent, by encoding"),
+    "http_response_uncompressed_bytes_total": ("counter", "Response bytes before compression, by encoding"),
+}
+
+_buckets: Dict[str, Tuple[float, ...]] = {}
+_shards: List[Dict] = []
+_shards_lock = threading.Lock()
+_local = threading.local()
+
+def _shard() -> Dict:
+    s = getattr(_local, "shard", None)
+    if s is None:
+        s = {"c": {}, "h": {}}
+        with _shards_lock:        # once per thread
+            _shards.append(s)
+        _local.shard = s
+    return s
+
+def inc(name: str, labels: Labels = (), value: float = 1.0):
+    c = _shard()["c"]
+    key = (name, labels)
+    c[key] = c.get(key, 0.0) + value
+
+# gauges are counters that also go down; per-thread deltas still sum correctly
+gauge_add = inc
+
+def observe(name: str, value: float, labels: Labels = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+    h = _shard()["h"]
+    key = (name, labels)
+    row = h.get(key)
+    if row is None:
+        _buckets.setdefault(name, buckets)
+        row = h[key] = [0] * (len(buckets) + 1) + [0.0]
+    row[bisect.bisect_left(buckets, value)] += 1
+    row[-1] += value
+
+@contextmanager
+def timer(name: str, labels: Labels = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t, labels, buckets)
+
+# ---------- per-request SQL accounting ----------
+# The HTTP middleware binds a small dict for the request; threadpool workers
+# inherit the context, so queries run by sync handlers land in it too.
+_request: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("nf_request_metrics", default=None)
+
+def record_query(seconds: float):
+    observe("sqlite_query_duration_seconds", seconds, (), QUERY_BUCKETS)
+    req = _request.get()
+    if req is None:
+        labels = (("route", "background"),)
+        inc("sqlite_queries_total", labels)
+        inc("sqlite_query_seconds_total", labels, seconds)
+    else:
+        req["queries"] += 1
+        req["query_s"] += seconds
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: latency, status and in-flight per route template."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def _send(msg):
+            if msg["type"] == "http.response.start":
+                status[0] = msg["status"]
+            await send(msg)
+
+        req = {"queries": 0, "query_s": 0.0}
+        token = _request.set(req)
+        gauge_add("http_requests_in_flight", (), 1)
+        t = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            dt = time.perf_counter() - t
+            gauge_add("http_requests_in_flight", (), -1)
+            _request.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            inc("http_requests_total", (("method", method), ("route", route), ("status", str(status[0]))))
+            observe("http_request_duration_seconds", dt, (("method", method), ("route", route)))
+            if req["queries"]:
+                labels = (("route", route),)
+                inc("sqlite_queries_total", labels, req["queries"])
+                inc("sqlite_query_seconds_total", labels, req["query_s"])
+
+# ---------- exposition ----------
+def _fmt_labels(labels: Labels, extra: Labels = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    esc = lambda v: v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+def snapshot() -> Tuple[Dict, Dict]:
+    """Sum all thread shards into (counters, histograms)."""
+    counters: Dict = {}
+    hists: Dict = {}
+    with _shards_lock:
+        shards = list(_shards)
+    for s in shards:
+        for key, v in list(s["c"].items()):
+            counters[key] = counters.get(key, 0.0) + v
+        for key, row in list(s["h"].items()):
+            row = list(row)
+            acc = hists.get(key)
+            if acc is None:
+                hists[key] = row
+            else:
+                for i, v in enumerate(row):
+                    acc[i] += v
+    return counters, hists
+
+def render() -> str:
+    counters, hists = snapshot()
+    by_name: Dict[str, List] = {}
+    for (name, labels), v in counters.items():
+        by_name.setdefault(name, []).append((labels, v))
+    for (name, labels), row in hists.items():
+        by_name.setdefault(name, []).append((labels, row))
+
+    out: List[str] = []
+    for name in sorted(by_name):
+        kind, help_ = _HELP.get(name, ("histogram" if name in _buckets else "counter", name))
+        out.append(f"# HELP {name} {help_}")
+        out.append(f"# TYPE {name} {kind}")
+        for labels, v in sorted(by_name[name]):
+            if kind != "histogram":
+                out.append(f"{name}{_fmt_labels(labels)} {_num(v)}")
+                continue
+            cum = 0
+            for le, n in zip(_buckets[name], v):
+                cum += n
+                out.append(f"{name}_bucket{_fmt_labels(labels, (('le', repr(le)),))} {cum}")
+            cum += v[-2]
+            out.append(f"{name}_bucket{_fmt_labels(labels, (('le', '+Inf'),))} {cum}")
+            out.append(f"{name}_sum{_fmt_labels(labels)} {_num(v[-1])}")
+            out.append(f"{name}_count{_fmt_labels(labels)} {cum}")
+    return "\n".join(out) + "\n"
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics(request: Request):
+    if METRICS_TOKEN:
+        if request.headers.get("Authorization", "") != f"Bearer {METRICS_TOKEN}":
+            raise HTTPException(401, "Not authenticated")
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,229 @@
+import asyncio, ipaddress, os, random, socket, struct, time
+from typing import Dict, List, Optional, Tuple
+from . import aiodb, metrics, snmp
+from .events import publish, site_topics
+
+# Reachability monitor for devices with a mgmt_ip.
+#
+# Each device is probed once per MONITOR_INTERVAL_S with a single SNMP GET
+# for sysUpTime.0 sent from one non-blocking UDP socket on the event loop; any
+# well-formed response (even an SNMP error or a v3 report) counts as "up".
+# SNMPv3 is used when MONITOR_SNMP_VERSION=3 (MONITOR_SNMP_USER,
+# MONITOR_SNMP_AUTH_PROTO / _AUTH_KEY, MONITOR_SNMP_PRIV_PROTO / _PRIV_KEY);
+# the first probe of an agent is the discovery request, later ones reuse the
+# engine and keys cached in app/snmp.py. Devices get a fixed random phase
+# inside the interval, so the probes go out in small batches every tick
+# instead of one burst. Samples feed a debounced state
+# machine (MONITOR_RISE successes / MONITOR_FALL failures in a row) and only
+# transitions hit the database: the current state in device_status, plus one
+# device_status_history row per change.
+
+ENABLED = os.getenv("MONITOR_ENABLED", "1").lower() in ("1", "true", "yes")
+INTERVAL_S = float(os.getenv("MONITOR_INTERVAL_S", "30"))
+TIMEOUT_S = float(os.getenv("MONITOR_TIMEOUT_S", "2"))
+RISE = int(os.getenv("MONITOR_RISE", "2"))
+FALL = int(os.getenv("MONITOR_FALL", "3"))
+REFRESH_S = float(os.getenv("MONITOR_REFRESH_S", "300"))   # reload the device list
+TICK_S = 0.25
+
+SYS_UPTIME = (1, 3, 6, 1, 2, 1, 1, 3, 0)
+
+# ---------- state ----------
+class _State:
+    __slots__ = ("status", "ok", "fail")
+
+    def __init__(self, status: str = "unknown"):
+        self.status = status
+        self.ok = 0
+        self.fail = 0
+
+    def sample(self, up: bool) -> Optional[str]:
+        """Feed one probe result; returns the new status on a transition."""
+        if up:
+            self.ok, self.fail = self.ok + 1, 0
+            if self.status != "up" and (self.status == "unknown" or self.ok >= RISE):
+                self.status = "up"
+                return "up"
+        else:
+            self.ok, self.fail = 0, self.fail + 1
+            if self.status != "down" and self.fail >= FALL:
+                self.status = "down"
+                return "down"
+        return None
+
+class _Protocol(asyncio.DatagramProtocol):
+    def __init__(self, monitor: "Monitor"):
+        self.monitor = monitor
+
+    def datagram_received(self, data, addr):
+        self.monitor.on_response(data, addr[0])
+
+    def error_received(self, exc):
+        pass   # ICMP unreachable etc.; the probe simply times out
+
+class Monitor:
+    def __init__(self):
+        try:
+            self.creds = snmp.Credentials.from_env("MONITOR_SNMP_")
+        except ValueError as e:
+            print("[monitor] invalid MONITOR_SNMP_* settings, monitor disabled:", e)
+            self.creds = None
+        self.prefix, self.suffix = snmp.v2c_template(self.creds.community if self.creds else "", SYS_UPTIME)
+        self.targets: List[Tuple[float, int, str, Optional[int]]] = []   # (phase, device id, ip, site id), by phase
+        self.states: Dict[int, _State] = {}
+        self.pending: Dict[int, Tuple[int, str, float]] = {}             # request id -> (device id, ip, sent)
+        self.transitions: List[Tuple[int, str, Optional[str], int]] = []     # (device id, status, prev, ts)
+        self.transports: Dict[int, asyncio.DatagramTransport] = {}
+
+    # ---- device list ----
+    def _load_targets(self, con):
+        rows = con.execute("""
+          SELECT d.id, d.mgmt_ip, d.site_id, s.status
+          FROM devices d LEFT JOIN device_status s ON s.device_id = d.id
+          WHERE d.mgmt_ip IS NOT NULL AND d.mgmt_ip <> ''
+        """).fetchall()
+        out = []
+        for r in rows:
+            try:
+                ip = str(ipaddress.ip_address(r["mgmt_ip"].strip()))
+            except ValueError:
+                continue
+            # stable per-device phase so a device is probed at the same offset every cycle
+            out.append((random.Random(r["id"]).random() * INTERVAL_S, r["id"], ip, r["site_id"], r["status"]))
+        return out
+
+    async def refresh(self):
+        rows = await aiodb.run(self._load_targets)
+        states = {}
+        for _, dev_id, _, _, status in rows:
+            states[dev_id] = self.states.get(dev_id) or _State(status or "unknown")
+        metrics.gauge_add("monitor_targets", (), len(rows) - len(self.targets))
+        self.targets = sorted(r[:4] for r in rows)
+        self.states = states
+
+    # ---- probing ----
+    async def _open(self, family: int):
+        loop = asyncio.get_running_loop()
+        local = ("0.0.0.0", 0) if family == socket.AF_INET else ("::", 0)
+        transport, _ = await loop.create_datagram_endpoint(lambda: _Protocol(self), local_addr=local, family=family)
+        self.transports[family] = transport
+
+    def send(self, dev_id: int, ip: str):
+        family = socket.AF_INET6 if ":" in ip else socket.AF_INET
+        transport = self.transports.get(family)
+        if transport is None:
+            return
+        rid = snmp.next_id()
+        if self.creds.version == "3":
+            msg = snmp.encode_get(self.creds, (SYS_UPTIME,), rid, snmp.AGENTS.get((ip, snmp.PORT)))
+        else:
+            msg = self.prefix + struct.pack(">I", rid) + self.suffix
+        self.pending[rid] = (dev_id, ip, time.monotonic())
+        transport.sendto(msg, (ip, snmp.PORT))
+
+    def on_response(self, data: bytes, src: str):
+        rid = snmp.response_id(data)
+        p = self.pending.get(rid) if rid is not None else None
+        if p is None or p[1] != src:
+            return
+        if self.creds.version == "3":
+            try:
+                snmp.learn((src, snmp.PORT), snmp.decode(data, self.creds))
+            except snmp.SnmpError:
+                return          # forged or corrupt; the probe times out instead
+        del self.pending[rid]
+        metrics.inc("monitor_probes_total", (("result", "up"),))
+        metrics.observe("monitor_probe_rtt_seconds", time.monotonic() - p[2])
+        self._sample(p[0], True)
+
+    def expire(self, now: float):
+        cutoff = now - TIMEOUT_S
+        dead = [rid for rid, p in self.pending.items() if p[2] < cutoff]
+        for rid in dead:
+            dev_id = self.pending.pop(rid)[0]
+            metrics.inc("monitor_probes_total", (("result", "timeout"),))
+            self._sample(dev_id, False)
+
+    def _sample(self, dev_id: int, up: bool):
+        st = self.states.get(dev_id)
+        if st is None:
+            return
+        prev = st.status
+        new = st.sample(up)
+        if new:
+            self.transitions.append((dev_id, new, prev, int(time.time())))
+
+    # ---- persistence ----
+    def _write(self, con, batch):
+        con.executemany("""
+          INSERT INTO device_status(device_id, status, since_ts) VALUES (?,?,?)
+          ON CONFLICT(device_id) DO UPDATE SET status=excluded.status, since_ts=excluded.since_ts
+        """, [(d, s, ts) for d, s, _, ts in batch])
+        con.executemany("INSERT INTO device_status_history(device_id, ts, status, prev_status) VALUES (?,?,?,?)",
+                        [(d, ts, s, prev) for d, s, prev, ts in batch])
+        con.commit()
+
+    async def flush(self):
+        if not self.transitions:
+            return
+        batch, self.transitions = self.transitions, []
+        try:
+            await aiodb.run(self._write, batch)
+        except Exception as e:
+            print("[monitor] failed to store transitions:", e)
+            return
+        site_of = {t[1]: t[3] for t in self.targets}
+        for dev_id, status, prev, ts in batch:
+            metrics.inc("monitor_transitions_total", (("to", status),))
+            publish(site_topics(site_of.get(dev_id)),
+                    {"type": "device.status", "id": dev_id, "status": status, "since_ts": ts},
+                    key=("device.status", dev_id))
+
+    async def run(self):
+        if self.creds is None:
+            return
+        await self._open(socket.AF_INET)
+        try:
+            await self._open(socket.AF_INET6)
+        except OSError:
+            pass
+        await self.refresh()
+        print(f"[monitor] probing {len(self.targets)} devices every {INTERVAL_S:g}s (SNMPv{self.creds.version})")
+        next_refresh = time.monotonic() + REFRESH_S
+        cycle_start = time.monotonic()
+        i = 0
+        try:
+            while True:
+                now = time.monotonic()
+                elapsed = now - cycle_start
+                if elapsed >= INTERVAL_S:
+                    # finish the previous cycle (phases that fell between the last tick and
+                    # the boundary), then restart by phase: the list may change on refresh
+                    for _, dev_id, ip, _ in self.targets[i:]:
+                        self.send(dev_id, ip)
+                    cycle_start += INTERVAL_S * int(elapsed // INTERVAL_S)
+                    elapsed = now - cycle_start
+                    i = 0
+                    if now >= next_refresh:
+                        await self.refresh()
+                        next_refresh = now + REFRESH_S
+                while i < len(self.targets) and self.targets[i][0] <= elapsed:
+                    _, dev_id, ip, _ = self.targets[i]
+                    self.send(dev_id, ip)
+                    i += 1
+                self.expire(now)
+                await self.flush()
+                await asyncio.sleep(TICK_S * random.uniform(0.8, 1.2))
+        finally:
+            for t in self.transports.values():
+                t.close()
+
+monitor = Monitor()
+
+async def monitor_loop():
+    try:
+        await monitor.run()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print("[monitor] stopped:", e)
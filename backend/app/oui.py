@@ -0,0 +1,243 @@
+"""
+MAC vendor lookup from the IEEE registries (MA-L /24, MA-M /28, MA-S /36).
+
+The CSVs published by the IEEE are compiled into one small binary file of
+sorted integer arrays (see build()). Loading it is a few array.frombytes()
+calls; a lookup is one binary search in the MA-L table, plus one in the
+MA-M / MA-S tables only for the /24 blocks the IEEE registration authority
+sub-allocates.
+
+    python -m app.oui build --fetch                # download the registries and compile
+    python -m app.oui build oui.csv mam.csv oui36.csv --out oui.bin
+    python -m app.oui lookup f0:9f:c2:12:34:56
+
+The index is read from EXPORT_DIR/oui.bin if present (so it can be refreshed
+on a running install) and otherwise from app/data/oui.bin, which the
+Dockerfile builds into the image. Without either, lookups return None.
+"""
+import array, csv, io, os, struct, sys, threading
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+from .db import EXPORT_DIR
+
+SOURCES = {
+    "MA-L": "https://standards-oui.ieee.org/oui/oui.csv",
+    "MA-M": "https://standards-oui.ieee.org/oui28/mam.csv",
+    "MA-S": "https://standards-oui.ieee.org/oui36/oui36.csv",
+}
+BUNDLED_PATH = os.path.join(os.path.dirname(__file__), "data", "oui.bin")
+LOCAL_PATH = os.path.join(EXPORT_DIR, "oui.bin")
+
+_MAGIC = b"NFOUI1"
+_BITS = {6: 24, 7: 28, 9: 36}           # assignment hex digits -> prefix bits
+_SUBALLOCATED = 0xFFFFFFFF              # vendor index marking an MA-L block split into MA-M/MA-S
+
+_SPLIT = object()                       # memo marker: resolve through the MA-M / MA-S tables
+MEMO_MAX = 65536
+
+class OuiIndex:
+    __slots__ = ("l_keys", "l_vendor", "m_keys", "m_vendor", "s_keys", "s_vendor", "names", "memo")
+
+    def __init__(self, tables: Dict[int, Tuple[array.array, array.array]], names: List[str]):
+        self.l_keys, self.l_vendor = tables[24]
+        self.m_keys, self.m_vendor = tables[28]
+        self.s_keys, self.s_vendor = tables[36]
+        self.names = names
+        # "aa:bb:cc" -> vendor for recently seen /24s; ingestion batches repeat a few
+        # vendors over and over, so most lookups never reach the binary search
+        self.memo: Dict[str, object] = {}
+
+    def __len__(self):
+        return len(self.l_keys) + len(self.m_keys) + len(self.s_keys)
+
+    def lookup_int(self, mac48: int) -> Optional[str]:
+        k = mac48 >> 24
+        keys = self.l_keys
+        i = bisect_left(keys, k)
+        if i == len(keys) or keys[i] != k:
+            return None
+        v = self.l_vendor[i]
+        if v != _SUBALLOCATED:
+            return self.names[v]
+        for keys, vendors, shift in ((self.s_keys, self.s_vendor, 12), (self.m_keys, self.m_vendor, 20)):
+            k = mac48 >> shift
+            i = bisect_left(keys, k)
+            if i < len(keys) and keys[i] == k:
+                return self.names[vendors[i]]
+        return None
+
+    def lookup(self, mac: str) -> Optional[str]:
+        """Vendor for a normalized 'aa:bb:cc:dd:ee:ff' MAC."""
+        head = mac[:8]
+        v = self.memo.get(head, _SPLIT)
+        if v is not _SPLIT:
+            return v
+        try:
+            n = int(mac.replace(":", ""), 16)
+        except ValueError:
+            return None
+        k = n >> 24
+        i = bisect_left(self.l_keys, k)
+        if i == len(self.l_keys) or self.l_keys[i] != k:
+            v = None
+        elif self.l_vendor[i] != _SUBALLOCATED:
+            v = self.names[self.l_vendor[i]]
+        else:
+            return self.lookup_int(n)       # finer-grained block: not memoizable by /24
+        if len(self.memo) >= MEMO_MAX:
+            self.memo.clear()
+        self.memo[head] = v
+        return v
+
+# ---------- file format ----------
+# magic, byte order flag, then for 24/28/36 bits: count + keys + vendor ids,
+# then the vendor names as one newline-separated UTF-8 blob.
+def _write(path: str, tables: Dict[int, Tuple[array.array, array.array]], names: List[str]):
+    tmp = path + ".tmp"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(tmp, "wb") as f:
+        f.write(_MAGIC + (b"L" if sys.byteorder == "little" else b"B"))
+        for bits in (24, 28, 36):
+            keys, vendors = tables[bits]
+            f.write(struct.pack("<I", len(keys)))
+            f.write(keys.tobytes())
+            f.write(vendors.tobytes())
+        blob = "\n".join(names).encode()
+        f.write(struct.pack("<II", len(names), len(blob)))
+        f.write(blob)
+    os.replace(tmp, path)
+
+def _read(path: str) -> OuiIndex:
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(_MAGIC)] != _MAGIC:
+        raise ValueError(f"{path}: not an OUI index")
+    swap = data[len(_MAGIC):len(_MAGIC) + 1] != (b"L" if sys.byteorder == "little" else b"B")
+    pos = len(_MAGIC) + 1
+    tables = {}
+    for bits in (24, 28, 36):
+        (n,) = struct.unpack_from("<I", data, pos)
+        pos += 4
+        keys = array.array("Q" if bits == 36 else "I")
+        vendors = array.array("I")
+        for arr in (keys, vendors):
+            size = n * arr.itemsize
+            arr.frombytes(data[pos:pos + size])
+            pos += size
+            if swap:
+                arr.byteswap()
+        tables[bits] = (keys, vendors)
+    n_names, blob_len = struct.unpack_from("<II", data, pos)
+    pos += 8
+    names = data[pos:pos + blob_len].decode().split("\n") if n_names else []
+    return OuiIndex(tables, names)
+
+# ---------- compile from IEEE CSVs ----------
+def _rows(text: str) -> Iterable[Tuple[int, int, str]]:
+    """(prefix bits, prefix value, organization) from one IEEE registry CSV."""
+    for row in csv.DictReader(io.StringIO(text)):
+        a = (row.get("Assignment") or "").strip()
+        org = " ".join((row.get("Organization Name") or "").split())
+        bits = _BITS.get(len(a))
+        if bits and org:
+            try:
+                yield bits, int(a, 16), org
+            except ValueError:
+                continue
+
+def build(csv_texts: Iterable[str], out: str) -> int:
+    entries: Dict[int, Dict[int, str]] = {24: {}, 28: {}, 36: {}}
+    for text in csv_texts:
+        for bits, prefix, org in _rows(text):
+            entries[bits][prefix] = org
+    # MA-L blocks that hold MA-M / MA-S sub-assignments resolve through the finer tables
+    for bits in (28, 36):
+        for prefix in entries[bits]:
+            entries[24][prefix >> (bits - 24)] = None
+    names: List[str] = []
+    name_ids: Dict[str, int] = {}
+    tables = {}
+    for bits in (24, 28, 36):
+        keys = array.array("Q" if bits == 36 else "I")
+        vendors = array.array("I")
+        for prefix in sorted(entries[bits]):
+            org = entries[bits][prefix]
+            keys.append(prefix)
+            if org is None:
+                vendors.append(_SUBALLOCATED)
+            else:
+                if org not in name_ids:
+                    name_ids[org] = len(names)
+                    names.append(org)
+                vendors.append(name_ids[org])
+        tables[bits] = (keys, vendors)
+    _write(out, tables, names)
+    return sum(len(t[0]) for t in tables.values())
+
+# ---------- process-wide index ----------
+_index: Optional[OuiIndex] = None
+_loaded = False
+_lock = threading.Lock()
+
+def index() -> Optional[OuiIndex]:
+    global _index, _loaded
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                for path in (LOCAL_PATH, BUNDLED_PATH):
+                    if os.path.exists(path):
+                        try:
+                            _index = _read(path)
+                            print(f"[oui] loaded {len(_index)} prefixes from {path}")
+                            break
+                        except Exception as e:
+                            print(f"[oui] could not read {path}:", e)
+                else:
+                    print("[oui] no OUI index found; vendor enrichment disabled (python -m app.oui build --fetch)")
+                _loaded = True
+    return _index
+
+def reload():
+    global _loaded
+    with _lock:
+        _loaded = False
+    return index()
+
+def vendor_for(mac: Optional[str]) -> Optional[str]:
+    idx = index()
+    return idx.lookup(mac) if idx is not None and mac else None
+
+def _main(argv=None):
+    import argparse, urllib.request
+    ap = argparse.ArgumentParser(prog="python -m app.oui")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="compile IEEE registry CSVs into the binary index")
+    b.add_argument("csv", nargs="*", help="registry CSV files (MA-L, MA-M, MA-S)")
+    b.add_argument("--fetch", action="store_true", help="download the registries from the IEEE")
+    b.add_argument("--out", default=LOCAL_PATH)
+    lk = sub.add_parser("lookup")
+    lk.add_argument("mac", nargs="+")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "build":
+        texts = []
+        for path in args.csv:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                texts.append(f.read())
+        if args.fetch:
+            for reg, url in SOURCES.items():
+                req = urllib.request.Request(url, headers={"User-Agent": "netfusion-oui/1"})
+                with urllib.request.urlopen(req, timeout=60) as r:
+                    texts.append(r.read().decode("utf-8", errors="replace"))
+                print(f"[oui] fetched {reg}")
+        if not texts:
+            ap.error("give registry CSVs or --fetch")
+        n = build(texts, args.out)
+        print(f"[oui] wrote {n} prefixes to {args.out}")
+    else:
+        from .db import normalize_mac
+        for m in args.mac:
+            print(m, vendor_for(normalize_mac(m)))
+
+if __name__ == "__main__":
+    _main()
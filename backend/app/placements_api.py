@@ -0,0 +1,117 @@
+from typing import Optional, List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field
+from .auth import get_current_user, require_min_role
+from .db import connect, site_ids_for_user
+from .events import publish
+from .links_api import existing_device_ids
+
+router = APIRouter(prefix="/api/maps", tags=["placements"])
+
+# above this many placements in the viewport, return clusters instead of devices
+CLUSTER_THRESHOLD = 400
+# cluster cell size in screen pixels (converted to map pixels via `scale`)
+CLUSTER_CELL_PX = 64
+
+class PlacementIn(BaseModel):
+    device_id: int
+    x: float = Field(ge=0)      # image pixels; cluster cells assume x, y >= 0
+    y: float = Field(ge=0)
+    floor: Optional[int] = None
+
+class PlacementsIn(BaseModel):
+    placements: List[PlacementIn]
+
+def _viewport_where(map_no, x0, y0, x1, y1, floor, user):
+    """SQL fragment + params selecting placements inside the rectangle (via the R*Tree).
+
+    map_no is maps.seq, the R*Tree's map dimension. There is deliberately no
+    p.map_id filter: given one, SQLite drives the query from the (map_id, device_id)
+    index and only probes the tree by id. The tree stores float32 boxes rounded
+    outward, so it is searched by overlap and p.x / p.y decide the edges exactly.
+    """
+    x0, x1, y0, y1 = min(x0, x1), max(x0, x1), min(y0, y1), max(y0, y1)
+    where = ["r.min_m = ?", "r.max_m = ?", "r.max_x >= ?", "r.min_x <= ?", "r.max_y >= ?", "r.min_y <= ?",
+             "p.x BETWEEN ? AND ?", "p.y BETWEEN ? AND ?"]
+    params: List = [map_no, map_no, x0, x1, y0, y1, x0, x1, y0, y1]
+    if floor is not None:
+        where.append("p.floor = ?")
+        params.append(floor)
+    is_admin, allowed = site_ids_for_user(user["email"], user["role"])
+    if not is_admin:
+        if not allowed:
+            return None, None
+        where.append(f"d.site_id IN ({','.join(['?']*len(allowed))})")
+        params += allowed
+    return " AND ".join(where), params
+
+@router.get("/{map_id}/placements")
+def viewport_placements(
+    map_id: str,
+    x0: float = Query(...), y0: float = Query(...),
+    x1: float = Query(...), y1: float = Query(...),
+    scale: float = Query(default=1.0, gt=0, description="screen px per map px at the current zoom"),
+    floor: Optional[int] = None,
+    user = Depends(get_current_user)
+):
+    con = connect()
+    m = con.execute("SELECT seq FROM maps WHERE id=?", (map_id,)).fetchone()
+    where, params = _viewport_where(m[0], x0, y0, x1, y1, floor, user) if m else (None, None)
+    if where is None:
+        return {"mode": "devices", "total": 0, "devices": []}
+    base = f"""
+      FROM map_placements_rtree r
+      JOIN map_placements p ON p.id = r.id
+      JOIN devices d ON d.id = p.device_id
+      WHERE {where}
+    """
+    total = con.execute("SELECT count(*) " + base, params).fetchone()[0]
+
+    if total <= CLUSTER_THRESHOLD:
+        rows = con.execute(f"""
+          SELECT p.device_id, p.x, p.y, p.floor, d.name, d.mac, d.mgmt_ip {base}
+        """, params).fetchall()
+        return {"mode": "devices", "total": total, "devices": [
+            {"device_id": r["device_id"], "x": r["x"], "y": r["y"], "floor": r["floor"],
+             "name": r["name"], "mac": r["mac"], "mgmt_ip": r["mgmt_ip"]} for r in rows
+        ]}
+
+    cell = CLUSTER_CELL_PX / scale
+    rows = con.execute(f"""
+      SELECT CAST(p.x / ? AS INTEGER) AS cx, CAST(p.y / ? AS INTEGER) AS cy,
+             count(*) AS n, avg(p.x) AS x, avg(p.y) AS y, min(p.device_id) AS device_id
+      {base}
+      GROUP BY cx, cy
+    """, [cell, cell, *params]).fetchall()
+    return {"mode": "clusters", "total": total, "cell": cell, "clusters": [
+        {"x": r["x"], "y": r["y"], "count": r["n"],
+         "device_id": r["device_id"] if r["n"] == 1 else None} for r in rows
+    ]}
+
+@router.put("/{map_id}/placements")
+def upsert_placements(map_id: str, body: PlacementsIn, admin = Depends(require_min_role("admin"))):
+    con = connect()
+    if not con.execute("SELECT 1 FROM maps WHERE id=?", (map_id,)).fetchone():
+        raise HTTPException(404, "Map not found")
+    ids = {p.device_id for p in body.placements}
+    unknown = sorted(ids - existing_device_ids(con, ids))
+    if unknown:
+        raise HTTPException(400, f"Unknown device_id(s): {', '.join(map(str, unknown[:20]))}")
+    con.executemany("""
+      INSERT INTO map_placements(map_id, device_id, x, y, floor, updated_ts)
+      VALUES (?,?,?,?,?,strftime('%s','now'))
+      ON CONFLICT(map_id, device_id) DO UPDATE SET
+        x=excluded.x, y=excluded.y, floor=excluded.floor, updated_ts=excluded.updated_ts
+    """, [(map_id, p.device_id, p.x, p.y, p.floor) for p in body.placements])
+    con.commit()
+    publish([f"map:{map_id}"], {"type": "placements.updated", "id": map_id}, key="placements.updated")
+    return {"ok": True, "upserted": len(body.placements)}
+
+@router.delete("/{map_id}/placements/{device_id}")
+def delete_placement(map_id: str, device_id: int, admin = Depends(require_min_role("admin"))):
+    con = connect()
+    n = con.execute("DELETE FROM map_placements WHERE map_id=? AND device_id=?", (map_id, device_id)).rowcount
+    con.commit()
+    if n:
+        publish([f"map:{map_id}"], {"type": "placements.updated", "id": map_id}, key="placements.updated")
+    return {"ok": True, "deleted": n}
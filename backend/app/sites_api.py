@@ -3,12 +3,11 @@ from pydantic import BaseModel
 from typing import Optional, List, Dict, Set
 import re, time
 from .auth import require_min_role, get_current_user
-from .db import connect, migrate_core
+from .db import connect, rebuild_site_summary, site_ids_for_user
+from .events import publish, site_topics
 
 router = APIRouter(prefix="/api/sites", tags=["sites"])
 
-migrate_core()
-
 def slugify(name: str) -> str:
     s = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
     return s or "site"
@@ -49,6 +48,37 @@ def list_sites(user = Depends(get_current_user)):
         """, (user["email"].lower(),)).fetchall()
     return {"sites":[_site_row(dict(r)) for r in rows]}
 
+def _summary(r) -> Dict:
+    return {"devices": r["devices"] or 0, "links": r["links"] or 0,
+            "oldest_seen_ts": r["min_seen_ts"], "newest_seen_ts": r["max_seen_ts"]}
+
+@router.get("/summary")
+def sites_summary(user = Depends(get_current_user)):
+    """Per-site device/link counts and last-seen range from site_summary (one row per site, no scans)."""
+    is_admin, allowed = site_ids_for_user(user["email"], user["role"])
+    con = connect()
+    rows = con.execute("""
+      SELECT s.id, s.name, s.slug, ss.devices, ss.links, ss.min_seen_ts, ss.max_seen_ts
+      FROM sites s LEFT JOIN site_summary ss ON ss.site_id = s.id
+      ORDER BY s.name
+    """).fetchall()
+    allowed = set(allowed)
+    sites = [{"id": r["id"], "name": r["name"], "slug": r["slug"], **_summary(r)}
+             for r in rows if is_admin or r["id"] in allowed]
+    out = {"sites": sites}
+    if is_admin:
+        # unassigned devices are only visible to admins (see devices_api._acl_where)
+        u = con.execute("SELECT devices, links, min_seen_ts, max_seen_ts FROM site_summary WHERE site_id=0").fetchone()
+        out["unassigned"] = _summary(u) if u else {"devices": 0, "links": 0, "oldest_seen_ts": None, "newest_seen_ts": None}
+    return out
+
+@router.post("/summary/rebuild")
+def rebuild_summary(admin = Depends(require_min_role("admin"))):
+    con = connect()
+    rebuild_site_summary(con)
+    con.commit()
+    return {"ok": True}
+
 @router.post("")
 def create_site(body: SiteIn, admin = Depends(require_min_role("admin"))):
     con = connect()
@@ -62,6 +92,7 @@ def create_site(body: SiteIn, admin = Depends(require_min_role("admin"))):
     con.execute("INSERT INTO sites(name, slug) VALUES (?,?)", (body.name, slug))
     con.commit()
     s = con.execute("SELECT id,name,slug,created_ts FROM sites WHERE slug=?", (slug,)).fetchone()
+    publish(["sites"], {"type": "site.created", "id": s["id"]})
     return _site_row(dict(s))
 
 @router.patch("/{site_id}")
@@ -72,6 +103,7 @@ def rename_site(site_id: int, body: SiteIn, admin = Depends(require_min_role("ad
     con.execute("UPDATE sites SET name=? WHERE id=?", (body.name, site_id))
     con.commit()
     s = con.execute("SELECT id,name,slug,created_ts FROM sites WHERE id=?", (site_id,)).fetchone()
+    publish(["sites", f"site:{site_id}"], {"type": "site.renamed", "id": site_id}, key=("site", site_id))
     return _site_row(dict(s))
 
 @router.post("/{site_id}/grant")
@@ -109,8 +141,10 @@ def assign_devices(site_id: int, body: AssignDevicesIn, admin = Depends(require_
     if not body.device_ids:
         return {"updated": 0}
     qmarks = ",".join(["?"]*len(body.device_ids))
+    old = {r[0] for r in con.execute(f"SELECT DISTINCT site_id FROM devices WHERE id IN ({qmarks})", body.device_ids)}
     con.execute(f"UPDATE devices SET site_id=? WHERE id IN ({qmarks})", (site_id, *body.device_ids))
     con.commit()
+    publish(site_topics(site_id, *old), {"type": "devices.assigned", "site_id": site_id}, key="devices.assigned")
     return {"updated": len(body.device_ids)}
 
 # ---------- Auto-assign ----------
@@ -164,4 +198,5 @@ def auto_assign(site_id: int, admin = Depends(require_min_role("admin"))):
         qmarks = ",".join(["?"]*len(to_assign))
         con.execute(f"UPDATE devices SET site_id=? WHERE id IN ({qmarks})", (site_id, *to_assign))
         con.commit()
+        publish(site_topics(site_id, None), {"type": "devices.assigned", "site_id": site_id}, key="devices.assigned")
     return {"updated": len(to_assign)}
@@ -0,0 +1,295 @@
+import asyncio, json, os, threading, time, zlib
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query
+from .auth import get_current_user, require_min_role
+from .db import connect, site_ids_for_user
+from . import aiodb, cluster, metrics
+
+# Topology / inventory history.
+#
+# A snapshot is the set of devices (mac, name, mgmt_ip, vendor, site_id) and
+# links (a_id, b_id). last_seen_ts is left out on purpose: it moves on every
+# collector run and would make every snapshot look changed.
+#
+# Rows in topology_snapshots are zlib-compressed JSON, either
+#   full:  {"d": [[id, mac, name, ip, vendor, site], ...], "l": [[a, b], ...]}
+#   delta: {"d": added/changed devices, "x": removed device ids,
+#           "l": added links, "u": removed links}
+# against the snapshot before it. Every SNAPSHOT_CHECKPOINT_EVERY-th row is a
+# full checkpoint; base_id is the checkpoint a row's chain starts from, so
+# rebuilding any snapshot reads one checkpoint and at most that many deltas.
+# Runs that find nothing changed write no row: the state at time T is the
+# newest snapshot with ts <= T.
+
+SNAPSHOT_INTERVAL_S = int(os.getenv("SNAPSHOT_INTERVAL_S", "3600"))
+CHECKPOINT_EVERY = int(os.getenv("SNAPSHOT_CHECKPOINT_EVERY", "24"))
+RETENTION_DAYS = int(os.getenv("SNAPSHOT_RETENTION_DAYS", "90"))
+ZLIB_LEVEL = 6
+CACHE_STATES = 8
+
+router = APIRouter(prefix="/api/snapshots", tags=["snapshots"])
+
+Device = Tuple[str, Optional[str], Optional[str], Optional[str], Optional[int]]   # mac, name, ip, vendor, site
+
+class State:
+    __slots__ = ("devices", "links")
+
+    def __init__(self, devices: Dict[int, Device] = None, links: Set[Tuple[int, int]] = None):
+        self.devices = devices if devices is not None else {}
+        self.links = links if links is not None else set()
+
+    def copy(self) -> "State":
+        return State(dict(self.devices), set(self.links))
+
+def current_state(con) -> State:
+    s = State()
+    for r in con.execute("SELECT id, mac, name, mgmt_ip, vendor, site_id FROM devices"):
+        s.devices[r[0]] = (r[1], r[2], r[3], r[4], r[5])
+    s.links = {(r[0], r[1]) for r in con.execute("SELECT a_id, b_id FROM device_links")}
+    return s
+
+# ---------- encoding ----------
+def _pack(obj) -> bytes:
+    return zlib.compress(json.dumps(obj, separators=(",", ":")).encode(), ZLIB_LEVEL)
+
+def _unpack(blob: bytes) -> Dict:
+    return json.loads(zlib.decompress(blob))
+
+def _full(s: State) -> Dict:
+    return {"d": [[i, *d] for i, d in sorted(s.devices.items())], "l": sorted(s.links)}
+
+def _delta(old: State, new: State) -> Dict:
+    return {
+        "d": [[i, *d] for i, d in sorted(new.devices.items()) if old.devices.get(i) != d],
+        "x": sorted(old.devices.keys() - new.devices.keys()),
+        "l": sorted(new.links - old.links),
+        "u": sorted(old.links - new.links),
+    }
+
+def _apply(s: State, data: Dict):
+    for row in data.get("d", ()):
+        s.devices[row[0]] = tuple(row[1:])
+    for i in data.get("x", ()):
+        s.devices.pop(i, None)
+    s.links.update(tuple(p) for p in data.get("l", ()))
+    s.links.difference_update(tuple(p) for p in data.get("u", ()))
+
+# ---------- reading ----------
+_cache: "OrderedDict[int, State]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+def state_at(con, snap_id: int) -> State:
+    """Rebuild snapshot snap_id (checkpoint + deltas). Returned states are shared: don't modify."""
+    with _cache_lock:
+        if snap_id in _cache:
+            _cache.move_to_end(snap_id)
+            return _cache[snap_id]
+    row = con.execute("SELECT base_id FROM topology_snapshots WHERE id=?", (snap_id,)).fetchone()
+    if row is None:
+        raise KeyError(snap_id)
+    s = State()
+    for kind, blob in con.execute(
+            "SELECT kind, data FROM topology_snapshots WHERE base_id=? AND id<=? ORDER BY id", (row[0], snap_id)):
+        if kind == "full":
+            s = State()
+        _apply(s, _unpack(blob))
+    with _cache_lock:
+        _cache[snap_id] = s
+        while len(_cache) > CACHE_STATES:
+            _cache.popitem(last=False)
+    return s
+
+# ---------- writing ----------
+def take_snapshot(con, now: Optional[int] = None) -> Optional[Dict]:
+    """Record the current topology if it changed since the last snapshot. Returns the new row's summary."""
+    now = int(now or time.time())
+    t = time.perf_counter()
+    with cluster.file_lock("snapshots"):
+        new = current_state(con)
+        last = con.execute("SELECT id, base_id FROM topology_snapshots ORDER BY id DESC LIMIT 1").fetchone()
+        if last is None:
+            kind, data, changes, base = "full", _full(new), len(new.devices) + len(new.links), None
+        else:
+            delta = _delta(state_at(con, last[0]), new)
+            changes = sum(len(v) for v in delta.values())
+            if not changes:
+                return None
+            since = con.execute("SELECT count(*) FROM topology_snapshots WHERE base_id=?", (last[1],)).fetchone()[0]
+            if since >= CHECKPOINT_EVERY:
+                kind, data, base = "full", _full(new), None
+            else:
+                kind, data, base = "delta", delta, last[1]
+        blob = _pack(data)
+        cur = con.execute("""
+          INSERT INTO topology_snapshots(ts, kind, base_id, devices, links, changes, bytes, data)
+          VALUES (?,?,?,?,?,?,?,?)
+        """, (now, kind, base, len(new.devices), len(new.links), changes, len(blob), blob))
+        snap_id = cur.lastrowid
+        if base is None:
+            con.execute("UPDATE topology_snapshots SET base_id=id WHERE id=?", (snap_id,))
+        con.commit()
+    with _cache_lock:
+        _cache[snap_id] = new
+        while len(_cache) > CACHE_STATES:
+            _cache.popitem(last=False)
+    metrics.inc("topology_snapshots_total", (("kind", kind),))
+    metrics.inc("topology_snapshot_bytes_total", (("kind", kind),), len(blob))
+    metrics.observe("topology_snapshot_seconds", time.perf_counter() - t)
+    return {"id": snap_id, "ts": now, "kind": kind, "devices": len(new.devices), "links": len(new.links),
+            "changes": changes, "bytes": len(blob)}
+
+def prune_snapshots(con, now: Optional[int] = None) -> int:
+    """Drop history older than the retention window, keeping the checkpoint it still depends on."""
+    cutoff = int(now or time.time()) - RETENTION_DAYS * 86400
+    with cluster.file_lock("snapshots"):
+        keep = con.execute("SELECT max(id) FROM topology_snapshots WHERE kind='full' AND ts <= ?", (cutoff,)).fetchone()[0]
+        n = con.execute("DELETE FROM topology_snapshots WHERE id < ?", (keep,)).rowcount if keep else 0
+        con.commit()
+        return n
+
+async def snapshot_loop():
+    while True:
+        try:
+            snap = await aiodb.run(take_snapshot)
+            if snap:
+                print(f"[snapshots] #{snap['id']} {snap['kind']}: {snap['changes']} changes, {snap['bytes']} bytes")
+            n = await aiodb.run(prune_snapshots)
+            if n:
+                print(f"[snapshots] pruned {n} snapshots past retention")
+        except Exception as e:
+            print("[snapshots] snapshot failed:", e)
+        await asyncio.sleep(SNAPSHOT_INTERVAL_S)
+
+# ---------- routes ----------
+_META = "id, ts, kind, base_id, devices, links, changes, bytes"
+
+def _resolve(con, snap_id: Optional[int], ts: Optional[int], what: str):
+    if snap_id is not None:
+        row = con.execute(f"SELECT {_META} FROM topology_snapshots WHERE id=?", (snap_id,)).fetchone()
+    elif ts is not None:
+        row = con.execute(f"SELECT {_META} FROM topology_snapshots WHERE ts<=? ORDER BY id DESC LIMIT 1", (ts,)).fetchone()
+    else:
+        row = con.execute(f"SELECT {_META} FROM topology_snapshots ORDER BY id DESC LIMIT 1").fetchone()
+    if row is None:
+        raise HTTPException(404, f"No {what} snapshot")
+    return dict(row)
+
+def _visible(user, site_id: Optional[int]):
+    """Predicate on a device's site_id for this user and optional site filter."""
+    is_admin, allowed = site_ids_for_user(user["email"], user["role"])
+    if site_id is not None:
+        if not is_admin and site_id not in allowed:
+            raise HTTPException(403, "Forbidden")
+        return lambda s: s == site_id
+    if is_admin:
+        return lambda s: True
+    allowed = set(allowed)
+    return lambda s: s in allowed
+
+def _device(i: int, d: Device) -> Dict:
+    return {"id": i, "mac": d[0], "name": d[1], "mgmt_ip": d[2], "vendor": d[3], "site_id": d[4]}
+
+def _link(a: int, b: int, *states: State) -> Dict:
+    def name(i):
+        for s in states:
+            if i in s.devices:
+                return s.devices[i][1] or s.devices[i][0]
+        return None
+    return {"a_id": a, "b_id": b, "a": name(a), "b": name(b)}
+
+def _link_visible(link, ok, *states: State) -> bool:
+    for i in link:
+        for s in states:
+            if i in s.devices:
+                if ok(s.devices[i][4]):
+                    return True
+                break
+    return False
+
+@router.get("")
+def list_snapshots(
+    limit: int = Query(default=100, ge=1, le=1000),
+    before_id: Optional[int] = None,
+    user = Depends(get_current_user)
+):
+    con = connect()
+    try:
+        rows = con.execute(f"""
+          SELECT {_META} FROM topology_snapshots
+          WHERE (?1 IS NULL OR id < ?1) ORDER BY id DESC LIMIT ?2
+        """, (before_id, limit)).fetchall()
+    finally:
+        con.close()
+    return {"snapshots": [dict(r) for r in rows]}
+
+@router.post("")
+def snapshot_now(admin = Depends(require_min_role("admin"))):
+    con = connect()
+    try:
+        snap = take_snapshot(con)
+    finally:
+        con.close()
+    return {"ok": True, "snapshot": snap, "unchanged": snap is None}
+
+@router.get("/state")
+def snapshot_state(
+    id: Optional[int] = None,
+    at: Optional[int] = Query(default=None, description="Unix time; the newest snapshot taken at or before it"),
+    site_id: Optional[int] = None,
+    user = Depends(get_current_user)
+):
+    ok = _visible(user, site_id)
+    con = connect()
+    try:
+        meta = _resolve(con, id, at, "matching")
+        s = state_at(con, meta["id"])
+    finally:
+        con.close()
+    return {
+        "snapshot": meta,
+        "devices": [_device(i, d) for i, d in sorted(s.devices.items()) if ok(d[4])],
+        "links": [_link(a, b, s) for a, b in sorted(s.links) if _link_visible((a, b), ok, s)],
+    }
+
+@router.get("/diff")
+def snapshot_diff(
+    from_id: Optional[int] = None,
+    since: Optional[int] = Query(default=None, description="Unix time; compare from the snapshot in effect then"),
+    to_id: Optional[int] = None,
+    until: Optional[int] = Query(default=None, description="Unix time; compare to the snapshot in effect then (default: latest)"),
+    site_id: Optional[int] = None,
+    user = Depends(get_current_user)
+):
+    if from_id is None and since is None:
+        raise HTTPException(400, "Give from_id or since")
+    ok = _visible(user, site_id)
+    con = connect()
+    try:
+        a_meta = _resolve(con, from_id, since, "starting")
+        b_meta = _resolve(con, to_id, until, "ending")
+        a, b = state_at(con, a_meta["id"]), state_at(con, b_meta["id"])
+    finally:
+        con.close()
+    added, removed, changed = [], [], []
+    for i, d in sorted(b.devices.items()):
+        old = a.devices.get(i)
+        if old == d or not (ok(d[4]) or (old is not None and ok(old[4]))):
+            continue
+        if old is None:
+            added.append(_device(i, d))
+        else:
+            changed.append({"before": _device(i, old), "after": _device(i, d),
+                            "fields": [f for f, x, y in zip(("mac", "name", "mgmt_ip", "vendor", "site_id"), old, d) if x != y]})
+    for i in sorted(a.devices.keys() - b.devices.keys()):
+        if ok(a.devices[i][4]):
+            removed.append(_device(i, a.devices[i]))
+    return {
+        "from": a_meta,
+        "to": b_meta,
+        "devices": {"added": added, "removed": removed, "changed": changed},
+        "links": {
+            "added": [_link(x, y, b, a) for x, y in sorted(b.links - a.links) if _link_visible((x, y), ok, b, a)],
+            "removed": [_link(x, y, a, b) for x, y in sorted(a.links - b.links) if _link_visible((x, y), ok, a, b)],
+        },
+    }
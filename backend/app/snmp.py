@@ -0,0 +1,504 @@
+import hashlib, hmac, itertools, os, random, socket, struct, time
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from . import metrics
+
+# SNMP v1/v2c and v3 (USM: RFC 3414, AES from RFC 3826, SHA-2 from RFC 7860)
+# GET requests for the subnet scanner and the reachability monitor.
+#
+# A v3 exchange normally starts with an engine-discovery round trip, and each
+# key is derived from its password by hashing 1 MB and then localized to the
+# agent's engine ID. Both are cached per process, so a repeated v3 poll is one
+# round trip plus an HMAC and a cipher pass over a few dozen bytes:
+# - AGENTS: engine ID, boots and time per agent address. Learnt from the first
+#   report, refreshed from every authenticated response, and replaced when the
+#   agent reports unknownEngineID or notInTimeWindow.
+# - localized_key(): one key per (hash, password, engine ID).
+
+OidLike = Union[str, Sequence[int]]
+
+AUTH = {   # protocol -> (hash, HMAC truncation)
+    "md5": ("md5", 12), "sha": ("sha1", 12), "sha224": ("sha224", 16),
+    "sha256": ("sha256", 24), "sha384": ("sha384", 32), "sha512": ("sha512", 48),
+}
+PRIV = ("aes", "des")      # AES-128-CFB (RFC 3826), DES-CBC (RFC 3414)
+MAX_SIZE = 65507
+PORT = 161
+
+REPORTS = {
+    "1.3.6.1.6.3.15.1.1.1.0": "unsupportedSecLevel",
+    "1.3.6.1.6.3.15.1.1.2.0": "notInTimeWindow",
+    "1.3.6.1.6.3.15.1.1.3.0": "unknownUserName",
+    "1.3.6.1.6.3.15.1.1.4.0": "unknownEngineID",
+    "1.3.6.1.6.3.15.1.1.5.0": "wrongDigest",
+    "1.3.6.1.6.3.15.1.1.6.0": "decryptionError",
+}
+_RETRY_REPORTS = ("unknownEngineID", "notInTimeWindow")
+
+class SnmpError(Exception):
+    pass
+
+# ---------- BER ----------
+def _len(n: int) -> bytes:
+    if n < 0x80:
+        return bytes([n])
+    b = n.to_bytes((n.bit_length() + 7) // 8, "big")
+    return bytes([0x80 | len(b)]) + b
+
+def _tlv(tag: int, body: bytes) -> bytes:
+    return bytes([tag]) + _len(len(body)) + body
+
+def _int(n: int) -> bytes:
+    return _tlv(0x02, n.to_bytes(n.bit_length() // 8 + 1, "big", signed=True))
+
+def parse_oid(oid: OidLike) -> List[int]:
+    """'1.3.6.1...' (leading dot allowed) or a sequence of ints -> arcs; SnmpError if it isn't a numeric OID."""
+    try:
+        parts = [int(p) for p in oid.strip(".").split(".")] if isinstance(oid, str) else [int(p) for p in oid]
+    except (TypeError, ValueError):
+        raise SnmpError(f"not a numeric OID: {oid!r}")
+    if len(parts) < 2 or parts[0] > 2 or (parts[0] < 2 and parts[1] >= 40) or min(parts) < 0:
+        raise SnmpError(f"not a valid OID: {oid!r}")
+    return parts
+
+def _oid(oid: OidLike) -> bytes:
+    parts = parse_oid(oid)
+    out = bytearray()
+    for p in [40 * parts[0] + parts[1]] + parts[2:]:
+        enc = [p & 0x7F]
+        p >>= 7
+        while p:
+            enc.append(0x80 | (p & 0x7F))
+            p >>= 7
+        out += bytes(reversed(enc))
+    return _tlv(0x06, bytes(out))
+
+def _read(buf: bytes, pos: int) -> Tuple[int, int, int]:
+    """(tag, value start, value end) of the TLV at pos."""
+    tag, n = buf[pos], buf[pos + 1]
+    pos += 2
+    if n & 0x80:
+        k = n & 0x7F
+        n = int.from_bytes(buf[pos:pos + k], "big")
+        pos += k
+    if pos + n > len(buf):
+        raise ValueError("truncated")
+    return tag, pos, pos + n
+
+def _decode_oid(raw: bytes) -> str:
+    subs, n = [], 0
+    for b in raw:
+        n = (n << 7) | (b & 0x7F)
+        if not b & 0x80:
+            subs.append(n)
+            n = 0
+    first = subs[0] if subs else 0
+    head = [first // 40, first % 40] if first < 80 else [2, first - 80]
+    return ".".join(str(p) for p in head + subs[1:])
+
+_EXCEPTIONS = {0x80: "noSuchObject", 0x81: "noSuchInstance", 0x82: "endOfMibView"}
+
+def _value(tag: int, raw: bytes) -> str:
+    if tag == 0x04:                                         # OCTET STRING
+        try:
+            s = raw.decode("utf-8")
+            if all(c.isprintable() or c in "\r\n\t" for c in s):
+                return s
+        except UnicodeDecodeError:
+            pass
+        return "0x" + raw.hex()
+    if tag == 0x02:                                         # INTEGER
+        return str(int.from_bytes(raw, "big", signed=True))
+    if tag in (0x41, 0x42, 0x43, 0x46):                     # Counter32, Gauge32, TimeTicks, Counter64
+        return str(int.from_bytes(raw, "big"))
+    if tag == 0x40 and len(raw) == 4:                       # IpAddress
+        return socket.inet_ntoa(raw)
+    if tag == 0x06:
+        return _decode_oid(raw)
+    if tag == 0x05:
+        return ""
+    return _EXCEPTIONS.get(tag) or "0x" + raw.hex()
+
+# ---------- credentials and caches ----------
+class Credentials:
+    __slots__ = ("version", "community", "user", "auth_proto", "auth_key", "priv_proto", "priv_key")
+
+    def __init__(self, version: Optional[str] = "2c", community: Optional[str] = None, user: Optional[str] = None,
+                 auth_proto: Optional[str] = None, auth_key: Optional[str] = None,
+                 priv_proto: Optional[str] = None, priv_key: Optional[str] = None):
+        version = (version or "2c").lower().lstrip("v")
+        if version not in ("1", "2c", "3"):
+            raise ValueError(f"Unsupported SNMP version '{version}'")
+        self.version = version
+        self.community = community if community is not None else "public"
+        self.user = user or ""
+        # a key without a protocol means SHA / AES; an explicit "" means none
+        self.auth_proto = (auth_proto if auth_proto is not None else "sha" if auth_key else "").lower() or None
+        self.auth_key = auth_key or None
+        self.priv_proto = (priv_proto if priv_proto is not None else "aes" if priv_key else "").lower() or None
+        self.priv_key = priv_key or None
+        if version != "3":
+            return
+        if not self.user:
+            raise ValueError("SNMPv3 needs a user name")
+        if self.auth_proto and self.auth_proto not in AUTH:
+            raise ValueError(f"Unsupported SNMPv3 auth protocol '{self.auth_proto}' ({', '.join(AUTH)})")
+        if self.priv_proto and self.priv_proto not in PRIV:
+            raise ValueError(f"Unsupported SNMPv3 privacy protocol '{self.priv_proto}' ({', '.join(PRIV)})")
+        if self.priv_proto and not self.auth_proto:
+            raise ValueError("SNMPv3 privacy requires an auth protocol")
+        for proto, key in ((self.auth_proto, self.auth_key), (self.priv_proto, self.priv_key)):
+            if proto and (not key or len(key) < 8):
+                raise ValueError("SNMPv3 passwords must be at least 8 characters")
+
+    @classmethod
+    def from_env(cls, prefix: str) -> "Credentials":
+        def env(name):
+            return os.getenv(prefix + name) or None
+        return cls(env("VERSION"), env("COMMUNITY"), env("USER"),
+                   env("AUTH_PROTO"), env("AUTH_KEY"), env("PRIV_PROTO"), env("PRIV_KEY"))
+
+class Agent:
+    __slots__ = ("engine_id", "boots", "time", "at")
+
+    def __init__(self, engine_id: bytes, boots: int, engine_time: int):
+        self.engine_id = engine_id
+        self.boots = boots
+        self.time = engine_time
+        self.at = time.monotonic()
+
+    def clock(self) -> Tuple[int, int]:
+        return self.boots, self.time + int(time.monotonic() - self.at)
+
+AGENTS: Dict[Tuple[str, int], Agent] = {}
+
+_ids = itertools.count(random.randrange(1, 1 << 30))
+_salts = itertools.count(random.getrandbits(62))
+
+def next_id() -> int:
+    return next(_ids) & 0x7FFFFFFF
+
+@lru_cache(maxsize=64)
+def _master_key(hash_name: str, password: str) -> bytes:
+    # RFC 3414 A.2: hash the password repeated out to 1 MB
+    metrics.inc("snmp_key_derivations_total")
+    pw = password.encode()
+    return hashlib.new(hash_name, (pw * (1048576 // len(pw) + 1))[:1048576]).digest()
+
+@lru_cache(maxsize=4096)
+def localized_key(hash_name: str, password: str, engine_id: bytes) -> bytes:
+    ku = _master_key(hash_name, password)
+    return hashlib.new(hash_name, ku + engine_id + ku).digest()
+
+_crypto = None
+
+def _ciphers():
+    # cryptography is only needed for authPriv; import it on first use
+    global _crypto
+    if _crypto is None:
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+        try:
+            from cryptography.hazmat.decrepit.ciphers.algorithms import TripleDES
+            from cryptography.hazmat.decrepit.ciphers.modes import CFB
+        except ImportError:     # older cryptography releases
+            TripleDES, CFB = algorithms.TripleDES, modes.CFB
+        _crypto = (Cipher, algorithms.AES, TripleDES, CFB, modes.CBC)
+    return _crypto
+
+def _priv_key(creds: Credentials, engine_id: bytes) -> bytes:
+    return localized_key(AUTH[creds.auth_proto][0], creds.priv_key, engine_id)
+
+def _encrypt(creds: Credentials, engine_id: bytes, boots: int, etime: int, data: bytes) -> Tuple[bytes, bytes]:
+    Cipher, AES, DES, CFB, CBC = _ciphers()
+    key = _priv_key(creds, engine_id)
+    if creds.priv_proto == "aes":
+        salt = (next(_salts) & 0xFFFFFFFFFFFFFFFF).to_bytes(8, "big")
+        enc = Cipher(AES(key[:16]), CFB(struct.pack(">II", boots, etime) + salt)).encryptor()
+    else:
+        salt = struct.pack(">II", boots, next(_salts) & 0xFFFFFFFF)
+        # single DES, spelt as 3DES with K1 = K2 = K3
+        enc = Cipher(DES(key[:8] * 3), CBC(bytes(a ^ b for a, b in zip(key[8:16], salt)))).encryptor()
+        data += b"\x00" * (-len(data) % 8)
+    return enc.update(data) + enc.finalize(), salt
+
+def _decrypt(creds: Credentials, engine_id: bytes, boots: int, etime: int, salt: bytes, data: bytes) -> bytes:
+    Cipher, AES, DES, CFB, CBC = _ciphers()
+    key = _priv_key(creds, engine_id)
+    if creds.priv_proto == "aes":
+        dec = Cipher(AES(key[:16]), CFB(struct.pack(">II", boots, etime) + salt)).decryptor()
+    else:
+        if len(data) % 8 or len(salt) != 8:
+            raise SnmpError("decryption failed")
+        dec = Cipher(DES(key[:8] * 3), CBC(bytes(a ^ b for a, b in zip(key[8:16], salt)))).decryptor()
+    return dec.update(data) + dec.finalize()
+
+# ---------- requests ----------
+GET, GETNEXT, GETBULK = 0xA0, 0xA1, 0xA5
+
+def _request_pdu(tag: int, request_id: int, oids: Sequence[OidLike], non_repeaters: int = 0,
+                 max_repetitions: int = 0) -> bytes:
+    # GetBulk reuses error-status / error-index for non-repeaters / max-repetitions
+    varbinds = b"".join(_tlv(0x30, _oid(o) + b"\x05\x00") for o in oids)
+    return _tlv(tag, _int(request_id) + _int(non_repeaters) + _int(max_repetitions) + _tlv(0x30, varbinds))
+
+def _v3_message(msg_id: int, flags: int, engine_id: bytes, boots: int, etime: int, user: bytes,
+                auth_len: int, salt: bytes, scoped: bytes) -> Tuple[bytes, int]:
+    """The message, and the offset of its zeroed authentication parameters."""
+    head = _int(3) + _tlv(0x30, _int(msg_id) + _int(MAX_SIZE) + _tlv(0x04, bytes([flags])) + _int(3))
+    usm_head = _tlv(0x04, engine_id) + _int(boots) + _int(etime) + _tlv(0x04, user)
+    usm = usm_head + _tlv(0x04, b"\x00" * auth_len) + _tlv(0x04, salt)
+    sec = _tlv(0x04, _tlv(0x30, usm))
+    body = head + sec + scoped
+    msg = _tlv(0x30, body)
+    # every TLV in front of the auth parameters is short enough for a fixed-size header
+    off = (len(msg) - len(body)) + len(head) + (len(sec) - len(usm)) + len(usm_head) + 2
+    return msg, off
+
+def encode_get(creds: Credentials, oids: Sequence[OidLike], request_id: int, agent: Optional[Agent] = None,
+               tag: int = GET, max_repetitions: int = 0) -> bytes:
+    """
+    GET (or GETNEXT / GETBULK) request. For v3 the request id doubles as
+    msgID; without a known agent this is the RFC 3414 discovery probe (empty
+    engine ID, no varbinds).
+    """
+    pdu = _request_pdu(tag, request_id, oids, 0, max_repetitions)
+    if creds.version != "3":
+        return _tlv(0x30, _int(0 if creds.version == "1" else 1) + _tlv(0x04, creds.community.encode()) + pdu)
+    if agent is None:
+        scoped = _tlv(0x30, _tlv(0x04, b"") + _tlv(0x04, b"") + _request_pdu(GET, request_id, ()))
+        return _v3_message(request_id, 0x04, b"", 0, 0, b"", 0, b"", scoped)[0]
+    boots, etime = agent.clock()
+    scoped = _tlv(0x30, _tlv(0x04, agent.engine_id) + _tlv(0x04, b"") + pdu)
+    flags, auth_len, salt = 0x04, 0, b""
+    if creds.auth_proto:
+        flags |= 0x01
+        auth_len = AUTH[creds.auth_proto][1]
+    if creds.priv_proto:
+        flags |= 0x02
+        enc, salt = _encrypt(creds, agent.engine_id, boots, etime, scoped)
+        scoped = _tlv(0x04, enc)
+    msg, off = _v3_message(request_id, flags, agent.engine_id, boots, etime, creds.user.encode(),
+                           auth_len, salt, scoped)
+    if auth_len:
+        hash_name = AUTH[creds.auth_proto][0]
+        key = localized_key(hash_name, creds.auth_key, agent.engine_id)
+        msg = msg[:off] + hmac.new(key, msg, hash_name).digest()[:auth_len] + msg[off + auth_len:]
+    return msg
+
+def v2c_template(community: str, oid: OidLike) -> Tuple[bytes, bytes]:
+    """(prefix, suffix) around a fixed-width 4 byte request-id, so building a probe is one concat."""
+    marker = b"\xde\xad\xbe\xef"
+    varbinds = _tlv(0x30, _tlv(0x30, _oid(oid) + b"\x05\x00"))
+    pdu = _tlv(0xA0, _tlv(0x02, marker) + b"\x02\x01\x00" + b"\x02\x01\x00" + varbinds)
+    msg = _tlv(0x30, b"\x02\x01\x01" + _tlv(0x04, community.encode()) + pdu)
+    i = msg.index(marker)
+    return msg[:i], msg[i + 4:]
+
+# ---------- responses ----------
+class Response:
+    __slots__ = ("request_id", "pdu", "error_status", "varbinds", "engine_id", "boots", "time", "authenticated")
+
+    def __init__(self):
+        self.engine_id, self.boots, self.time, self.authenticated = b"", 0, 0, False
+
+    @property
+    def report(self) -> Optional[str]:
+        if self.pdu != 0xA8:
+            return None
+        return REPORTS.get(self.varbinds[0][0], "report") if self.varbinds else "report"
+
+    def values(self) -> Dict[str, str]:
+        return {oid: _value(tag, raw) for oid, tag, raw in self.varbinds}
+
+def response_id(buf: bytes) -> Optional[int]:
+    """request-id (v1/v2c) or msgID (v3) of a response, without decoding the rest."""
+    try:
+        tag, pos, _ = _read(buf, 0)             # Message
+        if tag != 0x30:
+            return None
+        _, s, pos = _read(buf, pos)             # version
+        if buf[s:pos] == b"\x03":
+            _, pos, _ = _read(buf, pos)         # msgGlobalData
+            tag, s, e = _read(buf, pos)         # msgID
+        else:
+            _, _, pos = _read(buf, pos)         # community
+            tag, pos, _ = _read(buf, pos)       # PDU
+            if tag != 0xA2:                     # GetResponse
+                return None
+            tag, s, e = _read(buf, pos)         # request-id
+        return int.from_bytes(buf[s:e], "big", signed=True) if tag == 0x02 else None
+    except (IndexError, ValueError):
+        return None
+
+def _pdu(buf: bytes, pos: int, r: Response):
+    r.pdu, pos, _ = _read(buf, pos)
+    _, s, pos = _read(buf, pos)
+    r.request_id = int.from_bytes(buf[s:pos], "big", signed=True)
+    _, s, pos = _read(buf, pos)
+    r.error_status = int.from_bytes(buf[s:pos], "big")
+    _, _, pos = _read(buf, pos)                 # error-index
+    _, pos, end = _read(buf, pos)               # varbind list
+    r.varbinds = []
+    while pos < end:
+        _, s, pos = _read(buf, pos)
+        _, os_, oe = _read(buf, s)
+        tag, vs, ve = _read(buf, oe)
+        r.varbinds.append((_decode_oid(buf[os_:oe]), tag, buf[vs:ve]))
+
+def decode(buf: bytes, creds: Credentials) -> Response:
+    """Decode a response, verifying and decrypting v3 messages. Raises SnmpError."""
+    r = Response()
+    try:
+        _, pos, _ = _read(buf, 0)
+        _, s, pos = _read(buf, pos)
+        if buf[s:pos] != b"\x03":
+            _, _, pos = _read(buf, pos)         # community
+            _pdu(buf, pos, r)
+            return r
+        _, g, sec = _read(buf, pos)             # msgGlobalData
+        _, s, e = _read(buf, g)
+        msg_id = int.from_bytes(buf[s:e], "big", signed=True)
+        _, _, e = _read(buf, e)                 # msgMaxSize
+        _, s, e = _read(buf, e)
+        flags = buf[s] if e > s else 0
+        _, u, scoped = _read(buf, sec)          # msgSecurityParameters
+        _, p, _ = _read(buf, u)
+        _, s, p = _read(buf, p)
+        r.engine_id = buf[s:p]
+        _, s, p = _read(buf, p)
+        r.boots = int.from_bytes(buf[s:p], "big")
+        _, s, p = _read(buf, p)
+        r.time = int.from_bytes(buf[s:p], "big")
+        _, _, p = _read(buf, p)                 # user name
+        _, a_s, a_e = _read(buf, p)
+        _, s, p = _read(buf, a_e)
+        salt = buf[s:p]
+        if flags & 0x01:
+            if not creds.auth_proto:
+                raise SnmpError("authenticated response to an unauthenticated request")
+            hash_name, auth_len = AUTH[creds.auth_proto]
+            key = localized_key(hash_name, creds.auth_key, r.engine_id)
+            digest = hmac.new(key, buf[:a_s] + b"\x00" * (a_e - a_s) + buf[a_e:], hash_name).digest()[:auth_len]
+            if not hmac.compare_digest(digest, buf[a_s:a_e]):
+                raise SnmpError("authentication failed")
+            r.authenticated = True
+        if flags & 0x02:
+            _, s, e = _read(buf, scoped)
+            buf, scoped = _decrypt(creds, r.engine_id, r.boots, r.time, salt, buf[s:e]), 0
+        _, p, _ = _read(buf, scoped)            # ScopedPDU
+        _, _, p = _read(buf, p)                 # contextEngineID
+        _, _, p = _read(buf, p)                 # contextName
+        _pdu(buf, p, r)
+        r.request_id = msg_id                   # v3 requests are matched by msgID
+    except (IndexError, ValueError) as e:
+        raise SnmpError(f"malformed response: {e}")
+    # only reports (discovery, time sync) may come back below the configured security level
+    if r.pdu != 0xA8:
+        if creds.auth_proto and not flags & 0x01:
+            raise SnmpError("unauthenticated response to an authenticated request")
+        if creds.priv_proto and not flags & 0x02:
+            raise SnmpError("unencrypted response to an encrypted request")
+    return r
+
+def learn(addr: Tuple[str, int], r: Response) -> Optional[str]:
+    """Update the agent cache from a v3 response; returns the report name if it is a report."""
+    report = r.report
+    if report:
+        metrics.inc("snmp_v3_reports_total", (("report", report),))
+    # unauthenticated messages only seed the cache (discovery); they never replace a known agent
+    if r.engine_id and (r.authenticated or report == "unknownEngineID" or (report and addr not in AGENTS)):
+        AGENTS[addr] = Agent(r.engine_id, r.boots, r.time)
+    return report
+
+# ---------- blocking client (scanner, collectors) ----------
+class Session:
+    """
+    Requests to one agent over a connected UDP socket. For v3 the first
+    request also runs discovery (and a time sync if the discovery report had
+    no clock); later requests and sessions reuse the cached agent.
+    """
+
+    def __init__(self, ip: str, creds: Credentials, timeout_s: float = 1.0, port: int = PORT):
+        self.addr = (ip, port)
+        self.creds = creds
+        self.timeout_s = timeout_s
+        self.sock = socket.socket(socket.AF_INET6 if ":" in ip else socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __enter__(self):
+        self.sock.connect(self.addr)
+        return self
+
+    def __exit__(self, *exc):
+        self.sock.close()
+
+    def request(self, tag: int, oids: Sequence[OidLike], max_repetitions: int = 0) -> Response:
+        for _ in range(3):
+            agent = AGENTS.get(self.addr) if self.creds.version == "3" else None
+            rid = next_id()
+            self.sock.send(encode_get(self.creds, oids, rid, agent, tag, max_repetitions))
+            r = self._await(rid)
+            if self.creds.version != "3":
+                return r
+            report = learn(self.addr, r)
+            if report is None and agent is not None:
+                return r
+            if report is not None and report not in _RETRY_REPORTS:
+                raise SnmpError(report)
+        raise SnmpError("agent did not settle on an engine ID / time")
+
+    def _await(self, rid: int) -> Response:
+        deadline = time.monotonic() + self.timeout_s
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise TimeoutError("timeout")
+            self.sock.settimeout(left)
+            try:
+                data = self.sock.recv(MAX_SIZE)
+            except socket.timeout:
+                raise TimeoutError("timeout")
+            except ConnectionRefusedError:
+                raise SnmpError("port unreachable")
+            if response_id(data) != rid:
+                continue                        # late answer to an earlier request
+            return decode(data, self.creds)
+
+    def get(self, oids: Sequence[OidLike]) -> Dict[str, str]:
+        r = self.request(GET, oids)
+        if r.error_status:
+            raise SnmpError(f"error-status {r.error_status}")
+        return r.values()
+
+    def walk(self, root: str, max_repetitions: int = 25, limit: int = 500000) -> List[Tuple[Tuple[int, ...], int, bytes]]:
+        """
+        Every (index suffix, tag, raw value) under root, via GETBULK (GETNEXT
+        for v1). The suffix is the OID part after root, as integers.
+        """
+        prefix = root.strip(".") + "."
+        out: List[Tuple[Tuple[int, ...], int, bytes]] = []
+        cur = root
+        bulk = self.creds.version != "1"
+        while len(out) < limit:
+            r = self.request(GETBULK if bulk else GETNEXT, [cur], max_repetitions if bulk else 0)
+            if r.error_status:
+                if r.error_status == 2 and not bulk:    # v1 noSuchName: walked off the end of the MIB
+                    break
+                raise SnmpError(f"error-status {r.error_status}")
+            done, before = not r.varbinds, cur
+            for oid, tag, raw in r.varbinds:
+                if tag == 0x82 or not oid.startswith(prefix):
+                    done = True
+                    break
+                out.append((tuple(int(p) for p in oid[len(prefix):].split(".")), tag, raw))
+                cur = oid
+            if done or cur == before:           # end of the subtree, or an agent that stopped advancing
+                break
+        return out
+
+def get(ip: str, creds: Credentials, oids: Sequence[OidLike], timeout_s: float = 1.0, port: int = PORT) -> Dict[str, str]:
+    """One GET. Raises TimeoutError or SnmpError."""
+    with Session(ip, creds, timeout_s, port) as s:
+        return s.get(oids)
+
+def as_int(raw: bytes) -> int:
+    return int.from_bytes(raw, "big")
@@ -1,39 +1,53 @@
+import time
 from ipaddress import ip_network
 from typing import List, Dict
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from pysnmp.hlapi import SnmpEngine, CommunityData, UdpTransportTarget, ContextData, ObjectType, ObjectIdentity, getCmd
 from .auth import require_min_role
+from . import metrics, snmp
+from .db import connect
+from .events import publish
 
 router = APIRouter(prefix="/api/snmp", tags=["snmp"])
 
 class ScanIn(BaseModel):
   cidr: str
-  community: str
+  community: str | None = None   # v1/v2c, default "public"
+  version: str | None = "2c"     # 1 | 2c | 3
+  user: str | None = None        # v3 (USM) credentials
+  auth_proto: str | None = None  # md5 | sha | sha224 | sha256 | sha384 | sha512
+  auth_key: str | None = None
+  priv_proto: str | None = None  # aes | des
+  priv_key: str | None = None
+  endpoint_id: str | None = None # use the SNMP credentials stored on this endpoint instead
   timeout_ms: int | None = 500
   max_hosts: int | None = 256  # safety cap
   oids: List[str] | None = None  # optional, defaults to sysName/sysDescr
+  job_id: str | None = None      # optional, progress is published on events topic scan:{job_id}
 
-def _snmp_get(ip: str, community: str, timeout_ms: int, oids: List[str]) -> Dict:
+def _credentials(body: ScanIn) -> snmp.Credentials:
+  if body.endpoint_id:
+    con = connect()
+    r = con.execute("SELECT * FROM endpoints WHERE id=?", (body.endpoint_id,)).fetchone()
+    if not r: raise HTTPException(404, "Endpoint not found")
+    return snmp.Credentials(r["snmp_version"], r["snmp_community"], r["snmp_user"], r["snmp_auth_proto"],
+                            r["snmp_auth_key"], r["snmp_priv_proto"], r["snmp_priv_key"])
+  return snmp.Credentials(body.version, body.community, body.user, body.auth_proto,
+                          body.auth_key, body.priv_proto, body.priv_key)
+
+def _snmp_get(ip: str, creds: snmp.Credentials, timeout_ms: int, oids: List[str]) -> Dict:
+  t = time.perf_counter()
   try:
-    errorIndication, errorStatus, errorIndex, varBinds = next(
-      getCmd(
-        SnmpEngine(),
-        CommunityData(community, mpModel=1),  # v2c
-        UdpTransportTarget((ip, 161), timeout=timeout_ms/1000.0, retries=0),
-        ContextData(),
-        *[ObjectType(ObjectIdentity(oid)) for oid in oids]
-      )
-    )
-    if errorIndication or errorStatus:
-      return {"ok": False, "ip": ip}
-    values = {}
-    for vb in varBinds:
-      oid = str(vb[0]); val = str(vb[1])
-      values[oid] = val
-    return {"ok": True, "ip": ip, "values": values}
-  except Exception:
+    values = snmp.get(ip, creds, oids, timeout_ms/1000.0)
+  except TimeoutError:
+    metrics.inc("snmp_probes_total", (("result", "timeout"),))
     return {"ok": False, "ip": ip}
+  except (snmp.SnmpError, OSError):
+    metrics.inc("snmp_probes_total", (("result", "error"),))
+    return {"ok": False, "ip": ip}
+  metrics.inc("snmp_probes_total", (("result", "ok"),))
+  metrics.observe("snmp_probe_rtt_seconds", time.perf_counter() - t)
+  return {"ok": True, "ip": ip, "values": values}
 
 @router.post("/scan")
 def snmp_scan(body: ScanIn, user = Depends(require_min_role("admin"))):
@@ -41,14 +55,28 @@ def snmp_scan(body: ScanIn, user = Depends(require_min_role("admin"))):
     net = ip_network(body.cidr, strict=False)
   except Exception:
     raise HTTPException(400, "Invalid CIDR")
+  try:
+    creds = _credentials(body)
+  except ValueError as e:
+    raise HTTPException(400, str(e))
   hosts = [str(h) for h in net.hosts()]
   if body.max_hosts and len(hosts) > body.max_hosts:
     hosts = hosts[:body.max_hosts]
   oids = body.oids or ["1.3.6.1.2.1.1.5.0","1.3.6.1.2.1.1.1.0"]  # sysName.0, sysDescr.0
+  for oid in oids:
+    try:
+      snmp.parse_oid(oid)
+    except snmp.SnmpError:
+      raise HTTPException(400, f"Invalid OID {oid!r}: use numeric dotted form, e.g. 1.3.6.1.2.1.1.5.0")
   timeout_ms = body.timeout_ms or 500
+  topic = [f"scan:{body.job_id}"] if body.job_id else []
   results = []
-  for ip in hosts:
-    r = _snmp_get(ip, body.community, timeout_ms, oids)
+  for n, ip in enumerate(hosts, start=1):
+    r = _snmp_get(ip, creds, timeout_ms, oids)
     if r["ok"]:
       results.append(r)
+      publish(topic, {"type": "scan.found", **r})
+    if n % 16 == 0:
+      publish(topic, {"type": "scan.progress", "done": n, "total": len(hosts)}, key="scan.progress")
+  publish(topic, {"type": "scan.done", "count": len(results), "total": len(hosts)}, key="scan.done")
   return {"count": len(results), "results": results}
@@ -0,0 +1,142 @@
+import collections, contextvars, itertools, os, re, sqlite3, time
+from typing import Dict, List, Optional
+from .metrics import record_query
+
+# Opt-in SQL profiler (SQL_PROFILE=1). Every statement run through db.connect()
+# during a request is recorded with its duration and row count; statement shapes
+# (literals and IN-lists folded) that repeat within one request are flagged as
+# likely N+1 loops. Summaries go out in an X-SQL-Profile header and the full
+# profiles are kept in a ring buffer served by debug_api at /debug/profile.
+
+ENABLED = os.getenv("SQL_PROFILE", "0").lower() in ("1", "true", "yes")
+REPEAT_THRESHOLD = int(os.getenv("SQL_PROFILE_REPEAT", "3"))
+KEEP = int(os.getenv("SQL_PROFILE_KEEP", "200"))
+
+_current: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("nf_sql_profile", default=None)
+_ring: collections.deque = collections.deque(maxlen=KEEP)
+_ids = itertools.count(1)
+
+_WS = re.compile(r"\s+")
+_LIT = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_INLIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+def shape(sql: str) -> str:
+    s = _WS.sub(" ", sql).strip()
+    s = _LIT.sub("?", s)
+    return _INLIST.sub("(?,...)", s)
+
+def note_connect():
+    prof = _current.get()
+    if prof is not None:
+        prof["connections"] += 1
+
+def _record(sql: str, seconds: float) -> Optional[Dict]:
+    record_query(seconds)
+    prof = _current.get()
+    if prof is None:
+        return None
+    entry = {"sql": sql, "ms": round(seconds * 1000, 3), "rows": 0}
+    prof["statements"].append(entry)
+    return entry
+
+class _CountingCursor(sqlite3.Cursor):
+    entry: Optional[Dict] = None
+
+    def _count(self, n: int):
+        if self.entry is not None:
+            self.entry["rows"] += n
+
+    def fetchone(self):
+        r = super().fetchone()
+        if r is not None:
+            self._count(1)
+        return r
+
+    def fetchmany(self, size: Optional[int] = None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._count(len(rows))
+        return rows
+
+    def __next__(self):
+        r = super().__next__()
+        self._count(1)
+        return r
+
+class ProfilingConnection(sqlite3.Connection):
+    """Connection factory used by db.connect() when SQL_PROFILE is on."""
+    def _run(self, method: str, sql: str, *args):
+        cur = self.cursor(_CountingCursor)
+        t = time.perf_counter()
+        try:
+            getattr(cur, method)(sql, *args)
+        finally:
+            entry = _record(sql, time.perf_counter() - t)
+        if entry is not None:
+            cur.entry = entry
+            if cur.rowcount > 0:
+                entry["rows"] = cur.rowcount
+        return cur
+
+    def execute(self, sql, params=()):
+        return self._run("execute", sql, params)
+
+    def executemany(self, sql, seq):
+        return self._run("executemany", sql, seq)
+
+    def executescript(self, script):
+        return self._run("executescript", script)
+
+def summarize(prof: Dict) -> Dict:
+    shapes: Dict[str, Dict] = {}
+    for st in prof["statements"]:
+        s = shapes.setdefault(shape(st["sql"]), {"count": 0, "ms": 0.0, "rows": 0})
+        s["count"] += 1
+        s["ms"] += st["ms"]
+        s["rows"] += st["rows"]
+    repeated = [{"shape": k, **v} for k, v in shapes.items() if v["count"] >= REPEAT_THRESHOLD]
+    repeated.sort(key=lambda r: -r["count"])
+    return {
+        "queries": len(prof["statements"]),
+        "ms": round(sum(st["ms"] for st in prof["statements"]), 3),
+        "connections": prof["connections"],
+        "repeated": repeated,
+    }
+
+class SqlProfileMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        prof = {"id": next(_ids), "ts": int(time.time()), "method": scope["method"],
+                "path": scope["path"], "statements": [], "connections": 0}
+        token = _current.set(prof)
+
+        async def _send(msg):
+            if msg["type"] == "http.response.start":
+                s = summarize(prof)
+                hdr = (f"id={prof['id']}; queries={s['queries']}; ms={s['ms']}; "
+                       f"connections={s['connections']}; repeated={len(s['repeated'])}")
+                msg.setdefault("headers", [])
+                msg["headers"] = list(msg["headers"]) + [(b"x-sql-profile", hdr.encode())]
+            await send(msg)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            if route != "/debug/profile":
+                _ring.append({**prof, "route": route, **summarize(prof)})
+
+def recent(limit: int = 50, only_flagged: bool = False) -> List[Dict]:
+    items = list(_ring)[::-1]
+    if only_flagged:
+        items = [p for p in items if p["repeated"] or p["connections"] > 1]
+    return items[:max(0, limit)]
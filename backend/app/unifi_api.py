@@ -1,7 +1,8 @@
-import aiohttp
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
+from .metrics import timer
 
 router = APIRouter(prefix="/unifi", tags=["unifi"])
 
@@ -15,30 +16,48 @@ class UniFiClient:
         self.username = username
         self.password = password
         self.site = site
-        self.session: Optional[aiohttp.ClientSession] = None
+        self.session = None     # aiohttp.ClientSession, created on login
         self.is_logged_in = False
 
     async def login(self):
         if self.session is None:
+            import aiohttp    # heavy import, only needed once a controller is actually contacted
             self.session = aiohttp.ClientSession(cookie_jar=aiohttp.CookieJar())
 
         login_url = f"{self.url}/api/login"
         payload = {"username": self.username, "password": self.password}
 
-        async with self.session.post(login_url, json=payload, ssl=False) as resp:
-            if resp.status != 200:
-                raise HTTPException(status_code=resp.status, detail="Failed to login to UniFi Controller")
-            self.is_logged_in = True
+        with timer("unifi_request_duration_seconds", (("op", "login"),)):
+            async with self.session.post(login_url, json=payload, ssl=False) as resp:
+                if resp.status != 200:
+                    raise HTTPException(status_code=resp.status, detail="Failed to login to UniFi Controller")
+                self.is_logged_in = True
 
-    async def get_devices(self) -> Dict[str, Any]:
+    async def get_devices_raw(self) -> bytes:
         if not self.is_logged_in:
             await self.login()
 
         devices_url = f"{self.url}/api/s/{self.site}/stat/device"
-        async with self.session.get(devices_url, ssl=False) as resp:
-            if resp.status != 200:
-                raise HTTPException(status_code=resp.status, detail="Failed to fetch devices")
-            return await resp.json()
+        with timer("unifi_request_duration_seconds", (("op", "devices"),)):
+            async with self.session.get(devices_url, ssl=False) as resp:
+                if resp.status != 200:
+                    raise HTTPException(status_code=resp.status, detail="Failed to fetch devices")
+                return await resp.read()
+
+    async def get_devices(self) -> Dict[str, Any]:
+        return json.loads(await self.get_devices_raw())
+
+    async def get_clients(self) -> Dict[str, Any]:
+        """Connected clients (stat/sta); wired ones carry sw_mac / sw_port."""
+        if not self.is_logged_in:
+            await self.login()
+
+        clients_url = f"{self.url}/api/s/{self.site}/stat/sta"
+        with timer("unifi_request_duration_seconds", (("op", "clients"),)):
+            async with self.session.get(clients_url, ssl=False) as resp:
+                if resp.status != 200:
+                    raise HTTPException(status_code=resp.status, detail="Failed to fetch clients")
+                return json.loads(await resp.read())
 
     async def logout(self):
         if self.session:
@@ -78,6 +97,7 @@ async def get_unifi_devices(config: UniFiConfig):
     """
     client = UniFiClient(config.url, config.username, config.password, config.site)
     await client.login()
-    devices = await client.get_devices()
+    raw = await client.get_devices_raw()
     await client.logout()
-    return devices
+    # the controller already sent JSON: pass the bytes through instead of decoding and re-encoding
+    return Response(content=raw, media_type="application/json")
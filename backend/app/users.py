@@ -3,8 +3,9 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel, EmailStr
 import sqlite3, time
 from passlib.context import CryptContext
-from .auth import require_min_role, get_current_user
-from .db import connect, _has_col
+from .auth import require_min_role, get_current_user, hash_password
+from .db import connect
+from .fastjson import FastJSONResponse
 
 from pydantic import BaseModel
 from typing import Optional
@@ -26,16 +27,6 @@ router = APIRouter(prefix="/api/users", tags=["users"])
 
 pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# --- DB migration for users.enabled + users.created_ts (idempotent) ---
-def _migrate_users():
-    con = connect()
-    if not _has_col(con, "users", "created_ts"):
-        con.execute("ALTER TABLE users ADD COLUMN created_ts INTEGER NOT NULL DEFAULT (strftime('%s','now'))")
-    if not _has_col(con, "users", "enabled"):
-        con.execute("ALTER TABLE users ADD COLUMN enabled INTEGER NOT NULL DEFAULT 1")
-    con.commit()
-_migrate_users()
-
 # --- Schemas ---
 class UserRow(BaseModel):
     id: int
@@ -84,8 +75,11 @@ def check_user_exists(email: EmailStr, admin=Depends(require_min_role("admin")))
 def list_users(user = Depends(get_current_user)):
     con = connect()
     if user["role"] in ("owner","admin"):
-        rows = con.execute("SELECT id,email,role,enabled,created_ts FROM users ORDER BY email").fetchall()
-        return {"users":[_row(dict(r)) for r in rows]}
+        cur = con.execute("SELECT id,email,role,enabled,created_ts FROM users ORDER BY email")
+        cur.row_factory = None      # plain tuples; sqlite3.Row lookups by name dominate on big lists
+        return FastJSONResponse({"users": [
+            {"id": i, "email": e, "role": role, "enabled": bool(en), "created_ts": ts}
+            for i, e, role, en, ts in cur.fetchall()]})
     r = con.execute("SELECT id,email,role,enabled,created_ts FROM users WHERE lower(email)=?", (user["email"].lower(),)).fetchone()
     if not r: raise HTTPException(404, "Not found")
     return {"users":[_row(dict(r))]}
@@ -132,7 +126,7 @@ def self_change_password(body: SelfChangePassword, me = Depends(get_current_user
     con = connect()
     r = con.execute("SELECT id FROM users WHERE email=?", (me["email"].lower(),)).fetchone()
     if not r: raise HTTPException(404, "Not found")
-    ph = pwd_ctx.hash(body.new_password)
+    ph = hash_password(body.new_password)
     con.execute("UPDATE users SET password_hash=? WHERE id=?", (ph, r["id"]))
     con.commit()
     return {"ok": True}
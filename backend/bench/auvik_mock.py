@@ -0,0 +1,180 @@
+"""
+Local stand-in for the Auvik API, for the "auvik" collector (app/auvik.py).
+
+    cd backend
+    python -m bench.auvik_mock --devices 50000 --tenants 4 --latency-ms 40 --port 8711
+    python -m app.auvik http://127.0.0.1:8711 user key
+
+Serves /v1/tenants, /v1/inventory/device/info and /v1/inventory/interface/info
+as JSON:API with cursor pagination (links.next with page[after]), HTTP basic
+auth, per-request latency, and optional rate limiting: every Nth request is
+answered 429 with Retry-After, and X-RateLimit-Remaining / -Reset headers are
+sent on every response.
+
+The synthetic inventory is deterministic. Every device has two interfaces;
+every tenth device reports no MAC of its own (the collector falls back to
+its lowest interface MAC), and interface 0 of device i is connectedTo
+interface 1 of device i+1 (every fifth one names the device id instead).
+Tests build small inventories by hand with Tenant().
+
+Needs the app requirements (aiohttp).
+"""
+import argparse, asyncio, json, time
+from typing import Dict, List, Optional, Tuple
+
+class Tenant:
+    def __init__(self, tid: str, devices: Optional[List[Dict]] = None, interfaces: Optional[List[Dict]] = None):
+        self.id = tid
+        self.devices: List[Dict] = devices or []
+        self.interfaces: List[Dict] = interfaces or []
+
+def device(did: str, name: str, mac: Optional[str], ip: Optional[str] = None) -> Dict:
+    return {"type": "deviceInfo", "id": did,
+            "attributes": {"deviceName": name, "macAddress": mac, "ipAddresses": [ip] if ip else [],
+                           "vendorName": "Mock"}}
+
+def interface(iid: str, parent: str, mac: Optional[str], connected: Tuple[str, ...] = ()) -> Dict:
+    return {"type": "interfaceInfo", "id": iid,
+            "attributes": {"interfaceName": iid, "macAddress": mac, "connectedTo": list(connected)},
+            "relationships": {"parentDevice": {"data": {"id": parent, "type": "deviceInfo"}}}}
+
+def _mac(k: int, port: int) -> str:
+    return ":".join(f"{b:02x}" for b in (0x02, port, (k >> 24) & 255, (k >> 16) & 255, (k >> 8) & 255, k & 255))
+
+def synthetic(n_devices: int, n_tenants: int = 1) -> List[Tenant]:
+    out = []
+    per = max(1, n_devices // n_tenants)
+    for t in range(n_tenants):
+        ten = Tenant(f"t{t}")
+        for i in range(per):
+            k = t * per + i
+            did = f"t{t}-d{i}"
+            ten.devices.append(device(did, f"auvik-{k:06d}", None if i % 10 == 9 else _mac(k, 0),
+                                      f"10.{(k >> 16) & 255}.{(k >> 8) & 255}.{k & 255}"))
+            nxt = f"t{t}-d{i + 1}"
+            connected = () if i + 1 == per else ((nxt,) if i % 5 == 4 else (f"{nxt}-if1",))
+            ten.interfaces.append(interface(f"{did}-if0", did, _mac(k, 1), connected))
+            ten.interfaces.append(interface(f"{did}-if1", did, _mac(k, 2)))
+        out.append(ten)
+    return out
+
+class AuvikMock:
+    """aiohttp app serving the tenants; start() returns the base URL."""
+    def __init__(self, tenants: List[Tenant], latency_s: float = 0.0, throttle_every: int = 0,
+                 retry_after: str = "1", max_page: int = 1000, rate_limit: int = 1000):
+        self.tenants = {t.id: t for t in tenants}
+        self.latency_s = latency_s
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.max_page = max_page
+        self.rate_limit = rate_limit
+        self.requests = 0
+        self.throttled = 0
+        self.log: List[Tuple[float, int, str]] = []      # (monotonic time, status, path?query)
+        self.base = ""
+        self._runner = None
+
+    def app(self):
+        from aiohttp import web
+
+        @web.middleware
+        async def mw(request, handler):
+            return await self._middleware(request, handler)
+
+        app = web.Application(middlewares=[mw])
+        app.router.add_get("/v1/tenants", self._tenants)
+        app.router.add_get("/v1/inventory/device/info", lambda r: self._listing(r, "devices"))
+        app.router.add_get("/v1/inventory/interface/info", lambda r: self._listing(r, "interfaces"))
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        from aiohttp import web
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self.base = f"http://{host}:{self._runner.addresses[0][1]}"
+        return self.base
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    # ---- handlers ----
+    async def _middleware(self, request, handler):
+        from aiohttp import web
+        self.requests += 1
+        n = self.requests
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        headers = {"X-RateLimit-Limit": str(self.rate_limit),
+                   "X-RateLimit-Remaining": str(max(1, self.rate_limit - n % self.rate_limit)),
+                   "X-RateLimit-Reset": str(int(time.time()) + 60)}
+        if not request.headers.get("Authorization", "").startswith("Basic "):
+            resp = web.json_response({"errors": [{"title": "Unauthorized"}]}, status=401, headers=headers)
+        elif self.throttle_every and n % self.throttle_every == 0:
+            self.throttled += 1
+            resp = web.json_response({"errors": [{"title": "Too Many Requests"}]}, status=429,
+                                     headers={**headers, "Retry-After": self.retry_after})
+        else:
+            resp = await handler(request)
+            resp.headers.update(headers)
+        self.log.append((time.monotonic(), resp.status, request.path_qs))
+        return resp
+
+    async def _tenants(self, request):
+        from aiohttp import web
+        return web.json_response({"data": [{"type": "tenant", "id": t, "attributes": {"tenantType": "client"}}
+                                           for t in self.tenants]})
+
+    async def _listing(self, request, kind: str):
+        from aiohttp import web
+        q = request.query
+        ids = [t for t in (q.get("tenants") or ",".join(self.tenants)).split(",") if t]
+        rows = [r for t in ids if t in self.tenants for r in getattr(self.tenants[t], kind)]
+        size = min(int(q.get("page[first]") or 100), self.max_page)
+        start = int(q.get("page[after]") or 0)
+        page = rows[start:start + size]
+        doc = {"data": page, "links": {}}
+        if start + size < len(rows):
+            nq = {"page[first]": str(size), "page[after]": str(start + size)}
+            if q.get("tenants"):
+                nq["tenants"] = q["tenants"]
+            doc["links"]["next"] = str(request.url.with_query(nq))
+        return web.Response(body=json.dumps(doc, separators=(",", ":")), content_type="application/vnd.api+json")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--devices", type=int, default=10000)
+    ap.add_argument("--tenants", type=int, default=1)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--throttle-every", type=int, default=0, help="answer every Nth request with 429")
+    ap.add_argument("--retry-after", default="1")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8711)
+    args = ap.parse_args(argv)
+
+    async def run():
+        mock = AuvikMock(synthetic(args.devices, args.tenants), args.latency_ms / 1000.0,
+                         args.throttle_every, args.retry_after)
+        print(f"[auvik-mock] {args.devices} devices in {args.tenants} tenant(s) at "
+              f"{await mock.start(args.host, args.port)}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await mock.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Seeded in-process load test for the REST API.
+
+    cd backend
+    python -m bench.run --out bench-results.json                  # measure
+    python -m bench.run --write-baseline bench/baseline.json       # record a baseline
+    python -m bench.run --baseline bench/baseline.json --threshold 0.25
+
+Builds a throwaway database (see bench/seed.py), drives the main endpoints
+through httpx's ASGI transport with concurrent clients and records throughput,
+latency percentiles, CPU time, bytes on the wire and SQLite statements per
+request (from app.metrics).
+With --baseline the run exits non-zero if throughput or p95 latency regress by
+more than --threshold, or if any scenario issues more queries per request.
+
+Needs the app requirements plus httpx and Pillow.
+"""
+import argparse, asyncio, json, os, platform, random, shutil, statistics, sys, tempfile, time
+
+def _pct(sorted_vals, p):
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, max(0, int(round(p / 100 * (len(sorted_vals) - 1)))))
+    return sorted_vals[k]
+
+def _queries_by_route():
+    from app import metrics
+    counters, _ = metrics.snapshot()
+    out = {}
+    for (name, labels), v in counters.items():
+        if name == "sqlite_queries_total":
+            out[dict(labels).get("route")] = v
+    return out
+
+async def _drive(client, make_request, n, concurrency):
+    """Issue n requests from `concurrency` workers; returns (latencies_s, errors, wall_s, wire_bytes)."""
+    lat, errors, nbytes = [], 0, 0
+    todo = iter(range(n))
+
+    async def worker():
+        nonlocal errors, nbytes
+        for i in todo:
+            method, url, kw = make_request(i)
+            t = time.perf_counter()
+            r = await client.request(method, url, **kw)
+            lat.append(time.perf_counter() - t)
+            nbytes += r.num_bytes_downloaded      # as sent, i.e. after content-encoding
+            if r.status_code >= 400:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return lat, errors, time.perf_counter() - t0, nbytes
+
+def scenarios(ds, tokens, rng):
+    admin = {"Authorization": f"Bearer {tokens['owner']}"}
+    restricted = {"Authorization": f"Bearer {tokens['restricted']}"}
+    seeded_site = ds["site_ids"][0]
+    terms = [f"dev-{rng.randrange(ds['devices']):06d}"[:-1] for _ in range(64)]
+    map_id = ds["map_id"]
+    img = f"/api/maps/{map_id}/image"
+    # (name, route template, request count, request factory)
+    return [
+        ("devices_search_admin", "/api/devices", 200,
+         lambda i: ("GET", "/api/devices", {"params": {"q": terms[i % len(terms)]}, "headers": admin})),
+        ("devices_list_restricted", "/api/devices", 100,
+         lambda i: ("GET", "/api/devices", {"headers": restricted})),
+        ("devices_list_admin", "/api/devices", 20,
+         lambda i: ("GET", "/api/devices", {"headers": admin})),
+        ("devices_list_admin_columns", "/api/devices", 20,
+         lambda i: ("GET", "/api/devices", {"params": {"shape": "columns"}, "headers": admin})),
+        ("devices_list_admin_identity", "/api/devices", 20,
+         lambda i: ("GET", "/api/devices", {"headers": {**admin, "Accept-Encoding": "identity"}})),
+        ("users_list", "/api/users", 100,
+         lambda i: ("GET", "/api/users", {"headers": admin})),
+        ("sites_list_admin", "/api/sites", 300,
+         lambda i: ("GET", "/api/sites", {"headers": admin})),
+        ("sites_list_restricted", "/api/sites", 300,
+         lambda i: ("GET", "/api/sites", {"headers": restricted})),
+        ("auto_assign", "/api/sites/{site_id}/auto-assign", 10,
+         lambda i: ("POST", f"/api/sites/{seeded_site}/auto-assign", {"headers": admin})),
+        ("login", "/api/auth/login", 20,
+         lambda i: ("POST", "/api/auth/login", {"json": {"email": ds["restricted_user"], "password": tokens["password"]}})),
+        ("map_image_full", "/api/maps/{map_id}/image", 50,
+         lambda i: ("GET", img, {"headers": admin})),
+        ("map_image_thumb", "/api/maps/{map_id}/image", 300,
+         lambda i: ("GET", img, {"params": {"w": 256}, "headers": admin})),
+        ("map_image_revalidate", "/api/maps/{map_id}/image", 300,
+         lambda i: ("GET", img, {"headers": {**admin, "If-None-Match": tokens["map_etag"]}})),
+    ]
+
+async def run(args):
+    import httpx
+    from app.main import app, bootstrap
+    from app.auth import _issue_jwt
+    from app.db import DB_PATH, MAP_DIR
+    from app import map_tiles
+    from bench.seed import seed, BENCH_PASSWORD
+
+    bootstrap()      # the ASGI transport doesn't run the lifespan (or its background jobs)
+    t = time.perf_counter()
+    ds = seed(DB_PATH, MAP_DIR, args.scale, args.seed)
+    src = os.path.join(MAP_DIR, f"{ds['map_id']}.png")
+    map_tiles.build_variants(src, os.path.join(map_tiles.variants_root(ds["map_id"]), map_tiles.image_version(src)))
+    seed_s = time.perf_counter() - t
+    print(f"[bench] seeded {ds['devices']} devices / {ds['links']} links / {ds['sites']} sites "
+          f"/ {ds['users']} users in {seed_s:.1f}s", file=sys.stderr)
+
+    from app.http_cache import file_etag
+    tokens = {"owner": _issue_jwt(ds["owner"], "owner"),
+              "restricted": _issue_jwt(ds["restricted_user"], "user"),
+              "password": BENCH_PASSWORD,
+              "map_etag": file_etag(os.stat(src))}
+    rng = random.Random(args.seed)
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, route, n, make in scenarios(ds, tokens, rng):
+            if args.only and name not in args.only:
+                continue
+            n = max(1, int(n * args.requests))
+            await _drive(client, make, min(3, n), 1)     # warm-up (and auto-assign's one-off writes)
+            before = _queries_by_route().get(route, 0)
+            cpu = time.process_time()
+            lat, errors, wall, nbytes = await _drive(client, make, n, args.concurrency)
+            cpu = time.process_time() - cpu
+            queries = _queries_by_route().get(route, 0) - before
+            lat.sort()
+            results[name] = {
+                "requests": n, "errors": errors,
+                "rps": round(n / wall, 2),
+                "p50_ms": round(_pct(lat, 50) * 1000, 3),
+                "p95_ms": round(_pct(lat, 95) * 1000, 3),
+                "p99_ms": round(_pct(lat, 99) * 1000, 3),
+                "mean_ms": round(statistics.fmean(lat) * 1000, 3),
+                "queries_per_req": round(queries / n, 2),
+                # client and server share the process, so this includes httpx's side
+                "cpu_ms_per_req": round(cpu / n * 1000, 3),
+                "bytes_per_req": round(nbytes / n),
+            }
+            print(f"[bench] {name:24s} {results[name]}", file=sys.stderr)
+
+    return {
+        "meta": {"scale": args.scale, "seed": args.seed, "concurrency": args.concurrency,
+                 "python": platform.python_version(), "machine": platform.machine(),
+                 "seed_seconds": round(seed_s, 2), "ts": int(time.time())},
+        "scenarios": results,
+    }
+
+def compare(current, baseline, threshold):
+    """Return human-readable regressions of current vs baseline."""
+    bad = []
+    for name, base in baseline.get("scenarios", {}).items():
+        cur = current["scenarios"].get(name)
+        if cur is None:
+            continue
+        if cur["errors"] > base.get("errors", 0):
+            bad.append(f"{name}: errors {base.get('errors', 0)} -> {cur['errors']}")
+        if cur["rps"] < base["rps"] * (1 - threshold):
+            bad.append(f"{name}: throughput {base['rps']} -> {cur['rps']} req/s")
+        if cur["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            bad.append(f"{name}: p95 {base['p95_ms']} -> {cur['p95_ms']} ms")
+        # query counts are deterministic for a given seed: any increase is a regression
+        if cur["queries_per_req"] > base["queries_per_req"] + 0.01:
+            bad.append(f"{name}: queries/request {base['queries_per_req']} -> {cur['queries_per_req']}")
+        if "bytes_per_req" in base and cur["bytes_per_req"] > base["bytes_per_req"] * (1 + threshold):
+            bad.append(f"{name}: bytes/request {base['bytes_per_req']} -> {cur['bytes_per_req']}")
+    return bad
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scale", type=float, default=1.0, help="dataset size multiplier (1.0 = 100k devices)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--requests", type=float, default=1.0, help="request count multiplier per scenario")
+    ap.add_argument("--only", nargs="*", help="run only these scenarios")
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--write-baseline", metavar="PATH", help="write results as the new baseline")
+    ap.add_argument("--baseline", metavar="PATH", help="compare against this baseline")
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed relative regression")
+    ap.add_argument("--keep-db", action="store_true", help="leave the scratch data directory in place")
+    args = ap.parse_args(argv)
+
+    # the app reads EXPORT_DIR at import time, so point it at a scratch dir first
+    data_dir = tempfile.mkdtemp(prefix="nf-bench-")
+    os.environ["EXPORT_DIR"] = data_dir
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        current = asyncio.run(run(args))
+    finally:
+        if args.keep_db:
+            print(f"[bench] data kept in {data_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    text = json.dumps(current, indent=2, sort_keys=True)
+    for path in filter(None, (args.out, args.write_baseline)):
+        with open(path, "w") as f:
+            f.write(text + "\n")
+    if not (args.out or args.write_baseline):
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            bad = compare(current, json.load(f), args.threshold)
+        if bad:
+            print("[bench] REGRESSIONS:\n  " + "\n  ".join(bad), file=sys.stderr)
+            return 1
+        print("[bench] no regressions against baseline", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
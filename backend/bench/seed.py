@@ -0,0 +1,72 @@
+"""
+Deterministic synthetic dataset for the benchmark harness.
+
+At scale 1.0: 500 sites, 100k devices, 200k links, 1k users with 1-5 site
+grants each, plus one map with a large floorplan image. Must run after the
+app schema exists (app.main.bootstrap() creates it).
+"""
+import os, random, sqlite3, time
+
+BENCH_PASSWORD = "bench-password"
+
+def seed(db_path: str, map_dir: str, scale: float = 1.0, rng_seed: int = 1) -> dict:
+    rng = random.Random(rng_seed)
+    n_sites = max(5, int(500 * scale))
+    n_devices = max(100, int(100_000 * scale))
+    n_links = max(200, int(200_000 * scale))
+    n_users = max(10, int(1_000 * scale))
+    now = int(time.time())
+
+    con = sqlite3.connect(db_path)
+    con.executemany("INSERT INTO sites(name, slug) VALUES (?,?)",
+                    [(f"Site {i:04d}", f"site-{i:04d}") for i in range(n_sites)])
+    site_ids = [r[0] for r in con.execute("SELECT id FROM sites ORDER BY id")]
+
+    # ~80% of devices already sit on a site, the rest are left for auto-assign
+    con.executemany(
+        "INSERT INTO devices(name, mac, mgmt_ip, vendor, site_id, last_seen_ts) VALUES (?,?,?,?,?,?)",
+        ((f"dev-{i:06d}",
+          ":".join(f"{b:02x}" for b in (0x02, 0, (i >> 24) & 255, (i >> 16) & 255, (i >> 8) & 255, i & 255)),
+          f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+          rng.choice(("Ubiquiti", "Cisco", "Aruba", "Juniper", None)),
+          rng.choice(site_ids) if rng.random() < 0.8 else None,
+          now - rng.randrange(86400))
+         for i in range(n_devices)))
+    dev_lo, dev_hi = con.execute("SELECT min(id), max(id) FROM devices").fetchone()
+
+    edges = set()
+    while len(edges) < n_links:
+        a, b = rng.randint(dev_lo, dev_hi), rng.randint(dev_lo, dev_hi)
+        if a != b:
+            edges.add((a, b) if a < b else (b, a))
+    con.executemany("INSERT INTO device_links(a_id, b_id, last_seen_ts) VALUES (?,?,?)",
+                    ((a, b, now) for a, b in edges))
+
+    # one real bcrypt hash shared by every user (hashing 1k passwords would dominate seeding)
+    from passlib.context import CryptContext
+    ph = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(BENCH_PASSWORD)
+    con.executemany("INSERT INTO users(email, role, password_hash) VALUES (?,?,?)",
+                    [(f"user{i:04d}@bench.example.com", "user", ph) for i in range(n_users)])
+    con.execute("INSERT INTO users(email, role, password_hash) VALUES (?,?,?)",
+                ("owner@bench.example.com", "owner", ph))
+    user_ids = [r[0] for r in con.execute("SELECT id FROM users WHERE role='user' ORDER BY id")]
+    con.executemany("INSERT OR IGNORE INTO user_site_access(user_id, site_id, can_edit) VALUES (?,?,0)",
+                    ((u, s) for u in user_ids for s in rng.sample(site_ids, rng.randint(1, 5))))
+
+    map_id = "bench" + "0" * 27
+    con.execute("INSERT INTO maps(id, name, created_ts) VALUES (?,?,?)", (map_id, "Bench campus", now))
+    con.commit()
+    con.close()
+
+    from PIL import Image, ImageDraw
+    os.makedirs(map_dir, exist_ok=True)
+    side = max(512, int(8000 * scale ** 0.5))
+    img = Image.new("RGB", (side, side // 2), "white")
+    draw = ImageDraw.Draw(img)
+    for x in range(0, side, 64):
+        draw.line((x, 0, x, side // 2), fill=(200, 200, 220))
+    img.save(os.path.join(map_dir, f"{map_id}.png"))
+
+    return {"sites": n_sites, "devices": n_devices, "links": n_links, "users": n_users,
+            "map_id": map_id, "site_ids": site_ids,
+            "restricted_user": "user0000@bench.example.com", "owner": "owner@bench.example.com"}
@@ -0,0 +1,6 @@
+import os, sys, tempfile
+
+# run from anywhere: `python -m pytest backend/tests` or `cd backend && python -m pytest`
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# app.db reads EXPORT_DIR at import: keep test databases out of /data
+os.environ["EXPORT_DIR"] = tempfile.mkdtemp(prefix="netfusion-tests-")
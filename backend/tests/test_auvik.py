@@ -0,0 +1,92 @@
+"""The Auvik client and inventory (app/auvik.py) against the local mock in bench/auvik_mock.py."""
+import asyncio
+from urllib.parse import parse_qs, urlsplit
+from app.auvik import AuvikClient, fetch_inventory
+from bench.auvik_mock import AuvikMock, Tenant, device, interface, synthetic
+
+def _run(coro):
+    return asyncio.run(coro)
+
+def _query(path_qs: str):
+    return {k: v[0] for k, v in parse_qs(urlsplit(path_qs).query).items()}
+
+def test_cursor_pagination_walks_every_page_of_every_tenant():
+    async def go():
+        async with AuvikMock(synthetic(44, 2)) as mock:
+            async with AuvikClient(mock.base, "user", "key", page_size=10) as client:
+                inv = await fetch_inventory(client)
+            return mock, client, inv
+
+    mock, client, inv = _run(go())
+    assert len(inv.devices) == 44
+    assert len(inv.iface_parent) == 88
+    # /tenants, then per tenant 3 device pages (22 rows) and 5 interface pages (44 rows)
+    assert client.requests == mock.requests == 1 + 2 * (3 + 5)
+    listings = [_query(p) for _, status, p in mock.log if "/inventory/" in p]
+    assert all(status == 200 for _, status, _ in mock.log)
+    assert all(q.get("tenants") in ("t0", "t1") for q in listings)        # the cursor keeps the tenant filter
+    assert sorted(int(q.get("page[after]", 0)) for q in listings if "page[after]" in q) == \
+        sorted([10, 20] * 2 + [10, 20, 30, 40] * 2)
+
+def test_429_is_retried_after_retry_after():
+    async def go():
+        async with AuvikMock(synthetic(30), throttle_every=3, retry_after="1") as mock:
+            async with AuvikClient(mock.base, "user", "key", page_size=10) as client:
+                inv = await fetch_inventory(client, ["t0"])
+            return mock, inv
+
+    mock, inv = _run(go())
+    assert len(inv.devices) == 30 and len(inv.iface_parent) == 60
+    assert mock.throttled >= 2
+    for i, (t, status, path) in enumerate(mock.log):
+        if status != 429:
+            continue
+        retry = next(t2 for t2, s2, p2 in mock.log[i + 1:] if p2 == path)
+        assert retry - t >= 0.9, f"{path} retried {retry - t:.2f}s after a 429 with Retry-After: 1"
+        assert any(p2 == path and s2 == 200 for _, s2, p2 in mock.log[i + 1:])
+
+def test_connected_to_resolves_interfaces_and_devices_to_links():
+    a, c = "02:00:00:00:00:0a", "02:00:00:00:00:0c"
+    b_low, b_high = "02:00:00:00:00:b1", "02:00:00:00:00:b2"
+    tenant = Tenant("t0", devices=[
+        device("A", "a", a), device("B", "b", None), device("C", "c", c), device("D", "d", None),
+    ], interfaces=[
+        interface("A-if0", "A", "02:00:00:00:01:0a", ("B-if1",)),      # interface id -> B (MAC from its interfaces)
+        interface("A-if1", "A", "02:00:00:00:02:0a", ("C",)),          # device id
+        interface("A-if2", "A", None, ("D-if0", "Z-if9")),             # D has no MAC at all, Z is unknown
+        interface("B-if0", "B", b_high),
+        interface("B-if1", "B", b_low),
+        interface("C-if0", "C", None, ("A-if1",)),                     # the same link seen from the other end
+    ])
+
+    async def go():
+        async with AuvikMock([tenant]) as mock:
+            async with AuvikClient(mock.base, "user", "key") as client:
+                return await fetch_inventory(client, ["t0"])
+
+    inv = _run(go())
+    assert inv.mac("B") == b_low                                       # lowest interface MAC
+    assert inv.edges() == {(a, b_low), (a, c)}
+    rows = {r[1]: r for r in inv.device_rows(0)}
+    assert set(rows) == {a, b_low, c}                                  # D is skipped: no MAC anywhere
+    assert rows[a][0] == "a"
+
+def test_collector_syncs_only_the_endpoints_tenants():
+    from app.collectors import collect_auvik
+    from app.db import connect, init_db
+    init_db()
+    ep = {"address": None, "username": "user", "api_key": "key", "password": None,
+          "site": "Main office", "tenants": "t1"}
+
+    async def go():
+        async with AuvikMock(synthetic(20, 2)) as mock:
+            res = await collect_auvik({**ep, "address": mock.base})
+            return mock, res
+
+    mock, res = _run(go())
+    assert not any(p.startswith("/v1/tenants") for _, _, p in mock.log)
+    assert {_query(p)["tenants"] for _, _, p in mock.log} == {"t1"}
+    assert res["devices"] == 10
+    con = connect()
+    names = {r[0] for r in con.execute("SELECT name FROM devices WHERE name LIKE 'auvik-%'")}
+    assert names == {f"auvik-{k:06d}" for k in range(10, 20)}
@@ -1,17 +1,41 @@
 import { useEffect, useState } from "react";
 
-const KINDS = ["unifi","auvik","generic"];
+const KINDS = ["unifi","auvik","snmp","agent","generic"];
 const AUTHS = ["userpass","apikey","token"];
+const SNMP_AUTH = ["sha","sha256","sha512","md5",""];
+const SNMP_PRIV = ["aes","des",""];
+const EMPTY = {
+  name:"", kind:"unifi", address:"", auth_type:"userpass",
+  username:"", password:"", api_key:"", site:"", tenants:"", notes:"",
+  enabled:true, snmp_version:"2c", snmp_community:"",
+  snmp_user:"", snmp_auth_proto:"sha", snmp_auth_key:"", snmp_priv_proto:"aes", snmp_priv_key:""
+};
+
+// SNMPv3 (USM) fields; keys are write-only, so an empty key field on edit keeps the stored one
+function SnmpV3Fields({data, set, editing}){
+  return <>
+    <label>SNMPv3 User<input value={data.snmp_user||""} onChange={e=>set({...data,snmp_user:e.target.value})}/></label>
+    <div />
+    <label>Auth Protocol
+      <select value={data.snmp_auth_proto||""} onChange={e=>set({...data,snmp_auth_proto:e.target.value})}>
+        {SNMP_AUTH.map(a=><option key={a} value={a}>{a||"none"}</option>)}
+      </select>
+    </label>
+    <label>Auth Password<input type="password" value={data.snmp_auth_key||""} placeholder={editing?"unchanged":""} onChange={e=>set({...data,snmp_auth_key:e.target.value})}/></label>
+    <label>Privacy Protocol
+      <select value={data.snmp_priv_proto||""} onChange={e=>set({...data,snmp_priv_proto:e.target.value})}>
+        {SNMP_PRIV.map(a=><option key={a} value={a}>{a||"none"}</option>)}
+      </select>
+    </label>
+    <label>Privacy Password<input type="password" value={data.snmp_priv_key||""} placeholder={editing?"unchanged":""} onChange={e=>set({...data,snmp_priv_key:e.target.value})}/></label>
+  </>;
+}
 
 export default function EndpointsManager(){
   const [items,setItems] = useState([]);
   const [err,setErr] = useState("");
   const [busy,setBusy] = useState(false);
-  const [form,setForm] = useState({
-    name:"", kind:"unifi", address:"", auth_type:"userpass",
-    username:"", password:"", api_key:"", site:"", notes:"",
-    enabled:true, snmp_version:"2c", snmp_community:""
-  });
+  const [form,setForm] = useState(EMPTY);
   const [editId, setEditId] = useState(null);
   const [editData, setEditData] = useState(null);
 
@@ -35,7 +59,9 @@ export default function EndpointsManager(){
         credentials:'include', body: JSON.stringify(form)
       });
       if(!r.ok){ const t = await r.text(); throw new Error(t||'Create failed'); }
-      setForm({name:"",kind:"unifi",address:"",auth_type:"userpass",username:"",password:"",api_key:"",site:"",notes:"",enabled:true,snmp_version:"2c",snmp_community:""});
+      const j = await r.json();
+      if(j.token) prompt('Agent token (shown only once). Agents send it as "Authorization: Bearer <token>" to POST /api/ingest.', j.token);
+      setForm(EMPTY);
       await load();
     }catch(e){ setErr(e.message); } finally{ setBusy(false); }
   }
@@ -62,6 +88,37 @@ export default function EndpointsManager(){
     }catch(e){ alert(e.message); } finally{ setBusy(false); }
   }
 
+  async function runNow(id){
+    setBusy(true);
+    try{
+      const r = await fetch(`/api/endpoints/${id}/run`, { method:'POST', credentials:'include' });
+      if(!r.ok){
+        const j = await r.json().catch(()=>({detail:'Run failed'}));
+        throw new Error(j.detail || 'Run failed');
+      }
+      setTimeout(load, 3000);
+    }catch(e){ alert(e.message); } finally{ setBusy(false); }
+  }
+
+  async function newToken(id){
+    if(!confirm('Issue a new agent token? The current one stops working.')) return;
+    setBusy(true);
+    try{
+      const r = await fetch(`/api/endpoints/${id}/token`, { method:'POST', credentials:'include' });
+      if(!r.ok) throw new Error('Token rotation failed');
+      const j = await r.json();
+      prompt('New agent token (shown only once):', j.token);
+    }catch(e){ alert(e.message); } finally{ setBusy(false); }
+  }
+
+  function lastRun(ep){
+    if(!ep.last_run_ts) return ep.collector ? 'Never' : '—';
+    const when = new Date(ep.last_run_ts*1000).toLocaleString();
+    if(ep.last_error) return `${when}: failed (${ep.last_error})`;
+    const items = Object.entries(ep.last_items||{}).map(([k,v])=>`${v} ${k}`).join(', ');
+    return `${when}: ${items || 'ok'}` + (ep.last_duration_ms!=null ? ` in ${ep.last_duration_ms} ms` : '');
+  }
+
   function startEdit(ep){
     setEditId(ep.id);
     setEditData({...ep});
@@ -70,11 +127,13 @@ export default function EndpointsManager(){
   async function saveEdit(){
     setBusy(true);
     try{
+      const body = {...editData};
+      for (const k of ["snmp_auth_key","snmp_priv_key"]) if (!body[k]) delete body[k];
       const r = await fetch(`/api/endpoints/${editId}`, {
         method:'PATCH', headers:{'Content-Type':'application/json'},
-        credentials:'include', body: JSON.stringify(editData)
+        credentials:'include', body: JSON.stringify(body)
       });
-      if(!r.ok) throw new Error('Update failed');
+      if(!r.ok){ const j = await r.json().catch(()=>({})); throw new Error(j.detail || 'Update failed'); }
       setEditId(null); setEditData(null);
       await load();
     }catch(e){ alert(e.message); } finally{ setBusy(false); }
@@ -90,7 +149,7 @@ export default function EndpointsManager(){
             {KINDS.map(k=><option key={k} value={k}>{k}</option>)}
           </select>
         </label>
-        <label>Address / Base URL<input value={form.address} onChange={e=>setForm({...form,address:e.target.value})} required/></label>
+        <label>Address / Base URL<input value={form.address} onChange={e=>setForm({...form,address:e.target.value})} required={form.kind!=="agent"}/></label>
         <label>Auth Type
           <select value={form.auth_type} onChange={e=>setForm({...form,auth_type:e.target.value})}>
             {AUTHS.map(a=><option key={a} value={a}>{a}</option>)}
@@ -103,13 +162,17 @@ export default function EndpointsManager(){
         </>}
         {form.auth_type!=="userpass" && <>
           <label>API Key / Token<input value={form.api_key} onChange={e=>setForm({...form,api_key:e.target.value})}/></label>
-          <div />
+          {form.kind==="auvik"
+            ? <label>Username (Auvik login)<input value={form.username} onChange={e=>setForm({...form,username:e.target.value})}/></label>
+            : <div />}
         </>}
 
-        <label>SNMP Version<input value={form.snmp_version} onChange={e=>setForm({...form,snmp_version:e.target.value})} placeholder="e.g., 2c"/></label>
+        <label>SNMP Version<input value={form.snmp_version} onChange={e=>setForm({...form,snmp_version:e.target.value})} placeholder="2c or 3"/></label>
         <label>SNMP Community<input value={form.snmp_community} onChange={e=>setForm({...form,snmp_community:e.target.value})} placeholder="public"/></label>
+        {form.snmp_version==="3" && <SnmpV3Fields data={form} set={setForm}/>}
 
         <label>Site (optional)<input value={form.site} onChange={e=>setForm({...form,site:e.target.value})}/></label>
+        {form.kind==="auvik" && <label>Auvik tenant IDs (comma-separated, empty = all)<input value={form.tenants} onChange={e=>setForm({...form,tenants:e.target.value})}/></label>}
         <label>Notes<input value={form.notes} onChange={e=>setForm({...form,notes:e.target.value})}/></label>
         <div style={{gridColumn:'1 / -1'}}>
           {err && <div style={{color:'#e63946',marginBottom:8}}>{err}</div>}
@@ -127,6 +190,7 @@ export default function EndpointsManager(){
                 <th style={{textAlign:'left',borderBottom:'1px solid #e5e7eb',padding:'6px'}}>Address</th>
                 <th style={{textAlign:'left',borderBottom:'1px solid #e5e7eb',padding:'6px'}}>Auth</th>
                 <th style={{textAlign:'left',borderBottom:'1px solid #e5e7eb',padding:'6px'}}>Enabled</th>
+                <th style={{textAlign:'left',borderBottom:'1px solid #e5e7eb',padding:'6px'}}>Last run</th>
                 <th style={{textAlign:'left',borderBottom:'1px solid #e5e7eb',padding:'6px'}}>Actions</th>
               </tr>
             </thead>
@@ -138,8 +202,11 @@ export default function EndpointsManager(){
                   <td style={{borderBottom:'1px solid #f1f5f9',padding:'6px'}}>{ep.address}</td>
                   <td style={{borderBottom:'1px solid #f1f5f9',padding:'6px'}}>{ep.auth_type}</td>
                   <td style={{borderBottom:'1px solid #f1f5f9',padding:'6px'}}>{ep.enabled?'Yes':'No'}</td>
+                  <td style={{borderBottom:'1px solid #f1f5f9',padding:'6px',color: ep.last_error ? '#b91c1c' : undefined}}>{lastRun(ep)}</td>
                   <td style={{borderBottom:'1px solid #f1f5f9',padding:'6px',display:'flex',gap:8,flexWrap:'wrap'}}>
                     <button className="btn" onClick={()=>toggle(ep.id, !ep.enabled)} disabled={busy}>{ep.enabled?'Disable':'Enable'}</button>
+                    {ep.collector && ep.enabled && <button className="btn" onClick={()=>runNow(ep.id)} disabled={busy}>Run now</button>}
+                    {ep.kind==="agent" && <button className="btn" onClick={()=>newToken(ep.id)} disabled={busy}>New token</button>}
                     <button className="btn" onClick={()=>startEdit(ep)} disabled={busy}>Edit</button>
                     <button className="btn" onClick={()=>remove(ep.id)} disabled={busy}>Delete</button>
                   </td>
@@ -172,11 +239,15 @@ export default function EndpointsManager(){
             </>}
             {editData.auth_type!=="userpass" && <>
               <label>API Key / Token<input value={editData.api_key||""} onChange={e=>setEditData({...editData,api_key:e.target.value})}/></label>
-              <div />
+              {editData.kind==="auvik"
+                ? <label>Username (Auvik login)<input value={editData.username||""} onChange={e=>setEditData({...editData,username:e.target.value})}/></label>
+                : <div />}
             </>}
             <label>SNMP Version<input value={editData.snmp_version||""} onChange={e=>setEditData({...editData,snmp_version:e.target.value})}/></label>
             <label>SNMP Community<input value={editData.snmp_community||""} onChange={e=>setEditData({...editData,snmp_community:e.target.value})}/></label>
+            {editData.snmp_version==="3" && <SnmpV3Fields data={editData} set={setEditData} editing/>}
             <label>Site<input value={editData.site||""} onChange={e=>setEditData({...editData,site:e.target.value})}/></label>
+            {editData.kind==="auvik" && <label>Auvik tenant IDs (comma-separated, empty = all)<input value={editData.tenants||""} onChange={e=>setEditData({...editData,tenants:e.target.value})}/></label>}
             <label>Notes<input value={editData.notes||""} onChange={e=>setEditData({...editData,notes:e.target.value})}/></label>
             <div style={{gridColumn:'1 / -1', display:'flex', gap:8}}>
               <button className="btn" onClick={saveEdit} disabled={busy}>Save</button>
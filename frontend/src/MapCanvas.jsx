@@ -1,7 +1,94 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
+import { subscribe } from "./events";
+
+// Renders one level of the server-side tile pyramid. The level is picked so it
+// just covers the viewport, so the first paint only pulls a handful of tiles.
+function TiledMap({ mapId, info }){
+  const boxRef = useRef(null);
+  const [fit, setFit] = useState(null);
+  const [zoom, setZoom] = useState(0);
+  const [marks, setMarks] = useState(null);
+  const [scrollTick, setScrollTick] = useState(0);
+
+  useEffect(()=>{
+    const el = boxRef.current;
+    if(!el) return;
+    const need = Math.max(el.clientWidth / info.width, el.clientHeight / info.height);
+    const lvl = info.max_level + Math.ceil(Math.log2(Math.min(1, need)));
+    setFit(Math.max(0, Math.min(info.max_level, lvl)));
+    setZoom(0);
+  }, [info]);
+
+  const level = fit === null ? null : Math.max(0, Math.min(info.max_level, fit + zoom));
+  let tiles = [], w = 0, h = 0;
+  if(level !== null){
+    const scale = Math.pow(2, level - info.max_level);
+    w = Math.max(1, Math.ceil(info.width * scale));
+    h = Math.max(1, Math.ceil(info.height * scale));
+    const t = info.tile_size;
+    for(let col = 0; col * t < w; col++){
+      for(let row = 0; row * t < h; row++){
+        tiles.push({ key:`${col}_${row}`, left: col*t, top: row*t,
+          src: info.url.replace('{level}', level).replace('{col}', col).replace('{row}', row) });
+      }
+    }
+  }
+
+  // device placements for the visible rectangle only (server clusters when dense)
+  const scaleNow = level === null ? null : Math.pow(2, level - info.max_level);
+  useEffect(()=>{
+    const el = boxRef.current;
+    if(!el || scaleNow === null) return;
+    const ctl = new AbortController();
+    const timer = setTimeout(async ()=>{
+      const offX = Math.max(0, (el.clientWidth - w) / 2);
+      const x0 = Math.max(0, el.scrollLeft - offX) / scaleNow, y0 = el.scrollTop / scaleNow;
+      const x1 = x0 + el.clientWidth / scaleNow, y1 = y0 + el.clientHeight / scaleNow;
+      try{
+        const r = await fetch(`/api/maps/${mapId}/placements?x0=${x0}&y0=${y0}&x1=${x1}&y1=${y1}&scale=${scaleNow}`,
+                              { credentials:'include', signal: ctl.signal });
+        if(r.ok) setMarks(await r.json());
+      }catch{}
+    }, 150);
+    return ()=>{ clearTimeout(timer); ctl.abort(); };
+  }, [mapId, scaleNow, w, scrollTick]);
+
+  // refetch the visible placements when someone else moves devices on this map
+  useEffect(()=> subscribe([`map:${mapId}`], ()=> setScrollTick(t=>t+1)), [mapId]);
+
+  const dots = !marks ? [] : marks.mode === 'clusters'
+    ? marks.clusters.map((c,i)=>({ key:'c'+i, x:c.x, y:c.y, n:c.count }))
+    : marks.devices.map(d=>({ key:'d'+d.device_id, x:d.x, y:d.y, n:1, title:d.name||d.mac }));
+
+  return (
+    <div ref={boxRef} onScroll={()=>setScrollTick(t=>t+1)}
+         style={{position:'relative', width:'100%', height:'100%', overflow:'auto'}}>
+      <div style={{position:'sticky', top:8, left:8, zIndex:1, display:'flex', gap:4, width:'max-content', height:0}}>
+        <button className="btn" onClick={()=>setZoom(z=>z+1)} disabled={level===info.max_level}>+</button>
+        <button className="btn" onClick={()=>setZoom(z=>z-1)} disabled={level===0}>−</button>
+      </div>
+      <div style={{position:'relative', width:w, height:h, margin:'0 auto'}}>
+        {tiles.map(t =>
+          <img key={t.key} src={t.src} alt="" loading="lazy" draggable={false}
+               style={{position:'absolute', left:t.left, top:t.top}}/>
+        )}
+        {scaleNow !== null && dots.map(d =>
+          <div key={d.key} title={d.title || `${d.n} devices`}
+               style={{position:'absolute', left:d.x*scaleNow, top:d.y*scaleNow, transform:'translate(-50%,-50%)',
+                       minWidth: d.n>1 ? 22 : 10, height: d.n>1 ? 22 : 10, borderRadius:11, padding: d.n>1 ? '0 4px' : 0,
+                       background:'#2563eb', color:'#fff', fontSize:11, display:'grid', placeItems:'center',
+                       border:'2px solid #fff', boxSizing:'border-box'}}>
+            {d.n>1 ? d.n : null}
+          </div>
+        )}
+      </div>
+    </div>
+  );
+}
 
 export default function MapCanvas(){
   const [active, setActive] = useState({ id:null, url:null });
+  const [tiles, setTiles] = useState(null);
 
   async function load(){
     try{
@@ -11,6 +98,25 @@ export default function MapCanvas(){
     }catch{ setActive({id:null,url:null}); }
   }
   useEffect(()=>{ load(); },[]);
+  // map created/activated/deleted or a new image finished processing
+  useEffect(()=> subscribe(['maps'], ()=> load()), []);
+
+  useEffect(()=>{
+    setTiles(null);
+    if(!active.id || !active.url) return;
+    let stop = false, timer = null;
+    async function poll(){
+      try{
+        const r = await fetch(`/api/maps/${active.id}/tiles`, { credentials:'include' });
+        const j = await r.json();
+        if(stop) return;
+        if(j.status === 'ready') setTiles(j);
+        else if(j.status === 'pending') timer = setTimeout(poll, 2000);
+      }catch{}
+    }
+    poll();
+    return ()=>{ stop = true; clearTimeout(timer); };
+  }, [active.id, active.url]);
 
   return (
     <div style={{marginTop:16}}>
@@ -18,9 +124,11 @@ export default function MapCanvas(){
         border:'1px solid #e5e7eb', borderRadius:12, overflow:'hidden',
         width:'100%', height:'70vh', background:'#ffffff', display:'grid', placeItems:'center'
       }}>
-        {active.url
-          ? <img src={active.url} alt="Map" style={{maxWidth:'100%',maxHeight:'100%',objectFit:'contain'}}/>
-          : <div style={{color:'#6b7280'}}>No map selected — use the Maps panel to create/select one, or continue with a blank canvas.</div>
+        {tiles
+          ? <TiledMap mapId={active.id} info={tiles}/>
+          : active.url
+            ? <img src={active.url} alt="Map" style={{maxWidth:'100%',maxHeight:'100%',objectFit:'contain'}}/>
+            : <div style={{color:'#6b7280'}}>No map selected — use the Maps panel to create/select one, or continue with a blank canvas.</div>
         }
       </div>
     </div>
@@ -1,4 +1,5 @@
 import { useEffect, useRef, useState } from "react";
+import { subscribe } from "./events";
 
 export default function MapManager(){
   const [list, setList] = useState([]);
@@ -19,6 +20,16 @@ export default function MapManager(){
   }
 
   useEffect(()=>{ load(); },[]);
+  useEffect(()=> subscribe(['maps'], ()=> load()), []);
+
+  // uploads are processed in the background; the poll below is a fallback for
+  // when the event stream is unavailable (e.g. a proxy that buffers it)
+  const processing = list.some(m => m.image_status==='queued' || m.image_status==='processing');
+  useEffect(()=>{
+    if(!processing) return;
+    const t = setTimeout(load, 2000);
+    return ()=>clearTimeout(t);
+  }, [processing, list]);
 
   async function create(){
     if(!name.trim()) return;
@@ -72,6 +83,7 @@ export default function MapManager(){
         <table style={{width:'100%',borderCollapse:'collapse'}}>
           <thead>
             <tr>
+              <th style={{textAlign:'left',borderBottom:'1px solid #e5e7eb',padding:'6px'}}></th>
               <th style={{textAlign:'left',borderBottom:'1px solid #e5e7eb',padding:'6px'}}>Name</th>
               <th style={{textAlign:'left',borderBottom:'1px solid #e5e7eb',padding:'6px'}}>Active</th>
               <th style={{textAlign:'left',borderBottom:'1px solid #e5e7eb',padding:'6px'}}>Actions</th>
@@ -80,7 +92,17 @@ export default function MapManager(){
           <tbody>
             {list.map(m=>(
               <tr key={m.id}>
-                <td style={{borderBottom:'1px solid #f1f5f9',padding:'6px'}}>{m.name}</td>
+                <td style={{borderBottom:'1px solid #f1f5f9',padding:'6px',width:96}}>
+                  {m.thumb_url && <img src={m.thumb_url} alt="" loading="lazy"
+                    style={{width:88,height:56,objectFit:'cover',borderRadius:6,display:'block'}}/>}
+                </td>
+                <td style={{borderBottom:'1px solid #f1f5f9',padding:'6px'}}>
+                  {m.name}
+                  {m.image_status && m.image_status!=='ready' &&
+                    <span style={{marginLeft:8,fontSize:12,color:m.image_status==='failed'?'#e63946':'#6b7280'}}>
+                      {m.image_status==='failed' ? 'upload failed' : 'processing image…'}
+                    </span>}
+                </td>
                 <td style={{borderBottom:'1px solid #f1f5f9',padding:'6px'}}>{active===m.id?'Yes':'No'}</td>
                 <td style={{borderBottom:'1px solid #f1f5f9',padding:'6px',display:'flex',gap:8,flexWrap:'wrap'}}>
                   <button className="btn" onClick={()=>makeActive(m.id)} disabled={busy}>Set active</button>
@@ -31,6 +31,9 @@ export default function MapSwitcher({ onChanged }){
   return (
     <div className="card" style={{marginTop:16, display:'flex', gap:8, alignItems:'center', flexWrap:'wrap'}}>
       <strong>Map:</strong>
+      {(maps.find(m => m.id===active)||{}).thumb_url &&
+        <img src={maps.find(m => m.id===active).thumb_url} alt=""
+             style={{width:48,height:32,objectFit:'cover',borderRadius:4}}/>}
       <select value={active||""} onChange={e=>setActiveMap(e.target.value)} style={{minWidth:220}}>
         <option value="" disabled>Select a map…</option>
         {maps.map(m => <option key={m.id} value={m.id}>{m.name}</option>)}
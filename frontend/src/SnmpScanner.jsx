@@ -3,6 +3,8 @@ import { useState } from "react";
 export default function SnmpScanner(){
   const [cidr,setCidr] = useState("");
   const [community,setCommunity] = useState("public");
+  const [version,setVersion] = useState("2c");
+  const [v3,setV3] = useState({user:"", auth_proto:"sha", auth_key:"", priv_proto:"aes", priv_key:""});
   const [timeout,setTimeoutMs] = useState(500);
   const [res,setRes] = useState(null);
   const [busy,setBusy] = useState(false);
@@ -14,7 +16,7 @@ export default function SnmpScanner(){
       const r = await fetch('/api/snmp/scan', {
         method:'POST', headers:{'Content-Type':'application/json'},
         credentials:'include',
-        body: JSON.stringify({ cidr, community, timeout_ms: Number(timeout)||500 })
+        body: JSON.stringify({ cidr, version, community, ...(version==="3" ? v3 : {}), timeout_ms: Number(timeout)||500 })
       });
       const j = await r.json();
       if(!r.ok) throw new Error(j.detail || 'Scan failed');
@@ -35,9 +37,11 @@ export default function SnmpScanner(){
           method:'POST', headers:{'Content-Type':'application/json'},
           credentials:'include',
           body: JSON.stringify({
-            name, kind:'generic', address:x.ip,
+            name, kind:'snmp', address:x.ip,
             auth_type:'token', api_key:'', // not used for SNMP
-            snmp_version:'2c', snmp_community: community,
+            snmp_version: version, snmp_community: version==="3" ? null : community,
+            ...(version==="3" ? {snmp_user:v3.user, snmp_auth_proto:v3.auth_proto, snmp_auth_key:v3.auth_key,
+                                 snmp_priv_proto:v3.priv_proto, snmp_priv_key:v3.priv_key} : {}),
             enabled: true, notes:'Imported from SNMP scan'
           })
         });
@@ -49,11 +53,32 @@ export default function SnmpScanner(){
 
   return (
     <div className="card" style={{marginTop:16}}>
-      <h3 style={{marginTop:0}}>SNMP Subnet Scan (v2c)</h3>
+      <h3 style={{marginTop:0}}>SNMP Subnet Scan</h3>
       <div style={{display:'grid',gap:8,gridTemplateColumns:'repeat(3, minmax(180px, 1fr))', alignItems:'end'}}>
         <label>CIDR<input placeholder="192.168.1.0/24" value={cidr} onChange={e=>setCidr(e.target.value)}/></label>
-        <label>Community<input value={community} onChange={e=>setCommunity(e.target.value)} /></label>
+        <label>Version
+          <select value={version} onChange={e=>setVersion(e.target.value)}>
+            <option value="2c">v2c</option>
+            <option value="3">v3</option>
+          </select>
+        </label>
         <label>Timeout (ms)<input type="number" min="200" value={timeout} onChange={e=>setTimeoutMs(e.target.value)} /></label>
+        {version!=="3" && <label>Community<input value={community} onChange={e=>setCommunity(e.target.value)} /></label>}
+        {version==="3" && <>
+          <label>User<input value={v3.user} onChange={e=>setV3({...v3,user:e.target.value})} /></label>
+          <label>Auth
+            <select value={v3.auth_proto} onChange={e=>setV3({...v3,auth_proto:e.target.value})}>
+              {["sha","sha256","sha512","md5"].map(a=><option key={a} value={a}>{a}</option>)}
+            </select>
+          </label>
+          <label>Auth password<input type="password" value={v3.auth_key} onChange={e=>setV3({...v3,auth_key:e.target.value})} /></label>
+          <label>Privacy
+            <select value={v3.priv_proto} onChange={e=>setV3({...v3,priv_proto:e.target.value})}>
+              {["aes","des",""].map(a=><option key={a} value={a}>{a||"none"}</option>)}
+            </select>
+          </label>
+          <label>Privacy password<input type="password" value={v3.priv_key} onChange={e=>setV3({...v3,priv_key:e.target.value})} disabled={!v3.priv_proto} /></label>
+        </>}
       </div>
       <div style={{marginTop:8, display:'flex', gap:8}}>
         <button className="btn" onClick={scan} disabled={busy || !cidr.trim()}>{busy?'Scanning…':'Scan'}</button>
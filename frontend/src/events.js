@@ -0,0 +1,19 @@
+// Subscribe to server-sent change notifications (/api/events).
+// onChange(topic, events) is called per coalesced batch; on "resync" (the
+// client fell behind) or after a reconnect it is called with events=null,
+// meaning "refetch everything you show for this topic".
+export function subscribe(topics, onChange) {
+  const es = new EventSource(`/api/events?topics=${encodeURIComponent(topics.join(','))}`,
+                             { withCredentials: true });
+  let opened = false;
+  es.addEventListener('ready', () => {
+    if (opened) topics.forEach(t => onChange(t, null));
+    opened = true;
+  });
+  es.addEventListener('changes', (e) => {
+    const batch = JSON.parse(e.data);
+    onChange(batch.topic, batch.events);
+  });
+  es.addEventListener('resync', () => topics.forEach(t => onChange(t, null)));
+  return () => es.close();
+}